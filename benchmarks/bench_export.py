@@ -0,0 +1,160 @@
+"""
+Export benchmark against the local mock server (no token or network needed).
+
+Times each stage of export_test.py on a synthetic exam:
+
+* ``fetch_report``          getExamReport round trip
+* ``normalize_exam``        parsing the report into the question model
+* ``process_exam_data``     question_data.txt + image downloads into an empty output folder
+* ``process_exam_data_warm`` the same, re-run over the finished folder (incremental path)
+* ``generate_markdown_exam`` / ``generate_tex_exam`` the markdown and tex renderers (renderers.render_exam)
+* ``end_to_end``            export_exam (streaming pipeline) into an empty output folder
+
+Every stage runs ``--repeat`` times; the results (all runs, min, median,
+requests served by the mock) are written as JSON, by default to
+``benchmarks/results/``, so numbers can be compared between versions:
+
+    python benchmarks/bench_export.py --questions 300 --latency-ms 20 --repeat 5
+"""
+import argparse
+import contextlib
+import datetime
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_utestapi import MockServer, add_config_arguments, config_from_args  # noqa: E402
+from ulearning_export import http_client  # noqa: E402
+from ulearning_export.model import normalize_exam  # noqa: E402
+from ulearning_export.renderers import render_exam  # noqa: E402
+
+EXAM_ID = "900001"
+TRACE_ID = "1"
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def point_exporter_at(exporter, base_url, output_dir):
+    """Redirects the exporter's module-level configuration to the mock server and a scratch folder."""
+    exporter.BASE_API_URL = base_url
+    exporter.BASE_OUTPUT_DIR = output_dir
+    exporter.IMAGE_BLOB_STORE_DIR = os.path.join(output_dir, ".blobs")
+    exporter.REPORT_CACHE_DIR = os.path.join(output_dir, ".cache", "reports")
+    exporter.QUESTION_BANK_PATH = os.path.join(output_dir, "question_bank.sqlite3")
+
+
+class StageTimer:
+    def __init__(self, server, verbose=False):
+        self.server = server
+        self.verbose = verbose
+        self.stages = {}
+
+    def run(self, name, func, setup=None):
+        """Times ``func()`` (after an untimed ``setup()``); exporter output is swallowed unless verbose."""
+        if setup is not None: setup()
+        requests_before = self.server.requests_served
+        sink = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with sink:
+            started = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - started
+        stage = self.stages.setdefault(name, {"runs": [], "requests": []})
+        stage["runs"].append(round(seconds, 6))
+        stage["requests"].append(self.server.requests_served - requests_before)
+        return result
+
+    def summary(self):
+        return {name: {"min": min(stage["runs"]), "median": round(statistics.median(stage["runs"]), 6), **stage}
+                for name, stage in self.stages.items()}
+
+
+def run_benchmark(args):
+    exporter = importlib.import_module("export_test")
+    if args.rate_per_host is not None: # 0 disables the per-host token bucket
+        rate = args.rate_per_host or 1e9
+        http_client.DEFAULT_RATE_PER_HOST, http_client.DEFAULT_BURST_PER_HOST = rate, max(rate, 1)
+    server = MockServer(config_from_args(args)).start()
+    scratch = tempfile.mkdtemp(prefix="ulearning_bench_")
+    timer = StageTimer(server, args.verbose)
+    try:
+        for repeat in range(args.repeat):
+            output_dir = os.path.join(scratch, f"run_{repeat}")
+            point_exporter_at(exporter, server.base_url, output_dir)
+            exam_dir = os.path.join(output_dir, "exam")
+            os.makedirs(exam_dir, exist_ok=True)
+
+            report = timer.run("fetch_report", lambda: exporter.get_exam_report(
+                EXAM_ID, TRACE_ID, "bench-token", exporter.API_HEADERS))
+            if not report: raise RuntimeError("Mock server did not return a report")
+            exam = timer.run("normalize_exam", lambda: normalize_exam(report))
+            image_index = timer.run("process_exam_data", lambda: exporter.process_exam_data(exam, exam_dir))
+            timer.run("process_exam_data_warm", lambda: exporter.process_exam_data(exam, exam_dir))
+            timer.run("generate_markdown_exam", lambda: render_exam("markdown", exam, exam_dir, "bench.md", image_index))
+            timer.run("generate_tex_exam", lambda: render_exam("tex", exam, exam_dir, "bench.tex", image_index))
+
+            e2e_dir = os.path.join(scratch, f"e2e_{repeat}")
+            timer.run("end_to_end", lambda: exporter.export_exam(EXAM_ID, TRACE_ID, "bench-token", use_cache=False),
+                      setup=lambda: point_exporter_at(exporter, server.base_url, e2e_dir))
+            if not args.keep: shutil.rmtree(output_dir, ignore_errors=True); shutil.rmtree(e2e_dir, ignore_errors=True)
+    finally:
+        server.stop()
+        if not args.keep: shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": server.config.as_dict(),
+        "repeat": args.repeat,
+        "rate_per_host": http_client.DEFAULT_RATE_PER_HOST,
+        "report_bytes": len(server.report_body),
+        "scratch_dir": scratch if args.keep else None,
+        "stages": timer.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the exam export against a local mock server")
+    add_config_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/bench_<time>.json)")
+    parser.add_argument("--rate-per-host", type=float,
+                        help="Override the HTTP client's requests/second per host (0 = unlimited)")
+    parser.add_argument("--keep", action="store_true", help="Keep the exported folders for inspection")
+    parser.add_argument("--verbose", action="store_true", help="Show the exporter's own log output")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    output = args.output or os.path.join(BENCH_DIR, "results", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(f"{'stage':<24}{'min (s)':>10}{'median (s)':>12}{'requests':>10}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<24}{stage['min']:>10.3f}{stage['median']:>12.3f}{stage['requests'][-1]:>10}")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Startup benchmark for the entry points (no token or network needed).
+
+Loads ``export_test.py`` and ``export-with-gui.py`` in a fresh interpreter
+under ``python -X importtime``: the module code runs, but ``main()`` and
+the Tk window do not. What is summed is the import time the entry point
+itself causes, i.e. every top-level import after the probe's own ``runpy``
+(the interpreter startup, ``site`` and the environment's .pth hooks are
+not counted).
+
+Each entry point has an import-time budget. The benchmark fails (exit
+status 1) when the median over ``--repeat`` runs exceeds it, or when a
+module of the export stack (``requests``, the download engine, the question
+model, ...) is imported at startup, which means a lazy import was lost.
+The results are written as JSON, by default to ``benchmarks/results/``:
+
+    python benchmarks/bench_startup.py --repeat 7
+    python benchmarks/bench_startup.py --cli-budget-ms 40 --gui-budget-ms 60
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+DEFAULT_CLI_BUDGET_MS = 60.0
+DEFAULT_GUI_BUDGET_MS = 60.0
+# Loaded on first export only; any of them in the startup imports is a regression
+DEFERRED_MODULES = ("requests", "urllib3", "bs4", "cProfile", "multiprocessing", "ulearning_export.download",
+                    "ulearning_export.exporter", "ulearning_export.http_client", "ulearning_export.manifest",
+                    "ulearning_export.model", "ulearning_export.pipeline", "ulearning_export.render_pool",
+                    "ulearning_export.imageproc")
+PROBE = "import runpy, sys; sys.argv = [{script!r}]; runpy.run_path({script!r}, run_name='startup_probe')"
+
+
+def parse_importtime(stderr):
+    """``-X importtime`` output -> list of ``(name, depth, self_us, cumulative_us)`` in report order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit(): continue # Header line
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def probe_startup(script):
+    """One fresh interpreter loading ``script``: ``(import ms, top-level imports, every module imported)``."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(script=script)],
+                            cwd=REPO_ROOT, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"{script} failed to load:\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr)
+    probe_start = max(i for i, (name, depth, _, _) in enumerate(rows) if name == "runpy" and depth == 0)
+    script_rows = rows[probe_start + 1:]
+    top_level = [(name, cumulative_us / 1000) for name, depth, _, cumulative_us in script_rows if depth == 0]
+    return sum(ms for _, ms in top_level), top_level, {name for name, _, _, _ in script_rows}
+
+
+def bench_entry_point(script, budget_ms, repeat):
+    runs, deferred_loaded, top_level = [], set(), []
+    for _ in range(repeat):
+        total_ms, top_level, modules = probe_startup(script)
+        runs.append(total_ms)
+        deferred_loaded.update(name if name in DEFERRED_MODULES else name.split(".")[0] for name in modules
+                               if name in DEFERRED_MODULES or name.split(".")[0] in DEFERRED_MODULES)
+    median_ms = statistics.median(runs)
+    return {
+        "script": script,
+        "budget_ms": budget_ms,
+        "runs_ms": [round(ms, 2) for ms in runs],
+        "min_ms": round(min(runs), 2),
+        "median_ms": round(median_ms, 2),
+        "slowest_imports_ms": {name: round(ms, 2) for name, ms in sorted(top_level, key=lambda item: -item[1])[:8]},
+        "deferred_modules_loaded": sorted(deferred_loaded),
+        "ok": median_ms <= budget_ms and not deferred_loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and enforce the import time of the entry points")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cli-budget-ms", type=float, default=DEFAULT_CLI_BUDGET_MS, help="Budget for export_test.py")
+    parser.add_argument("--gui-budget-ms", type=float, default=DEFAULT_GUI_BUDGET_MS, help="Budget for export-with-gui.py")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/startup_<time>.json)")
+    args = parser.parse_args()
+
+    entry_points = [("export_test.py", args.cli_budget_ms)]
+    try:
+        import tkinter  # noqa: F401
+        entry_points.append(("export-with-gui.py", args.gui_budget_ms))
+    except ImportError:
+        print("tkinter is not available, skipping export-with-gui.py")
+    results = [bench_entry_point(script, budget_ms, max(1, args.repeat)) for script, budget_ms in entry_points]
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"startup_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({"python": sys.version.split()[0], "entry_points": results}, f, ensure_ascii=False, indent=2)
+
+    print(f"{'entry point':<22}{'min (ms)':>10}{'median (ms)':>13}{'budget (ms)':>13}  result")
+    for entry in results:
+        print(f"{entry['script']:<22}{entry['min_ms']:>10.1f}{entry['median_ms']:>13.1f}{entry['budget_ms']:>13.1f}"
+              f"  {'ok' if entry['ok'] else 'OVER BUDGET' if not entry['deferred_modules_loaded'] else 'EAGER IMPORTS'}")
+        slowest = ", ".join(f"{name} {ms:.1f}" for name, ms in entry["slowest_imports_ms"].items())
+        print(f"  slowest imports (ms): {slowest}")
+        if entry["deferred_modules_loaded"]:
+            print(f"  loaded at startup but should wait for the first export: {', '.join(entry['deferred_modules_loaded'])}")
+    print(f"Results written to {output}")
+    sys.exit(0 if all(entry["ok"] for entry in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
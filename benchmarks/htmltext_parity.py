@@ -0,0 +1,168 @@
+"""
+Parity check and micro-benchmark for ``ulearning_export.htmltext``.
+
+Compares the single-pass ``html.parser`` converter with the BeautifulSoup
+implementation it replaced (kept below as the reference) on:
+
+* every HTML fragment of a synthetic exam from ``mock_utestapi``;
+* hand-written edge cases (entities, void and unmatched tags, nesting,
+  comments, CDATA, script/style/template, whitespace-only strings, <pre>);
+* randomly generated fragments (``--fuzz`` of them, seeded);
+* optionally, real reports: ``--report`` accepts getExamReport JSON files
+  or the exporter's cached ``.json.gz`` reports.
+
+Every mismatch (clean text, image sources, first-<p> text) is printed and
+the script exits with status 1. The timing section converts the whole
+corpus ``--repeat`` times with both implementations, uncached, and once
+more through the memoized ``parse_fragment``. Timings use the exam fragments
+only (mock exam plus ``--report``), which is what an export parses:
+
+    python benchmarks/htmltext_parity.py --fuzz 5000 --report ulearning_exports/.cache/reports/*.json.gz
+
+Needs ``beautifulsoup4`` for the reference.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from mock_utestapi import MockConfig, build_exam_report  # noqa: E402
+from ulearning_export import htmltext  # noqa: E402
+
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_EDGE_NEWLINES_RE = re.compile(r'^\s*\n|\n\s*$')
+
+EDGE_CASES = [
+    "", " ", "\n", "plain text", "<p></p>", "<p> </p>", "<p>\n</p>", "<p/>", "<br>", "<br/>", "</br>", "<br></br>",
+    "a<br>  </br>b", "<p>a</p>   <p>b</p>", "<p>a</p>\n \n<p>b</p>", "<p>a<p>b</p>c</p>", "<p>unclosed", "</p>stray",
+    "<div><p>x</div>y</p>z", "<p>&amp;&lt;&gt;&quot;&nbsp;&copy;&notanentity;&amp</p>", "&#65;&#x42;&#X43;&#0;&#128;&#150;",
+    "&#x110000;&#xd800;&#12abc;&#xzz;&#;", "<p>a &amp b</p>", "<!-- comment --><p>c</p>", "<p>a<!--x-->b</p>",
+    "<!DOCTYPE html><p>d</p>", "<![CDATA[ raw ]]>after", "<p><![CDATA[  ]]></p>", "<?php echo 1 ?><p>pi</p>",
+    "<script>var x = '<p>';</script>text", "<style>p {}</style><p>s</p>", "<template><p>t</p></template>after",
+    "<ruby>漢<rt>kan</rt><rp>(</rp></ruby>", "<pre>  keep \n  spaces  </pre>", "<textarea>\n\n</textarea>",
+    "<pre>\n</pre>", '<img src="a.png"><img src=" a.png "><img src="b.png">', "<img>", '<img src="">',
+    '<img src="  ">', '<img src>', '<img src="x.png" src="y.png">', '<IMG SRC="upper.png">', '<img src="s.png"/>',
+    '<img src="i.png"></img>', "<p>first</p><p>second</p>", "<div>no p</div>", "<p> <b> bold </b> tail </p>",
+    "<p><script>s</script>visible</p>", "<p>a<br>b</p>", "<p>line1<br/>line2<br />line3</p>",
+    "<table><tr><td>1</td><td>2</td></tr></table>", "<ul><li>a</li><li>b</ul>", "text\r\nwith\rcarriage",
+    "<p>\t\f</p>", "<span>a</span> <span>b</span>", "<p>x</p><p></p><p></p><p>y</p>", "<p>&#13;</p>",
+    "<<>>", "a < b > c", "<p class=\"c\" data-x='1'>attrs</p>", "<P>Upper</P>", "<p>末尾空格　</p>", "　<p>全角</p>",
+]
+
+_TOKENS = ["<p>", "</p>", "<br>", "<br/>", "</br>", "<b>", "</b>", "<div>", "</div>", "<span>", "</span>", "<pre>",
+           "</pre>", "<script>", "</script>", "<template>", "</template>", "<!--c-->", "<![CDATA[cd]]>", "&amp;",
+           "&nbsp;", "&#65;", "&bogus;", " ", "  ", "\n", "\n\n", "\t", "text", "文字", "x_1", "$a$",
+           '<img src="u1.png">', '<img src="u2.png">', '<img src=" u1.png ">', "<img>", "<p/>", "<hr>", "</hr>",
+           "<table>", "<td>", "</td>", "</table>", "<textarea>", "</textarea>", "<rt>", "</rt>", "&#150;", "&#x0;",
+           "<!DOCTYPE x>", "<?pi?>", "<P>", "</P>", "<b", "<p class='a'>", "\u3000", "\r\n", "<"]
+
+
+def reference_parse(html_content):
+    """The BeautifulSoup implementation ``htmltext.parse_fragment`` replaced: (text, image urls, first <p> text)."""
+    if not html_content or not isinstance(html_content, str): return "", [], None
+    soup = BeautifulSoup(html_content, 'html.parser')
+    first_p = soup.find('p')
+    first_p_text = first_p.get_text(strip=True) if first_p else None
+    urls = []
+    for img in soup.find_all('img'):
+        src = img.get('src')
+        if src and src.strip() and src.strip() not in urls: urls.append(src.strip())
+    for p_tag in soup.find_all("p"): p_tag.append("\n")
+    for br_tag in soup.find_all("br"): br_tag.replace_with("\n")
+    text = soup.get_text(separator='', strip=False)
+    text = _BLANK_LINES_RE.sub('\n\n', text)
+    text = _EDGE_NEWLINES_RE.sub('', text)
+    return text.strip(), urls, first_p_text
+
+
+def fast_parse(html_content):
+    if not html_content or not isinstance(html_content, str): return "", [], None
+    fragment = htmltext.convert_fragment(html_content)
+    return fragment.text, list(fragment.image_urls), fragment.first_p_text
+
+
+def report_fragments(report):
+    """Every HTML string in a getExamReport payload (stems, options, answers, replays, student answers)."""
+    fragments = []
+    for part in (report.get('result') or {}).get('part', []) or []:
+        for question in part.get('children', []) or []:
+            fragments.append(question.get('title', ''))
+            fragments.extend(item.get('title', '') for item in question.get('item', []) or [])
+            answer_info = question.get('correctAnswerAndReplay') or {}
+            fragments.extend(answer_info.get('correctAnswer', []) or [])
+            fragments.append(answer_info.get('correctReplay', ''))
+            fragments.append((question.get('studentAnswer') or {}).get('answer', ''))
+    return [f for f in fragments if isinstance(f, str)]
+
+
+def load_report(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get("report", data) # Cache files wrap the report with its fetch time
+
+
+def fuzz_fragments(count, seed):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(_TOKENS) for _ in range(rng.randint(1, 25))) for _ in range(count)]
+
+
+def check_parity(corpus, max_shown):
+    mismatches = 0
+    for html_content in corpus:
+        expected, actual = reference_parse(html_content), fast_parse(html_content)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= max_shown:
+                print(f"MISMATCH for {html_content!r}\n  reference: {expected!r}\n  fast:      {actual!r}")
+    return mismatches
+
+
+def time_corpus(func, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for html_content in corpus: func(html_content)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check htmltext against the BeautifulSoup reference and time both")
+    parser.add_argument("--questions", type=int, default=300, help="Questions in the synthetic mock exam")
+    parser.add_argument("--fuzz", type=int, default=2000, help="Number of random fragments")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", nargs="*", default=[], help="getExamReport JSON or cached .json.gz files")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--show", type=int, default=20, help="Mismatches to print")
+    args = parser.parse_args()
+
+    exam_corpus = report_fragments(build_exam_report(MockConfig(questions=args.questions, seed=args.seed), "http://mock"))
+    for path in args.report: exam_corpus.extend(report_fragments(load_report(path)))
+    corpus = exam_corpus + EDGE_CASES + fuzz_fragments(args.fuzz, args.seed)
+
+    mismatches = check_parity(corpus, args.show)
+    print(f"{len(corpus)} fragments checked, {mismatches} mismatches")
+
+    reference_s = time_corpus(reference_parse, exam_corpus, args.repeat)
+    fast_s = time_corpus(fast_parse, exam_corpus, args.repeat)
+    cached_s = time_corpus(htmltext.parse_fragment, exam_corpus, args.repeat) # First pass fills the cache
+    print(f"Timing {len(exam_corpus)} exam fragments (best of {args.repeat}):")
+    print(f"BeautifulSoup reference: {reference_s:.3f}s")
+    print(f"html.parser converter:   {fast_s:.3f}s ({reference_s / fast_s:.1f}x)")
+    print(f"memoized, warm cache:   {cached_s:.3f}s ({reference_s / cached_s:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
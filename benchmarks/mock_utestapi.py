@@ -0,0 +1,165 @@
+"""
+Local stand-in for utestapi.ulearning.cn used by the benchmarks.
+
+Serves a synthetic ``/exams/user/study/getExamReport`` payload and the images
+it references. The shape of the exam (parts, questions, options, images per
+question, image size), the latency added to every request and the share of
+requests answered with a transient error (429/503) are configurable. The
+payload is deterministic for a given seed.
+
+Run standalone to point the export scripts at it:
+
+    python benchmarks/mock_utestapi.py --port 8000 --questions 200 --latency-ms 30
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class MockConfig:
+    __slots__ = ("parts", "questions", "options", "images_per_question", "image_bytes", "latency_ms",
+                 "error_rate", "seed")
+
+    def __init__(self, parts=2, questions=100, options=4, images_per_question=2, image_bytes=20000,
+                 latency_ms=0, error_rate=0.0, seed=0):
+        self.parts = max(1, parts)
+        self.questions = questions
+        self.options = options
+        self.images_per_question = images_per_question
+        self.image_bytes = image_bytes
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.seed = seed
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def build_exam_report(config, base_url):
+    """Synthetic getExamReport JSON: alternating choice and free-text questions with inline images."""
+    rng = random.Random(config.seed)
+    letters = "ABCDEFGHIJ"[:config.options]
+    questions = []
+    for q in range(1, config.questions + 1):
+        images = [f'<img src="{base_url}/img/q{q}_{k}.png">' for k in range(config.images_per_question)]
+        stem_images, answer_images = images[:len(images) - len(images) // 2], images[len(images) - len(images) // 2:]
+        words = " ".join(rng.choice(("向量", "矩阵", "x_1", "50%", "$a$", "{b}", "#c", "~d", "e^2", "f&g")) for _ in range(30))
+        choice = q % 2 == 1
+        question = {
+            "orderIndex": q, "questionid": 500000 + q, "type": 1 if choice else 5,
+            "title": f"<p>第 {q} 题: {words}</p><p>{''.join(stem_images)}</p>",
+            "correctAnswerAndReplay": {
+                "correctAnswer": ["A"] if choice else [f"<p>参考答案 {q}</p>{''.join(answer_images)}"],
+                "correctReplay": f"<p>解析: {words}</p>" if q % 3 == 0 else "",
+            },
+            "studentAnswer": {"answer": "A" if choice else "<p>作答</p>", "grade": rng.choice((0, 1.0, 2.5))},
+        }
+        if choice:
+            question["item"] = [{"orderIndex": i + 1, "title": f"<p>{letter}</p><p>选项 {letter} {words[:40]}</p>"
+                                 + (''.join(answer_images) if i == 0 else "")} for i, letter in enumerate(letters)]
+        questions.append(question)
+    per_part = -(-len(questions) // config.parts)
+    parts = [{"partname": f"第 {i + 1} 部分", "children": questions[i * per_part:(i + 1) * per_part]}
+             for i in range(config.parts)]
+    return {"code": 1, "result": {"examTitle": f"Benchmark Exam {config.questions}q", "part": parts}}
+
+
+def image_body(path, size):
+    payload = PNG_SIGNATURE + path.encode()
+    return (payload * (size // len(payload) + 1))[:max(size, len(payload))]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real server
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        config = server.config
+        if config.latency_ms: time.sleep(config.latency_ms / 1000.0)
+        if config.error_rate and server.rng_random() < config.error_rate:
+            status = 429 if server.rng_random() < 0.5 else 503
+            self._send(status, b"", headers={"Retry-After": "0"}); return
+        if self.path.startswith("/exams/user/study/getExamReport"):
+            self._send(200, server.report_body)
+        elif self.path.startswith("/users/login/refresh10Session"):
+            self._send(200, b"{}")
+        elif self.path.startswith("/img/"):
+            self._send(200, image_body(self.path, config.image_bytes), "image/png", {"ETag": f'"{hash(self.path) & 0xffffffff:x}"'})
+        else:
+            self._send(404, b"")
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config, port=0):
+        super().__init__(("127.0.0.1", port), MockHandler)
+        self.config = config
+        self.base_url = f"http://127.0.0.1:{self.server_port}"
+        self.report_body = json.dumps(build_exam_report(config, self.base_url), ensure_ascii=False).encode('utf-8')
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(config.seed)
+
+    def count_request(self):
+        with self._lock: self.requests_served += 1
+
+    def rng_random(self):
+        with self._lock: return self._rng.random()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown(); self.server_close()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--parts", type=int, default=2)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--images-per-question", type=int, default=2)
+    parser.add_argument("--image-bytes", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args):
+    return MockConfig(args.parts, args.questions, args.options, args.images_per_question, args.image_bytes,
+                      args.latency_ms, args.error_rate, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the utestapi endpoints used by the exporter")
+    parser.add_argument("--port", type=int, default=8000)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = MockServer(config_from_args(args), args.port)
+    print(f"Mock utestapi listening on {server.base_url} (set BASE_API_URL to this URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
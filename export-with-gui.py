@@ -1,15 +1,19 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
-import threading
-import queue 
 
-import requests
-import json
 import os
-import re
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
-import datetime 
+import threading
+# The window comes up before the export stack is loaded: requests, the download engine and manifest and the
+# question model are imported inside the functions that use them, on first export (benchmarks/bench_startup.py).
+from ulearning_export.batch import (DEFAULT_PARALLEL_EXAMS, JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_FINISHED, ExamJob,
+                                    JobManager)
+from ulearning_export.blobstore import BlobStore
+from ulearning_export.metrics import PROFILE_FILENAME, ExportMetrics, profiled
+from ulearning_export.progress import ExportProgress, LogSink, ProgressSnapshot, prefix_lines
+from ulearning_export.renderers import (DEFAULT_FORMATS, IMAGES_FORMAT, RENDERERS, render_exam, resolve_renderers,
+                                        split_renderers)
+from ulearning_export.selection import ExportSelection, parse_number_list, parse_ranges
+from ulearning_export.report_cache import ReportCache
 '''
 确认正确寻找下面的参数
 '''
@@ -41,425 +45,139 @@ IMAGE_DOWNLOAD_HEADERS = {
     "User-Agent": API_HEADERS["user-agent"] 
 }
 
-# --- Helper Functions ---
-def sanitize_filename(filename):
-    if filename is None: filename = "untitled"
-    filename = str(filename)
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-    filename = re.sub(r'\s+', '_', filename)
-    filename = re.sub(r'_+', '_', filename)
-    filename = filename.strip('_')
-    return filename[:100]
-
-def get_clean_text_from_html(html_content):
-    if not html_content or not isinstance(html_content, str): return ""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    for p_tag in soup.find_all("p"): p_tag.append("\n")
-    for br_tag in soup.find_all("br"): br_tag.replace_with("\n")
-    text = soup.get_text(separator='', strip=False)
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    text = re.sub(r'^\s*\n|\n\s*$', '', text)
-    return text.strip()
-
-def escape_latex_special_chars(text):
-    if not text: return ""
-    text = text.replace('\\', r'\textbackslash{}')
-    text = text.replace('{', r'\{'); text = text.replace('}', r'\}')
-    text = text.replace('&', r'\&'); text = text.replace('%', r'\%')
-    text = text.replace('$', r'\$'); text = text.replace('#', r'\#')
-    text = text.replace('_', r'\_'); text = text.replace('^', r'\^{}')
-    text = text.replace('~', r'\textasciitilde{}')
-    return text
-
-def extract_image_urls_from_html(html_content):
-    if not html_content or not isinstance(html_content, str): return []
-    soup = BeautifulSoup(html_content, 'html.parser')
-    img_tags = soup.find_all('img')
-    urls = [img['src'].strip() for img in img_tags if 'src' in img.attrs and img['src'] and img['src'].strip()]
-    return list(set(urls))
-
-
-def download_image(url, save_path, headers, gui_log_message_func):
-    try:
-        gui_log_message_func(f"  Downloading image: {url} to: {save_path}\n")
-        response = requests.get(url, headers=headers, stream=True, timeout=20)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192): f.write(chunk)
-        gui_log_message_func(f"  Successfully downloaded {os.path.basename(save_path)}.\n")
-        return True
-    except requests.exceptions.Timeout:
-        gui_log_message_func(f"  Timeout downloading: {url}\n")
-    except requests.exceptions.HTTPError as e:
-        gui_log_message_func(f"  HTTP error {e.response.status_code} for {url}: {e}\n")
-    except requests.exceptions.RequestException as e:
-        gui_log_message_func(f"  Error downloading {url}: {e}\n")
-    return False
-
-def get_question_type_name(type_code):
-    type_map = {1: "单选题", 2: "多选题", 3: "不定项选择题", 4: "判断题", 5: "填空题/简答题"}
-    return type_map.get(type_code, f"未知题型 ({type_code})")
-
-
-def refresh_session(ua_token, trace_id, current_headers, gui_log_message_func):
-    refresh_url = f"{BASE_API_URL}/users/login/refresh10Session?uaToken={ua_token}&traceId={trace_id}"
-    gui_log_message_func(f"Attempting to refresh session for traceId: {trace_id}...\n")
-    headers = current_headers.copy(); headers["authorization"] = ua_token
-    try:
-        response = requests.get(refresh_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        gui_log_message_func("Session refresh request successful.\n")
-        return ua_token
-    except requests.exceptions.RequestException as e:
-        gui_log_message_func(f"Error refreshing session: {e}\nProceeding with the current token.\n")
-        return ua_token
-
+# Image download pool: worker threads in total / parallel connections per host
+IMAGE_DOWNLOAD_WORKERS = 8
+IMAGE_DOWNLOAD_PER_HOST = 4
+# Content-addressed image store shared by all exams (question folders get hardlinks into it)
+IMAGE_BLOB_STORE_DIR = os.path.join(BASE_OUTPUT_DIR, ".blobs")
+# Compressed getExamReport cache shared with export_test.py; reports younger than the TTL are not fetched again
+REPORT_CACHE_DIR = os.path.join(BASE_OUTPUT_DIR, ".cache", "reports")
+REPORT_CACHE_TTL_SECONDS = 3600
+# Log area: lines kept in the widget / how often queued log lines and progress are applied
+LOG_MAX_LINES = 2000
+GUI_POLL_MS = 100
+# Exams exported at the same time by the job queue
+GUI_PARALLEL_EXAMS = DEFAULT_PARALLEL_EXAMS
+
+# --- Export stages (shared core: ulearning_export.exporter) ---
 def get_exam_report(exam_id, trace_id, auth_token, current_headers, gui_log_message_func):
-    report_url = f"{BASE_API_URL}/exams/user/study/getExamReport?examId={exam_id}&traceId={trace_id}"
-    gui_log_message_func(f"Fetching exam report for examId: {exam_id}, traceId: {trace_id}...\n")
-    headers = current_headers.copy(); headers["authorization"] = auth_token
+    from ulearning_export.exporter import fetch_exam_report
+    return fetch_exam_report(BASE_API_URL, exam_id, trace_id, auth_token, current_headers, log_func=gui_log_message_func)
+
+def create_image_engine(log_func=None):
+    """The image engine of the queued exports: one blob store and one worker budget for all of them."""
+    from ulearning_export.download import DownloadEngine
+    return DownloadEngine(IMAGE_DOWNLOAD_HEADERS, max_workers=IMAGE_DOWNLOAD_WORKERS,
+                          per_host_limit=IMAGE_DOWNLOAD_PER_HOST, log_func=log_func,
+                          blob_store=BlobStore(IMAGE_BLOB_STORE_DIR))
+
+def process_exam_data(exam, base_exam_dir, gui_log_message_func, metrics=None, progress=None, cancel_token=None,
+                      renderers=(), selection=None, image_engine=None):
+    """
+    Runs the core's question and image stage (exporter.process_exam_data) for the selected
+    ``renderers`` and ``selection``; returns the ImageIndex. ``cancel_token`` is checked before every
+    question and image download. Exports running at the same time pass the shared ``image_engine``;
+    without one the export gets an engine of its own.
+    """
+    from ulearning_export import exporter
+    own_engine = create_image_engine() if image_engine is None else None
     try:
-        response = requests.get(report_url, headers=headers, timeout=15)
-        response.raise_for_status(); return response.json()
-    except requests.exceptions.Timeout:
-        gui_log_message_func(f"Timeout: {report_url}\n")
-    except requests.exceptions.HTTPError as e:
-        gui_log_message_func(f"HTTP error: {e.response.status_code} - {e}\nServer response: {e.response.text[:500]}...\n")
-        if e.response.status_code == 401: gui_log_message_func("Authorization error (401).\n")
-    except requests.exceptions.RequestException as e:
-        gui_log_message_func(f"Request error: {e}\n")
-    except json.JSONDecodeError as e_json: 
-        gui_log_message_func(f"JSON Decode Error. Response: {e_json.doc[:500]}...\n") 
-
-
-def process_exam_data(exam_json, base_exam_dir, gui_log_message_func):
-    if not exam_json or 'result' not in exam_json:
-        gui_log_message_func("Exam JSON invalid or 'result' missing.\n"); return
-    result = exam_json['result']; parts = result.get('part', [])
-    if not parts:
-        gui_log_message_func("No 'part' in exam data.\n"); return
-
-    for part_idx, part_data in enumerate(parts):
-        questions = part_data.get('children', [])
-        if not questions:
-            gui_log_message_func(f"No questions in part {part_idx + 1}.\n"); continue
-        gui_log_message_func(f"\nProcessing Part {part_idx + 1} (Name: {part_data.get('partname', 'N/A')})...\n")
-
-        for q_idx, question in enumerate(questions):
-            q_order_index = question.get('orderIndex', q_idx + 1)
-            q_id = question.get('questionid', f'unknownID_{q_idx+1}')
-            question_folder_name = f"question_{q_order_index}_{q_id}"
-            question_dir = os.path.join(base_exam_dir, question_folder_name)
-            os.makedirs(question_dir, exist_ok=True)
-            gui_log_message_func(f" Processing Question {q_order_index} (ID: {q_id}) -> '{question_folder_name}'\n")
-
-            text_output_path = os.path.join(question_dir, "question_data.txt") 
-            with open(text_output_path, 'w', encoding='utf-8') as f_text:
-                f_text.write(f"题目ID: {q_id}\n题目顺序号: {q_order_index}\n")
-                q_type_code = question.get('type'); q_type_name = get_question_type_name(q_type_code)
-                f_text.write(f"题目类型: {q_type_name}\n\n【题干】:\n")
-                title_html = question.get('title', ''); title_text = get_clean_text_from_html(title_html)
-                f_text.write(title_text + "\n\n")
-                items = question.get('item', [])
-                if items:
-                    f_text.write("【选项】:\n")
-                    for item_obj in items:
-                        item_title_html = item_obj.get('title', '')
-                        option_letter_soup = BeautifulSoup(item_title_html, 'html.parser')
-                        first_p = option_letter_soup.find('p'); option_prefix = ""
-                        if first_p:
-                            p_text = first_p.get_text(strip=True)
-                            if len(p_text) == 1 and p_text.isalpha(): option_prefix = f"{p_text}. "
-                        item_text = get_clean_text_from_html(item_title_html)
-                        if item_text.startswith(option_prefix.strip().rstrip('.')): f_text.write(f"{item_text}\n")
-                        else: f_text.write(f"{option_prefix}{item_text}\n")
-                    f_text.write("\n")
-                correct_info = question.get('correctAnswerAndReplay', {})
-                f_text.write("【正确答案】:\n")
-                correct_answers_list = correct_info.get('correctAnswer', [])
-                if not correct_answers_list: f_text.write("未提供\n")
-                else:
-                    for ans_content in correct_answers_list: f_text.write(f"{get_clean_text_from_html(ans_content)}\n")
-                f_text.write("\n")
-                correct_replay_html = correct_info.get('correctReplay', '')
-                if correct_replay_html: f_text.write(f"【答案解析】:\n{get_clean_text_from_html(correct_replay_html)}\n\n")
-                student_answer_info = question.get('studentAnswer', {})
-                if student_answer_info:
-                    f_text.write(f"【学生答案】:\n{get_clean_text_from_html(student_answer_info.get('answer', ''))}\n")
-                    if student_answer_info.get('grade') is not None: f_text.write(f"得分: {student_answer_info.get('grade')}\n")
-                f_text.write("\n------------------------------------\n")
-
-            images_to_process = []
-            title_html = question.get('title', '')
-            for i, img_url in enumerate(extract_image_urls_from_html(title_html)):
-                images_to_process.append((img_url, f"title_img_{i+1}"))
-            
-            items = question.get('item', [])
-            if items:
-                for item_idx, item_obj in enumerate(items):
-                    item_order_index = item_obj.get('orderIndex', item_idx + 1)
-                    item_title_html_for_img = item_obj.get('title', '')
-                    temp_soup = BeautifulSoup(item_title_html_for_img, 'html.parser')
-                    p_tag = temp_soup.find('p'); prefix_label = str(item_order_index)
-                    if p_tag:
-                        p_text_content = p_tag.get_text(strip=True)
-                        if len(p_text_content) == 1 and p_text_content.isalpha(): prefix_label = p_text_content
-                    for i, img_url in enumerate(extract_image_urls_from_html(item_title_html_for_img)):
-                        images_to_process.append((img_url, f"option_{prefix_label}_img_{i+1}"))
-            
-            correct_info = question.get('correctAnswerAndReplay', {})
-            correct_answers_list = correct_info.get('correctAnswer', [])
-            for ans_idx, ans_html in enumerate(correct_answers_list):
-                if isinstance(ans_html, str):
-                    for i, img_url in enumerate(extract_image_urls_from_html(ans_html)):
-                        images_to_process.append((img_url, f"correct_answer_{ans_idx+1}_img_{i+1}"))
-            
-            correct_replay_html = correct_info.get('correctReplay', '')
-            if correct_replay_html and isinstance(correct_replay_html, str):
-                for i, img_url in enumerate(extract_image_urls_from_html(correct_replay_html)):
-                    images_to_process.append((img_url, f"correct_replay_img_{i+1}"))
-            
-            downloaded_urls_in_q = set()
-            for img_url, filename_prefix in images_to_process:
-                if not img_url.startswith(('http://', 'https://')):
-                    gui_log_message_func(f"  Skipping invalid image URL: {img_url}\n")
-                    continue
-                if img_url in downloaded_urls_in_q: continue
-                parsed_url = urlparse(img_url); original_filename = os.path.basename(parsed_url.path)
-                _, ext = os.path.splitext(original_filename)
-                if not ext or len(ext) > 5: ext = ".png"
-                save_filename = f"{filename_prefix}{ext}"; save_path = os.path.join(question_dir, save_filename)
-                if download_image(img_url, save_path, IMAGE_DOWNLOAD_HEADERS, gui_log_message_func): # Pass logger
-                    downloaded_urls_in_q.add(img_url)
-
-def generate_markdown_exam(exam_json_data, exam_main_folder_path, md_file_name_full, gui_log_message_func):
-    
-    markdown_output_path = os.path.join(exam_main_folder_path, md_file_name_full)
-
-    with open(markdown_output_path, 'w', encoding='utf-8') as md_file:
-        
-        exam_title = exam_json_data.get("result", {}).get("examTitle", "考试试卷")
-        md_file.write(f"# {exam_title}\n\n")
-        
-        
-        exam_title = exam_json_data.get("result", {}).get("examTitle", "考试试卷")
-        md_file.write(f"# {exam_title}\n\n") 
-        parts = exam_json_data.get("result", {}).get("part", [])
-        for part_idx, part_data in enumerate(parts):
-            part_name = part_data.get('partname', f'第 {part_idx + 1} 部分')
-            md_file.write(f"## {part_name}\n\n")
-            questions = part_data.get('children', [])
-            for q_idx, question in enumerate(questions):
-                q_order_index = question.get('orderIndex', q_idx + 1)
-                q_id = question.get('questionid', f'unknownID_{q_idx+1}')
-                q_type_code = question.get('type'); q_type_name = get_question_type_name(q_type_code)
-                question_folder_name_for_md = f"question_{q_order_index}_{q_id}"
-                md_file.write(f"### {q_order_index}. ({q_type_name}) (ID: {q_id})\n\n")
-                title_html = question.get('title', ''); title_text = get_clean_text_from_html(title_html)
-                md_file.write(f"**题干:**\n{title_text}\n")
-                question_specific_dir_path = os.path.join(exam_main_folder_path, question_folder_name_for_md)
-                if os.path.exists(question_specific_dir_path):
-                    for img_file in sorted(os.listdir(question_specific_dir_path)):
-                        if img_file.startswith("title_img_"):
-                            img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                            md_file.write(f"![题干图片]({img_path_md})\n")
-                md_file.write("\n")
-                items = question.get('item', [])
-                if items:
-                    md_file.write("**选项:**\n")
-                    for item_idx, item_obj in enumerate(items):
-                        item_order_in_json = item_obj.get('orderIndex', item_idx + 1)
-                        item_html = item_obj.get('title', '')
-                        option_letter_soup = BeautifulSoup(item_html, 'html.parser')
-                        first_p = option_letter_soup.find('p'); option_prefix = ""
-                        option_letter_for_img = str(item_order_in_json)
-                        if first_p:
-                            p_text = first_p.get_text(strip=True)
-                            if len(p_text) == 1 and p_text.isalpha():
-                                option_prefix = f"{p_text}. "; option_letter_for_img = p_text
-                        item_text_cleaned = get_clean_text_from_html(item_html)
-                        if item_text_cleaned.startswith(option_prefix.strip().rstrip('.')): md_file.write(f"- {item_text_cleaned}\n")
-                        else: md_file.write(f"- {option_prefix}{item_text_cleaned}\n")
-                        if os.path.exists(question_specific_dir_path):
-                            for img_file in sorted(os.listdir(question_specific_dir_path)):
-                                if img_file.startswith(f"option_{option_letter_for_img}_img_"):
-                                    img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                                    md_file.write(f"  ![选项图片]({img_path_md})\n")
-                    md_file.write("\n")
-                correct_info = question.get('correctAnswerAndReplay', {})
-                correct_answers_list = correct_info.get('correctAnswer', [])
-                md_file.write("**正确答案:**\n")
-                if not correct_answers_list: md_file.write("未提供\n")
-                else:
-                    for ans_idx, ans_content_html in enumerate(correct_answers_list):
-                        ans_text = get_clean_text_from_html(ans_content_html)
-                        md_file.write(f"{ans_text}\n")
-                        if os.path.exists(question_specific_dir_path):
-                            for img_file in sorted(os.listdir(question_specific_dir_path)):
-                                if img_file.startswith(f"correct_answer_{ans_idx+1}_img_"):
-                                    img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                                    md_file.write(f"![答案图片]({img_path_md})\n")
-                md_file.write("\n")
-                correct_replay_html = correct_info.get('correctReplay', '')
-                if correct_replay_html:
-                    md_file.write("**答案解析:**\n"); replay_text = get_clean_text_from_html(correct_replay_html)
-                    md_file.write(f"{replay_text}\n")
-                    if os.path.exists(question_specific_dir_path):
-                        for img_file in sorted(os.listdir(question_specific_dir_path)):
-                            if img_file.startswith("correct_replay_img_"):
-                                img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                                md_file.write(f"![解析图片]({img_path_md})\n")
-                    md_file.write("\n")
-                md_file.write("---\n\n")
-    gui_log_message_func(f"Markdown 试卷已生成: {os.path.abspath(markdown_output_path)}\n")
-
-
-def generate_tex_exam(exam_json_data, exam_main_folder_path, tex_file_name_full, gui_log_message_func):
-    tex_output_path = os.path.join(exam_main_folder_path, tex_file_name_full)
-    
-    with open(tex_output_path, 'w', encoding='utf-8') as tex_file:
-        tex_file.write(r"\documentclass[12pt]{article}" + "\n")
-        tex_file.write(r"\usepackage[UTF8]{ctex}" + "\n")
-        tex_file.write(r"\usepackage{graphicx}" + "\n")
-        tex_file.write(r"\usepackage{amsmath, amsfonts, amssymb}" + "\n")
-        tex_file.write(r"\usepackage[a4paper, margin=1in]{geometry}" + "\n")
-        tex_file.write(r"\usepackage{enumitem}" + "\n")
-        tex_file.write(r"\usepackage{hyperref}" + "\n")
-        tex_file.write(r"\hypersetup{colorlinks=true, linkcolor=blue, urlcolor=blue, citecolor=green}" + "\n")
-        tex_file.write(r"\usepackage{array}\usepackage{longtable}" + "\n")
-        exam_title_raw = exam_json_data.get("result", {}).get("examTitle", "考试试卷")
-        exam_title_tex = escape_latex_special_chars(exam_title_raw)
-        tex_file.write(f"\\title{{{exam_title_tex}}}\n")
-        tex_file.write(f"\\author{{优学院导出}}\n")
-        tex_file.write(f"\\date{{{datetime.date.today().strftime('%Y-%m-%d')}}}\n")
-        tex_file.write(r"\begin{document}" + "\n")
-        tex_file.write(r"\maketitle" + "\n\n")
-        parts = exam_json_data.get("result", {}).get("part", [])
-        for part_idx, part_data in enumerate(parts):
-            part_name_raw = part_data.get('partname', f'第 {part_idx + 1} 部分')
-            part_name_tex = escape_latex_special_chars(part_name_raw)
-            tex_file.write(f"\\section*{{{part_name_tex}}}\n\\hrulefill\n\n")
-            questions = part_data.get('children', [])
-            for q_idx, question in enumerate(questions):
-                q_order_index = question.get('orderIndex', q_idx + 1)
-                q_id = question.get('questionid', f'unknownID_{q_idx+1}')
-                q_type_code = question.get('type'); q_type_name_raw = get_question_type_name(q_type_code)
-                q_type_name_tex = escape_latex_special_chars(q_type_name_raw)
-                question_folder_name_for_tex = f"question_{q_order_index}_{q_id}"
-                tex_file.write(f"\\subsection*{{{q_order_index}. ({q_type_name_tex}) \\small ID: {q_id}}}\n\n")
-                def write_tex_content_with_images(label_raw, content_html, image_prefix, question_specific_dir, img_alt_text):
-                    content_text_raw = get_clean_text_from_html(content_html)
-                    content_text_tex = escape_latex_special_chars(content_text_raw).replace('\n\n', '\n\\par\n')
-                    if label_raw: tex_file.write(f"\\textbf{{{escape_latex_special_chars(label_raw)}:}}\n\n{content_text_tex}\n")
-                    else: tex_file.write(f"{content_text_tex}\n")
-                    if os.path.exists(question_specific_dir):
-                        for img_file in sorted(os.listdir(question_specific_dir)):
-                            if img_file.startswith(image_prefix):
-                                img_path_tex = os.path.join(question_folder_name_for_tex, img_file).replace("\\", "/")
-                                tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.8\\textwidth, height=0.25\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
-                    tex_file.write("\n")
-                question_specific_dir_path = os.path.join(exam_main_folder_path, question_folder_name_for_tex)
-                write_tex_content_with_images("题干", question.get('title', ''), "title_img_", question_specific_dir_path, "题干图片")
-                items = question.get('item', [])
-                if items:
-                    tex_file.write(f"\\textbf{{{escape_latex_special_chars('选项')}:}}\n")
-                    tex_file.write("\\begin{itemize}[leftmargin=*]\n")
-                    for item_idx, item_obj in enumerate(items):
-                        item_order_in_json = item_obj.get('orderIndex', item_idx + 1)
-                        item_html = item_obj.get('title', '')
-                        option_letter_soup = BeautifulSoup(item_html, 'html.parser')
-                        first_p = option_letter_soup.find('p'); option_prefix_raw = ""
-                        option_letter_for_img_name = str(item_order_in_json)
-                        if first_p:
-                            p_text = first_p.get_text(strip=True)
-                            if len(p_text) == 1 and p_text.isalpha():
-                                option_prefix_raw = f"{p_text}. "; option_letter_for_img_name = p_text
-                        item_text_cleaned_raw = get_clean_text_from_html(item_html)
-                        full_option_text_raw = item_text_cleaned_raw
-                        if option_prefix_raw and not item_text_cleaned_raw.startswith(option_prefix_raw.strip().rstrip('.')):
-                            full_option_text_raw = option_prefix_raw + item_text_cleaned_raw
-                        tex_file.write(f"  \\item ")
-                        write_tex_content_with_images(None, full_option_text_raw, f"option_{option_letter_for_img_name}_img_", question_specific_dir_path, "选项图片")
-                    tex_file.write("\\end{itemize}\n\n")
-                correct_info = question.get('correctAnswerAndReplay', {})
-                correct_answers_list = correct_info.get('correctAnswer', [])
-                tex_file.write(f"\\textbf{{{escape_latex_special_chars('正确答案')}:}}\n")
-                if not correct_answers_list: tex_file.write(escape_latex_special_chars("未提供") + "\n")
-                else:
-                    for ans_idx, ans_content_html in enumerate(correct_answers_list):
-                        ans_text_raw = get_clean_text_from_html(ans_content_html)
-                        ans_text_tex = escape_latex_special_chars(ans_text_raw).replace('\n\n', '\n\\par\n')
-                        tex_file.write(f"{ans_text_tex}\n")
-                        if os.path.exists(question_specific_dir_path):
-                            for img_file in sorted(os.listdir(question_specific_dir_path)):
-                                if img_file.startswith(f"correct_answer_{ans_idx+1}_img_"):
-                                    img_path_tex = os.path.join(question_folder_name_for_tex, img_file).replace("\\", "/")
-                                    tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.7\\textwidth, height=0.2\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
-                tex_file.write("\n")
-                correct_replay_html = correct_info.get('correctReplay', '')
-                if correct_replay_html:
-                    write_tex_content_with_images("答案解析", correct_replay_html, "correct_replay_img_", question_specific_dir_path, "解析图片")
-                tex_file.write("\\vspace{0.5em}\\hrulefill\\vspace{1em}\n\n")
-        tex_file.write(r"\end{document}" + "\n")
-    gui_log_message_func(f"TeX 试卷已生成: {os.path.abspath(tex_output_path)}\n")
-
-
-def run_export_process(exam_id_str, trace_id_str, auth_token_str, gui_log_message_func, gui_enable_button_func):
+        with (image_engine or own_engine).bound(gui_log_message_func, metrics, cancel_token) as engine:
+            return exporter.process_exam_data(exam, base_exam_dir, engine, renderers, gui_log_message_func, metrics,
+                                              progress, cancel_token, selection=selection)
+    finally:
+        if own_engine is not None: own_engine.close()
+
+
+def run_export_process(exam_id_str, trace_id_str, auth_token_str, gui_log_message_func, profile=False,
+                       gui_progress_func=None, cancel_token=None, formats=None, selection=None,
+                       image_engine=None):
+    """
+    Exports one exam; returns its output folder, or None on failure. ``cancel_token`` (a
+    batch.CancelToken) pauses or cancels the export at its checkpoints; a cancelled export
+    raises ExportCancelled. ``formats`` are the renderer names to write (default: all formats), ``selection``
+    (selection.ExportSelection) the parts and questions exported and whether images are downloaded.
+    ``image_engine`` is the DownloadEngine shared by the exports of one queue (see process_exam_data).
+    """
+    from ulearning_export.exporter import exam_output_names
+    from ulearning_export.model import normalize_exam
     global API_HEADERS 
     gui_log_message_func("--- 优学院考试数据导出工具 (GUI) ---\n")
 
     if not all([exam_id_str, trace_id_str, auth_token_str]):
         gui_log_message_func("错误: Exam ID, Trace ID, 和 Authorization Token 都不能为空。\n")
-        gui_enable_button_func() 
-        return
+        return None
 
     
     current_api_headers = API_HEADERS.copy() 
     current_api_headers["authorization"] = auth_token_str
 
-    exam_data = get_exam_report(exam_id_str, trace_id_str, auth_token_str, current_api_headers, gui_log_message_func)
+    metrics = ExportMetrics(label=f"exam {exam_id_str}")
+    report_cache = ReportCache(REPORT_CACHE_DIR, REPORT_CACHE_TTL_SECONDS)
+    cached = report_cache.load(exam_id_str, trace_id_str)
+    if cached:
+        gui_log_message_func(f"Using cached exam report (fetched {cached.age_seconds / 60:.0f} min ago).\n")
+        exam_data = cached.report
+    else:
+        with metrics.stage("fetch_report"):
+            exam_data = get_exam_report(exam_id_str, trace_id_str, auth_token_str, current_api_headers, gui_log_message_func)
+        if exam_data and exam_data.get("result"): report_cache.store(exam_id_str, trace_id_str, exam_data)
     if not exam_data:
         gui_log_message_func("未能获取考试数据。请检查参数或网络。\n")
-        gui_enable_button_func()
-        return
+        return None
 
-    exam_title_raw = exam_data.get("result", {}).get("examTitle", "UnknownExam")
-    sanitized_exam_title_for_folder = sanitize_filename(exam_title_raw)
-    
-    current_exam_dir_name = f"exam_{exam_id_str}_{sanitized_exam_title_for_folder}"
+    if selection is not None and selection.partial: gui_log_message_func(f"Selective export: {selection.describe()}\n")
+    current_exam_dir_name, stem = exam_output_names(exam_id_str, exam_data, selection)
     current_exam_output_dir = os.path.join(BASE_OUTPUT_DIR, current_exam_dir_name)
     try:
         os.makedirs(current_exam_output_dir, exist_ok=True)
         gui_log_message_func(f"\n数据将保存到: {current_exam_output_dir}\n")
     except OSError as e:
         gui_log_message_func(f"错误: 无法创建目录 {current_exam_output_dir}. 原因: {e}\n")
-        gui_enable_button_func()
-        return
-
-
-    process_exam_data(exam_data, current_exam_output_dir, gui_log_message_func)
-    
-    md_filename = f"{sanitized_exam_title_for_folder}_完整试卷.md"
-    tex_filename = f"{sanitized_exam_title_for_folder}_完整试卷.tex"
+        return None
+
+    renderers = resolve_renderers(formats)
+    question_renderers, exam_renderers = split_renderers(renderers)
+
+    def export_and_render():
+        with metrics.stage("parse"): exam = normalize_exam(exam_data, selection) # Every HTML fragment is parsed here, once
+        if exam is not None:
+            metrics.count("questions", sum(len(part.questions) for part in exam.parts))
+            metrics.count("html_fragments_parsed", sum(q.fragment_count() for q in exam.questions()))
+        with metrics.stage("process_exam_data"):
+            image_index = process_exam_data(exam, current_exam_output_dir, gui_log_message_func, metrics,
+                                            ExportProgress(gui_progress_func), cancel_token, question_renderers,
+                                            selection, image_engine)
+        if cancel_token: cancel_token.checkpoint()
+        try:
+            for renderer in exam_renderers:
+                with metrics.stage(f"write_{renderer.name}"):
+                    render_exam(renderer.name, exam, current_exam_output_dir, renderer.output_name(stem), image_index,
+                                log_func=gui_log_message_func)
+        except Exception as e_gen:
+            gui_log_message_func(f"生成汇总文件时出错: {e_gen}\n")
+    profiled(export_and_render, profile, os.path.join(current_exam_output_dir, PROFILE_FILENAME), gui_log_message_func)
 
-    try:
-        generate_markdown_exam(exam_data, current_exam_output_dir, md_filename, gui_log_message_func)
-        generate_tex_exam(exam_data, current_exam_output_dir, tex_filename, gui_log_message_func)
-    except Exception as e_gen:
-        gui_log_message_func(f"生成汇总文件时出错: {e_gen}\n")
+    gui_log_message_func(metrics.summary_line())
+    gui_log_message_func(f"性能数据已保存: {os.path.abspath(metrics.save(current_exam_output_dir))}\n")
 
 
     gui_log_message_func("\n--- 数据导出与试卷生成处理完成 ---\n")
     gui_log_message_func(f"请检查输出目录: {os.path.abspath(current_exam_output_dir)}\n")
-    gui_enable_button_func() 
+    return current_exam_output_dir
 
 # --- Tkinter GUI Application ---
 class App:
     def __init__(self, root):
         self.root = root
         root.title("优学院考试导出助手")
-        root.geometry("700x750")
-        self.message_queue = queue.Queue()
+        root.geometry("760x980")
+        self.log_sink = LogSink()
+        self.job_manager = JobManager(self.run_job, GUI_PARALLEL_EXAMS, on_update=self.log_sink.post_job)
+        self.image_engine = None # Shared by all queued exports, created by the first one
+        self.image_engine_lock = threading.Lock()
+        self.job_progress = {} # job_id -> latest ProgressSnapshot, summed for the progress bar
+        self.finished_jobs = set()
 
         # Style
         style = ttk.Style()
@@ -485,11 +203,58 @@ class App:
         control_frame = ttk.Frame(root, padding="10")
         control_frame.pack(padx=10, pady=5, fill="x")
 
-        self.start_button = ttk.Button(control_frame, text="开始导出", command=self.start_export_thread)
+        self.start_button = ttk.Button(control_frame, text="加入导出队列", command=self.add_export_job)
         self.start_button.pack(side="left", padx=5)
 
         self.help_button = ttk.Button(control_frame, text="如何获取参数?", command=self.show_help)
         self.help_button.pack(side="left", padx=5)
+
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="性能分析 (cProfile)", variable=self.profile_var).pack(side="left", padx=5)
+
+        # Output formats of the next queued exports, one per registered renderer
+        formats_frame = ttk.LabelFrame(root, text="输出格式", padding="10")
+        formats_frame.pack(padx=10, pady=5, fill="x")
+        self.format_vars = {}
+        for name, renderer in RENDERERS.items():
+            self.format_vars[name] = tk.BooleanVar(value=name in DEFAULT_FORMATS)
+            ttk.Checkbutton(formats_frame, text=f"{renderer.label} ({renderer.output_name('<标题>')})",
+                            variable=self.format_vars[name]).pack(side="left", padx=5)
+        self.format_vars[IMAGES_FORMAT] = tk.BooleanVar(value=IMAGES_FORMAT in DEFAULT_FORMATS)
+        ttk.Checkbutton(formats_frame, text="图片", variable=self.format_vars[IMAGES_FORMAT]).pack(side="left", padx=5)
+
+        # Selective export: empty fields select everything
+        selection_frame = ttk.LabelFrame(root, text="导出范围 (留空为全部)", padding="10")
+        selection_frame.pack(padx=10, pady=5, fill="x")
+        self.selection_vars = {}
+        for key, label, width in (("parts", "部分 (如 1,3):", 10), ("questions", "题号 (如 1-5,8):", 14),
+                                  ("types", "题型代码 (如 1,2):", 10)):
+            ttk.Label(selection_frame, text=label).pack(side="left", padx=(5, 0))
+            self.selection_vars[key] = tk.StringVar()
+            ttk.Entry(selection_frame, textvariable=self.selection_vars[key], width=width).pack(side="left", padx=5)
+
+        # Job queue: one row per exam, actions apply to the selected rows
+        jobs_frame = ttk.LabelFrame(root, text=f"导出任务 (同时导出 {GUI_PARALLEL_EXAMS} 个)", padding="10")
+        jobs_frame.pack(padx=10, pady=5, fill="x")
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=("exam", "trace", "status", "progress"), show="headings", height=5)
+        for column, heading, width in (("exam", "Exam ID", 90), ("trace", "Trace ID", 90), ("status", "状态", 80),
+                                       ("progress", "进度", 420)):
+            self.jobs_tree.heading(column, text=heading)
+            self.jobs_tree.column(column, width=width, stretch=(column == "progress"))
+        self.jobs_tree.pack(fill="x")
+        job_buttons = ttk.Frame(jobs_frame)
+        job_buttons.pack(fill="x", pady=(5, 0))
+        ttk.Button(job_buttons, text="暂停", command=lambda: self.apply_to_selected_jobs(self.job_manager.pause)).pack(side="left", padx=5)
+        ttk.Button(job_buttons, text="继续", command=lambda: self.apply_to_selected_jobs(self.job_manager.resume)).pack(side="left", padx=5)
+        ttk.Button(job_buttons, text="取消", command=lambda: self.apply_to_selected_jobs(self.job_manager.cancel)).pack(side="left", padx=5)
+
+        # Progress
+        progress_frame = ttk.Frame(root, padding=(10, 0))
+        progress_frame.pack(padx=10, fill="x")
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress_bar.pack(fill="x")
+        self.progress_var = tk.StringVar(value="")
+        ttk.Label(progress_frame, textvariable=self.progress_var).pack(anchor="w")
         
         # Log area
         log_frame = ttk.LabelFrame(root, text="日志和状态", padding="10")
@@ -499,16 +264,12 @@ class App:
         self.log_text.pack(fill="both", expand=True)
         self.log_text.configure(state='disabled') # Make it read-only initially
 
-        # Instructions Area (initially hidden, shown by help button)
-        self.instructions_text_area = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=15, width=80)
-        self.instructions_text_area.insert(tk.END, self.get_instructions())
-        self.instructions_text_area.configure(state='disabled')
-        # self.instructions_text_area.pack_forget() # Initially hidden
-
-        self.root.after(100, self.process_message_queue)
+        self.root.after(GUI_POLL_MS, self.process_message_queue)
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
 
 
     def get_instructions(self):
+        """Help text of the help window; only built when the window is opened."""
         return """如何获取优学院考试导出所需参数：
 
 1. 打开浏览器 (推荐使用 Chrome 或 Edge)。
@@ -575,26 +336,69 @@ class App:
 
     def log_message(self, message):
         """Appends a message to the log text area in a thread-safe way."""
-        self.message_queue.put(message)
+        self.log_sink.write(message)
 
     def process_message_queue(self):
-        """Processes messages from the queue and updates the GUI."""
-        try:
-            while True:
-                message = self.message_queue.get_nowait()
-                self.log_text.configure(state='normal')
-                self.log_text.insert(tk.END, message)
-                self.log_text.see(tk.END) 
-                self.log_text.configure(state='disabled')
-        except queue.Empty:
-            pass 
-        self.root.after(100, self.process_message_queue) 
-
-
-    def enable_start_button(self):
-        self.start_button.config(state=tk.NORMAL)
+        """Applies everything logged since the last tick in one insert and keeps at most LOG_MAX_LINES lines."""
+        for managed in self.log_sink.drain_jobs(): self.update_job_row(managed)
+        text, snapshot = self.log_sink.drain()
+        if text:
+            self.log_text.configure(state='normal')
+            self.log_text.insert(tk.END, text)
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - LOG_MAX_LINES
+            if excess > 0: self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+            self.log_text.configure(state='disabled')
+        if snapshot:
+            self.progress_bar.configure(maximum=max(snapshot.steps_total, 1), value=snapshot.steps_done)
+            self.progress_var.set(snapshot.describe())
+        self.root.after(GUI_POLL_MS, self.process_message_queue)
+
+    def update_job_row(self, managed):
+        """Runs on the UI thread: refreshes the job's row and the total progress of all jobs."""
+        status_text = {"queued": "排队中", "running": "导出中", "paused": "已暂停", JOB_DONE: "完成", JOB_FAILED: "失败",
+                       JOB_CANCELLED: "已取消"}[managed.status]
+        if managed.status == JOB_DONE: detail = os.path.abspath(managed.output_dir)
+        elif managed.status == JOB_FAILED: detail = managed.error or ""
+        else: detail = managed.progress.describe() if managed.progress else ""
+        values = (managed.job.exam_id, managed.job.trace_id, status_text, detail)
+        row_id = str(managed.job_id)
+        if self.jobs_tree.exists(row_id): self.jobs_tree.item(row_id, values=values)
+        else: self.jobs_tree.insert("", tk.END, iid=row_id, values=values)
+        if managed.progress: self.job_progress[managed.job_id] = managed.progress
+        totals = ProgressSnapshot(*(sum(getattr(p, field) for p in self.job_progress.values())
+                                    for field in ProgressSnapshot.__slots__))
+        self.log_sink.post_progress(totals)
+        if managed.status in JOB_FINISHED and managed.job_id not in self.finished_jobs:
+            self.finished_jobs.add(managed.job_id)
+            self.log_message(f"[{managed.job.exam_id}] 任务结束: {status_text} ({managed.seconds:.1f}s)\n")
+
+    def apply_to_selected_jobs(self, action):
+        selected = self.jobs_tree.selection()
+        if not selected: messagebox.showinfo("导出任务", "请先在任务列表中选择任务。"); return
+        for row_id in selected:
+            managed = self.job_manager.jobs.get(int(row_id))
+            if managed: action(managed)
+
+    def run_job(self, managed):
+        """Runs on a job manager worker: one export with its own log prefix, progress and cancel token."""
+        auth_token, profile, formats, selection = managed.options
+        prefix = f"[{managed.job.exam_id}] "
+        with self.image_engine_lock:
+            if self.image_engine is None: self.image_engine = create_image_engine(self.log_sink.write)
+        return run_export_process(managed.job.exam_id, managed.job.trace_id, auth_token,
+                                  lambda message: self.log_sink.write(prefix_lines(message, prefix)), profile,
+                                  lambda snapshot: self.job_manager.report_progress(managed, snapshot), managed.token,
+                                  formats, selection, self.image_engine)
+
+    def on_close(self):
+        if self.job_manager.active_jobs() and not messagebox.askokcancel("退出", "还有未完成的导出任务，取消这些任务并退出？"):
+            return
+        self.job_manager.shutdown(cancel=True)
+        if self.image_engine is not None: self.image_engine.close()
+        self.root.destroy()
 
-    def start_export_thread(self):
+    def add_export_job(self):
         exam_id = self.exam_id_var.get().strip()
         trace_id = self.trace_id_var.get().strip()
         auth_token = self.auth_token_var.get().strip()
@@ -603,17 +407,19 @@ class App:
             messagebox.showerror("输入错误", "Exam ID, Trace ID, 和 Authorization Token 都不能为空！")
             return
 
-        self.log_text.configure(state='normal')
-        self.log_text.delete('1.0', tk.END) 
-        self.log_text.configure(state='disabled')
-        
-        self.start_button.config(state=tk.DISABLED)
-
-        thread = threading.Thread(target=run_export_process,
-                                  args=(exam_id, trace_id, auth_token,
-                                        self.log_message, self.enable_start_button),
-                                  daemon=True)
-        thread.start()
+        formats = [name for name, var in self.format_vars.items() if var.get()]
+        try: selection = self.export_selection(IMAGES_FORMAT in formats)
+        except ValueError as e:
+            messagebox.showerror("输入错误", f"导出范围无效: {e}")
+            return
+        self.job_manager.submit(ExamJob(exam_id, trace_id), (auth_token, self.profile_var.get(), formats, selection))
+
+    def export_selection(self, images):
+        """ExportSelection of the 导出范围 fields; raises ValueError for a malformed field."""
+        fields = {key: var.get().strip() for key, var in self.selection_vars.items()}
+        return ExportSelection(parse_number_list(fields["parts"]) if fields["parts"] else None,
+                               parse_ranges(fields["questions"]) if fields["questions"] else None,
+                               parse_number_list(fields["types"]) if fields["types"] else None, images=images)
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,10 +1,23 @@
-import requests
 import json
 import os
-import re
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
-import datetime # For TeX date
+import argparse
+import functools
+import time
+# Only modules that are cheap to import are imported here, so --help, --search and the prompts come up at once.
+# The export stack (requests, the download engine and manifest, the question model, the pipeline and the
+# render pool) is imported inside the functions that use it, on first export (benchmarks/bench_startup.py).
+from ulearning_export.archive import ARCHIVE_SUFFIX, ExamArchive
+from ulearning_export.batch import DEFAULT_PARALLEL_EXAMS, format_summary, load_jobs_file, parse_exam_spec, run_batch, write_summary
+from ulearning_export.blobstore import BlobStore
+from ulearning_export.image_index import ImageIndex, split_filename_prefix
+from ulearning_export.latex import escape_latex_special_chars, text_to_tex
+from ulearning_export.metrics import METRICS_FILENAME, PROFILE_FILENAME, ExportMetrics, profiled
+from ulearning_export.pdf_compile import DEFAULT_PDF_WORKERS, compile_tex_files, find_tex_files
+from ulearning_export.question_bank import DEFAULT_SEARCH_LIMIT, QUESTION_BANK_FILENAME, QuestionBank, format_hits, question_row
+from ulearning_export.renderers import (DEFAULT_FORMATS, IMAGES_FORMAT, format_names, normalize_formats, render_exam,
+                                        resolve_renderers, split_renderers, write_tex_preamble)
+from ulearning_export.report_cache import ReportCache
+from ulearning_export.selection import ExportSelection, parse_number_list, parse_ranges
 '''
 2025.06.07
 还在学工程热力学中...
@@ -51,344 +64,449 @@ IMAGE_DOWNLOAD_HEADERS = {
     "User-Agent": API_HEADERS["user-agent"]
 }
 
-def sanitize_filename(filename):
-    if filename is None: filename = "untitled"
-    filename = str(filename)
-
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-
-    filename = re.sub(r'\s+', '_', filename)
-
-    filename = re.sub(r'_+', '_', filename)
-
-    filename = filename.strip('_')
-    return filename[:100] 
-
-
-def get_clean_text_from_html(html_content):
-    if not html_content or not isinstance(html_content, str): return ""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    for p_tag in soup.find_all("p"): p_tag.append("\n")
-    for br_tag in soup.find_all("br"): br_tag.replace_with("\n")
-    text = soup.get_text(separator='', strip=False)
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    text = re.sub(r'^\s*\n|\n\s*$', '', text)
-    return text.strip()
-
-def escape_latex_special_chars(text):
-    if not text: return ""
-    text = text.replace('\\', r'\textbackslash{}')
-    text = text.replace('{', r'\{'); text = text.replace('}', r'\}')
-    text = text.replace('&', r'\&'); text = text.replace('%', r'\%')
-    text = text.replace('$', r'\$'); text = text.replace('#', r'\#')
-    text = text.replace('_', r'\_'); text = text.replace('^', r'\^{}')
-    text = text.replace('~', r'\textasciitilde{}')
-    return text
-
-def refresh_session(ua_token, trace_id, current_headers):
-    refresh_url = f"{BASE_API_URL}/users/login/refresh10Session?uaToken={ua_token}&traceId={trace_id}"
-    print(f"Attempting to refresh session for traceId: {trace_id}...")
-    headers = current_headers.copy(); headers["authorization"] = ua_token
-    try:
-        response = requests.get(refresh_url, headers=headers, timeout=10)
-        response.raise_for_status(); print("Session refresh request successful.")
-        return ua_token
-    except requests.exceptions.RequestException as e:
-        print(f"Error refreshing session: {e}\nProceeding with the current token.")
-        return ua_token
-
-def get_exam_report(exam_id, trace_id, auth_token, current_headers):
-    report_url = f"{BASE_API_URL}/exams/user/study/getExamReport?examId={exam_id}&traceId={trace_id}"
-    print(f"Fetching exam report for examId: {exam_id}, traceId: {trace_id}...")
-    headers = current_headers.copy(); headers["authorization"] = auth_token
+# Image download pool: worker threads in total / parallel connections per host
+IMAGE_DOWNLOAD_WORKERS = 8
+IMAGE_DOWNLOAD_PER_HOST = 4
+# Larger images fail instead of filling the disk; saved images are re-checked with If-None-Match/If-Modified-Since (--revalidate-images)
+IMAGE_MAX_BYTES = None # None: download.DEFAULT_MAX_IMAGE_BYTES (50 MiB)
+IMAGE_REVALIDATE = False
+# Content-addressed image store shared by all exams (question folders get hardlinks into it)
+IMAGE_BLOB_STORE_DIR = os.path.join(BASE_OUTPUT_DIR, ".blobs")
+# Compressed getExamReport cache; reports younger than the TTL are not fetched again (--offline ignores the TTL)
+REPORT_CACHE_DIR = os.path.join(BASE_OUTPUT_DIR, ".cache", "reports")
+REPORT_CACHE_TTL_SECONDS = 3600
+# SQLite question bank with full-text search over every exported question (None disables it)
+QUESTION_BANK_PATH = os.path.join(BASE_OUTPUT_DIR, QUESTION_BANK_FILENAME)
+# Combined question bank without duplicates across exams (--dedup-bank)
+DEDUP_BANK_DIR = os.path.join(BASE_OUTPUT_DIR, "题库")
+# Optional image post-processing (derived files next to the originals; compression/scaling/thumbnails need Pillow):
+# lossless PNG recompression, downscaling for print to at most IMAGE_MAX_DPI, Markdown thumbnails
+IMAGE_OPTIMIZE = False
+IMAGE_MAX_DPI = None
+IMAGE_THUMBNAILS = False
+# Write each exam as one ZIP (exam_<id>_<title>.zip) instead of a folder tree (also --archive)
+EXPORT_ARCHIVE = False
+# Output formats written per run: names of ulearning_export.renderers.RENDERERS and "images" (also --formats)
+EXPORT_FORMATS = DEFAULT_FORMATS
+# Selective export, None for everything: part numbers {1, 3}, orderIndex ranges ((1, 10),), type codes {1, 2}
+# (also --parts / --questions / --types); unselected questions are never parsed, downloaded or written
+EXPORT_PARTS = None
+EXPORT_QUESTIONS = None
+EXPORT_TYPES = None
+
+def refresh_session(ua_token, trace_id, current_headers, client=None):
+    from ulearning_export.exporter import refresh_session as refresh
+    return refresh(BASE_API_URL, ua_token, trace_id, current_headers, client)
+
+def get_exam_report(exam_id, trace_id, auth_token, current_headers, client=None):
+    """Batch runs pass one shared client (keep-alive session, rate limits, circuit breakers)."""
+    from ulearning_export.exporter import fetch_exam_report
+    return fetch_exam_report(BASE_API_URL, exam_id, trace_id, auth_token, current_headers, client)
+
+def selected_renderers():
+    """The renderers of EXPORT_FORMATS (see ``--formats``), in registry order."""
+    return resolve_renderers(EXPORT_FORMATS)
+
+def export_selection():
+    """The ExportSelection of EXPORT_PARTS / EXPORT_QUESTIONS / EXPORT_TYPES and the "images" format."""
+    return ExportSelection(EXPORT_PARTS, EXPORT_QUESTIONS, EXPORT_TYPES, images=IMAGES_FORMAT in normalize_formats(EXPORT_FORMATS))
+
+def create_image_engine(metrics=None):
+    from ulearning_export.download import DEFAULT_MAX_IMAGE_BYTES, DownloadEngine
+    return DownloadEngine(IMAGE_DOWNLOAD_HEADERS, max_workers=IMAGE_DOWNLOAD_WORKERS,
+                          per_host_limit=IMAGE_DOWNLOAD_PER_HOST, blob_store=BlobStore(IMAGE_BLOB_STORE_DIR),
+                          metrics=metrics, max_image_bytes=IMAGE_MAX_BYTES or DEFAULT_MAX_IMAGE_BYTES,
+                          revalidate=IMAGE_REVALIDATE)
+
+def create_image_postprocessor():
+    """The configured image post-processing stage, or None when it is disabled."""
+    if not (IMAGE_OPTIMIZE or IMAGE_MAX_DPI or IMAGE_THUMBNAILS): return None
+    from ulearning_export.imageproc import ImagePostprocessor
+    return ImagePostprocessor(optimize=IMAGE_OPTIMIZE, max_dpi=IMAGE_MAX_DPI, thumbnails=IMAGE_THUMBNAILS,
+                              log_func=lambda message: print(message, end=""))
+
+def question_image_paths(question, image_index):
+    slots = dict.fromkeys(split_filename_prefix(prefix)[0] for _, prefix in question.image_requests())
+    return [path for slot in slots for path in image_index.get(question.folder_name, slot)]
+
+def question_bank_rows(exam, image_index):
+    return [question_row(question, part, question_image_paths(question, image_index))
+            for part in exam.parts for question in part.iter_questions()]
+
+def update_question_bank(exam_id, exam_title, base_exam_dir, rows, metrics=None, prune=True):
+    """Upserts one exam's questions into the question bank (see ``--search``); a selective export does not ``prune``."""
+    if not QUESTION_BANK_PATH or exam_id is None: return
+    started = time.perf_counter()
+    with QuestionBank(QUESTION_BANK_PATH) as bank:
+        changed = bank.upsert_exam(exam_id, exam_title, os.path.abspath(base_exam_dir), rows, prune)
+        shared = bank.count_shared(exam_id)
+    if metrics: metrics.add_stage_time("question_bank", time.perf_counter() - started)
+    print(f"Question bank: {changed} of {len(rows)} questions added or updated ({QUESTION_BANK_PATH}).")
+    if shared: print(f"Question bank: {shared} questions of this exam also appear in other exported exams.")
+
+def process_exam_data(exam, base_exam_dir, engine=None, metrics=None, exam_id=None, archive=None):
+    """
+    Runs the core's question and image stage (exporter.process_exam_data) with the selected formats
+    and the configured post-processing; returns the ImageIndex. Batch runs pass a shared engine so
+    the image concurrency limit holds across exams; image counters go to ``metrics``. With an
+    ``exam_id`` the questions are also upserted into the question bank. With an ``archive``
+    (ExamArchive of ``base_exam_dir``) every file becomes an archive entry instead.
+    """
+    from ulearning_export import exporter
+    selection = export_selection()
+    if archive is not None and (IMAGE_OPTIMIZE or IMAGE_MAX_DPI or IMAGE_THUMBNAILS):
+        print("Image post-processing works on files and is skipped in archive mode.")
+    postprocessor = create_image_postprocessor() if archive is None else None
+    def run(engine):
+        return exporter.process_exam_data(exam, base_exam_dir, engine, selected_renderers(), metrics=metrics,
+                                          archive=archive, postprocessor=postprocessor, selection=selection)
+    if engine is not None:
+        image_index = run(engine)
+    else:
+        with create_image_engine(metrics) as engine: image_index = run(engine)
+    if exam is not None and exam.parts:
+        update_question_bank(exam_id, exam.title, archive.path if archive is not None else base_exam_dir,
+                             question_bank_rows(exam, image_index), metrics, prune=not selection.partial)
+    return image_index
+
+def render_exam_files(exam, base_exam_dir, stem, metrics, image_index=None, archive=None):
+    """Renders every selected exam format (Markdown, TeX, ...) in this thread, one timing stage each."""
+    for renderer in split_renderers(selected_renderers())[1]:
+        with metrics.stage(f"write_{renderer.name}"):
+            render_exam(renderer.name, exam, base_exam_dir, renderer.output_name(stem), image_index, archive)
+
+def stream_export_exam(exam, base_exam_dir, stem, engine=None, metrics=None, exam_id=None):
+    """
+    Streaming export (exporter.stream_export) of the selected formats: every question goes into the
+    exam files as soon as its images are done. ``exam`` comes from stream_exam (single pass). With an
+    ``exam_id`` the questions are also upserted into the question bank. Returns the ImageIndex.
+    """
+    from ulearning_export.exporter import stream_export
+    from ulearning_export.pipeline import StreamWriter
+    if exam is None: print("Exam JSON invalid or 'result' missing."); return ImageIndex()
+    own_engine = engine is None
+    if own_engine: engine = create_image_engine(metrics)
+    postprocessor = create_image_postprocessor()
+    selection = export_selection()
+    bank_rows = []; bank_parts = []
+    bank_writer = StreamWriter("question_bank", bank_parts.append,
+                               lambda question, image_index: bank_rows.append(
+                                   question_row(question, bank_parts[-1], question_image_paths(question, image_index))))
     try:
-        response = requests.get(report_url, headers=headers, timeout=15)
-        response.raise_for_status(); return response.json()
-    except requests.exceptions.Timeout: print(f"Timeout: {report_url}")
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP error: {e.response.status_code} - {e}\nServer response: {e.response.text[:500]}...")
-        if e.response.status_code == 401: print("Authorization error (401).")
-    except requests.exceptions.RequestException as e: print(f"Request error: {e}")
-    except json.JSONDecodeError: print(f"JSON Decode Error. Response: {response.text[:500]}...")
-    return None
-
-def extract_image_urls_from_html(html_content):
-    if not html_content or not isinstance(html_content, str): return []
-    soup = BeautifulSoup(html_content, 'html.parser')
-    img_tags = soup.find_all('img')
-    urls = [img['src'].strip() for img in img_tags if 'src' in img.attrs and img['src'] and img['src'].strip()]
-    return list(set(urls))
-
-def download_image(url, save_path, headers):
-    try:
-
-        response = requests.get(url, headers=headers, stream=True, timeout=20)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192): f.write(chunk)
-
-        return True
-    except requests.exceptions.Timeout: print(f"  Timeout downloading: {url}")
-    except requests.exceptions.HTTPError as e: print(f"  HTTP error {e.response.status_code} for {url}: {e}")
-    except requests.exceptions.RequestException as e: print(f"  Error downloading {url}: {e}")
-    return False
-
-def get_question_type_name(type_code):
-    type_map = {1: "单选题", 2: "多选题", 3: "不定项选择题", 4: "判断题", 5: "填空题/简答题"}
-    return type_map.get(type_code, f"未知题型 ({type_code})")
-
-def process_exam_data(exam_json, base_exam_dir):
-    if not exam_json or 'result' not in exam_json: print("Exam JSON invalid or 'result' missing."); return
-    result = exam_json['result']; parts = result.get('part', [])
-    if not parts: print("No 'part' in exam data."); return
-
-    for part_idx, part_data in enumerate(parts):
-        questions = part_data.get('children', [])
-        if not questions: print(f"No questions in part {part_idx + 1}."); continue
-        print(f"\nProcessing Part {part_idx + 1} (Name: {part_data.get('partname', 'N/A')})...")
-
-        for q_idx, question in enumerate(questions):
-            q_order_index = question.get('orderIndex', q_idx + 1)
-            q_id = question.get('questionid', f'unknownID_{q_idx+1}')
-            question_folder_name = f"question_{q_order_index}_{q_id}"
-            question_dir = os.path.join(base_exam_dir, question_folder_name)
-            os.makedirs(question_dir, exist_ok=True)
-            print(f" Processing Question {q_order_index} (ID: {q_id}) -> '{question_folder_name}'")
-
-            text_output_path = os.path.join(question_dir, "question_data.txt")
-            with open(text_output_path, 'w', encoding='utf-8') as f_text:
-                f_text.write(f"题目ID: {q_id}\n题目顺序号: {q_order_index}\n")
-                q_type_code = question.get('type'); q_type_name = get_question_type_name(q_type_code)
-                f_text.write(f"题目类型: {q_type_name}\n\n【题干】:\n")
-                title_html = question.get('title', ''); title_text = get_clean_text_from_html(title_html)
-                f_text.write(title_text + "\n\n")
-                items = question.get('item', [])
-                if items:
-                    f_text.write("【选项】:\n")
-                    for item_obj in items:
-                        item_title_html = item_obj.get('title', '')
-                        option_letter_soup = BeautifulSoup(item_title_html, 'html.parser')
-                        first_p = option_letter_soup.find('p'); option_prefix = ""
-                        if first_p:
-                            p_text = first_p.get_text(strip=True)
-                            if len(p_text) == 1 and p_text.isalpha(): option_prefix = f"{p_text}. "
-                        item_text = get_clean_text_from_html(item_title_html)
-                        if item_text.startswith(option_prefix.strip().rstrip('.')): f_text.write(f"{item_text}\n")
-                        else: f_text.write(f"{option_prefix}{item_text}\n")
-                    f_text.write("\n")
-                correct_info = question.get('correctAnswerAndReplay', {})
-                f_text.write("【正确答案】:\n")
-                correct_answers_list = correct_info.get('correctAnswer', [])
-                if not correct_answers_list: f_text.write("未提供\n")
-                else:
-                    for ans_content in correct_answers_list: f_text.write(f"{get_clean_text_from_html(ans_content)}\n")
-                f_text.write("\n")
-                correct_replay_html = correct_info.get('correctReplay', '')
-                if correct_replay_html: f_text.write(f"【答案解析】:\n{get_clean_text_from_html(correct_replay_html)}\n\n")
-                student_answer_info = question.get('studentAnswer', {})
-                if student_answer_info:
-                    f_text.write(f"【学生答案】:\n{get_clean_text_from_html(student_answer_info.get('answer', ''))}\n")
-                    if student_answer_info.get('grade') is not None: f_text.write(f"得分: {student_answer_info.get('grade')}\n")
-                f_text.write("\n------------------------------------\n")
-            images_to_process = []
-            for i, img_url in enumerate(extract_image_urls_from_html(title_html)):
-                images_to_process.append((img_url, f"title_img_{i+1}"))
-            if items:
-                for item_idx, item_obj in enumerate(items):
-                    item_order_index = item_obj.get('orderIndex', item_idx + 1)
-                    item_title_html_for_img = item_obj.get('title', '')
-                    temp_soup = BeautifulSoup(item_title_html_for_img, 'html.parser')
-                    p_tag = temp_soup.find('p'); prefix_label = str(item_order_index)
-                    if p_tag:
-                        p_text_content = p_tag.get_text(strip=True)
-                        if len(p_text_content) == 1 and p_text_content.isalpha(): prefix_label = p_text_content
-                    for i, img_url in enumerate(extract_image_urls_from_html(item_title_html_for_img)):
-                        images_to_process.append((img_url, f"option_{prefix_label}_img_{i+1}"))
-            for ans_idx, ans_html in enumerate(correct_answers_list):
-                if isinstance(ans_html, str):
-                    for i, img_url in enumerate(extract_image_urls_from_html(ans_html)):
-                        images_to_process.append((img_url, f"correct_answer_{ans_idx+1}_img_{i+1}"))
-            if correct_replay_html and isinstance(correct_replay_html, str):
-                for i, img_url in enumerate(extract_image_urls_from_html(correct_replay_html)):
-                    images_to_process.append((img_url, f"correct_replay_img_{i+1}"))
-            downloaded_urls_in_q = set()
-            for img_url, filename_prefix in images_to_process:
-                if not img_url.startswith(('http://', 'https://')): continue 
-                if img_url in downloaded_urls_in_q: continue
-                parsed_url = urlparse(img_url); original_filename = os.path.basename(parsed_url.path)
-                _, ext = os.path.splitext(original_filename)
-                if not ext or len(ext) > 5: ext = ".png"
-                save_filename = f"{filename_prefix}{ext}"; save_path = os.path.join(question_dir, save_filename)
-                if download_image(img_url, save_path, IMAGE_DOWNLOAD_HEADERS): downloaded_urls_in_q.add(img_url)
-
-def generate_markdown_exam(exam_json_data, exam_main_folder_path, md_file_name_full="完整试卷.md"): 
-    markdown_output_path = os.path.join(exam_main_folder_path, md_file_name_full)
-    with open(markdown_output_path, 'w', encoding='utf-8') as md_file:
-        exam_title = exam_json_data.get("result", {}).get("examTitle", "考试试卷")
-        md_file.write(f"# {exam_title}\n\n") 
-        parts = exam_json_data.get("result", {}).get("part", [])
-        for part_idx, part_data in enumerate(parts):
-            part_name = part_data.get('partname', f'第 {part_idx + 1} 部分')
-            md_file.write(f"## {part_name}\n\n")
-            questions = part_data.get('children', [])
-            for q_idx, question in enumerate(questions):
-                q_order_index = question.get('orderIndex', q_idx + 1)
-                q_id = question.get('questionid', f'unknownID_{q_idx+1}')
-                q_type_code = question.get('type'); q_type_name = get_question_type_name(q_type_code)
-                question_folder_name_for_md = f"question_{q_order_index}_{q_id}"
-                md_file.write(f"### {q_order_index}. ({q_type_name}) (ID: {q_id})\n\n")
-                title_html = question.get('title', ''); title_text = get_clean_text_from_html(title_html)
-                md_file.write(f"**题干:**\n{title_text}\n")
-                question_specific_dir_path = os.path.join(exam_main_folder_path, question_folder_name_for_md)
-                if os.path.exists(question_specific_dir_path):
-                    for img_file in sorted(os.listdir(question_specific_dir_path)):
-                        if img_file.startswith("title_img_"):
-                            img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                            md_file.write(f"![题干图片]({img_path_md})\n")
-                md_file.write("\n")
-                items = question.get('item', [])
-                if items:
-                    md_file.write("**选项:**\n")
-                    for item_idx, item_obj in enumerate(items):
-                        item_order_in_json = item_obj.get('orderIndex', item_idx + 1)
-                        item_html = item_obj.get('title', '')
-                        option_letter_soup = BeautifulSoup(item_html, 'html.parser')
-                        first_p = option_letter_soup.find('p'); option_prefix = ""
-                        option_letter_for_img = str(item_order_in_json)
-                        if first_p:
-                            p_text = first_p.get_text(strip=True)
-                            if len(p_text) == 1 and p_text.isalpha():
-                                option_prefix = f"{p_text}. "; option_letter_for_img = p_text
-                        item_text_cleaned = get_clean_text_from_html(item_html)
-                        if item_text_cleaned.startswith(option_prefix.strip().rstrip('.')): md_file.write(f"- {item_text_cleaned}\n")
-                        else: md_file.write(f"- {option_prefix}{item_text_cleaned}\n")
-                        if os.path.exists(question_specific_dir_path):
-                            for img_file in sorted(os.listdir(question_specific_dir_path)):
-                                if img_file.startswith(f"option_{option_letter_for_img}_img_"):
-                                    img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                                    md_file.write(f"  ![选项图片]({img_path_md})\n")
-                    md_file.write("\n")
-                correct_info = question.get('correctAnswerAndReplay', {})
-                correct_answers_list = correct_info.get('correctAnswer', [])
-                md_file.write("**正确答案:**\n")
-                if not correct_answers_list: md_file.write("未提供\n")
-                else:
-                    for ans_idx, ans_content_html in enumerate(correct_answers_list):
-                        ans_text = get_clean_text_from_html(ans_content_html)
-                        md_file.write(f"{ans_text}\n")
-                        if os.path.exists(question_specific_dir_path):
-                            for img_file in sorted(os.listdir(question_specific_dir_path)):
-                                if img_file.startswith(f"correct_answer_{ans_idx+1}_img_"):
-                                    img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                                    md_file.write(f"![答案图片]({img_path_md})\n")
-                md_file.write("\n")
-                correct_replay_html = correct_info.get('correctReplay', '')
-                if correct_replay_html:
-                    md_file.write("**答案解析:**\n"); replay_text = get_clean_text_from_html(correct_replay_html)
-                    md_file.write(f"{replay_text}\n")
-                    if os.path.exists(question_specific_dir_path):
-                        for img_file in sorted(os.listdir(question_specific_dir_path)):
-                            if img_file.startswith("correct_replay_img_"):
-                                img_path_md = os.path.join(question_folder_name_for_md, img_file).replace("\\", "/")
-                                md_file.write(f"![解析图片]({img_path_md})\n")
-                    md_file.write("\n")
-                md_file.write("---\n\n")
-    print(f"Markdown 试卷已生成: {os.path.abspath(markdown_output_path)}")
-
-def generate_tex_exam(exam_json_data, exam_main_folder_path, tex_file_name_full="完整试卷.tex"): 
-    tex_output_path = os.path.join(exam_main_folder_path, tex_file_name_full) # Use the full name passed
-    with open(tex_output_path, 'w', encoding='utf-8') as tex_file:
-        tex_file.write(r"\documentclass[12pt]{article}" + "\n")
-        tex_file.write(r"\usepackage[UTF8]{ctex}" + "\n")
-        tex_file.write(r"\usepackage{graphicx}" + "\n")
-        tex_file.write(r"\usepackage{amsmath, amsfonts, amssymb}" + "\n")
-        tex_file.write(r"\usepackage[a4paper, margin=1in]{geometry}" + "\n")
-        tex_file.write(r"\usepackage{enumitem}" + "\n")
-        tex_file.write(r"\usepackage{hyperref}" + "\n")
-        tex_file.write(r"\hypersetup{colorlinks=true, linkcolor=blue, urlcolor=blue, citecolor=green}" + "\n")
-        tex_file.write(r"\usepackage{array}\usepackage{longtable}" + "\n")
-        exam_title_raw = exam_json_data.get("result", {}).get("examTitle", "考试试卷")
-        exam_title_tex = escape_latex_special_chars(exam_title_raw)
-        tex_file.write(f"\\title{{{exam_title_tex}}}\n")
-        tex_file.write(f"\\author{{优学院导出}}\n")
-        tex_file.write(f"\\date{{{datetime.date.today().strftime('%Y-%m-%d')}}}\n")
-        tex_file.write(r"\begin{document}" + "\n")
-        tex_file.write(r"\maketitle" + "\n\n")
-        parts = exam_json_data.get("result", {}).get("part", [])
-        for part_idx, part_data in enumerate(parts):
-            part_name_raw = part_data.get('partname', f'第 {part_idx + 1} 部分')
-            part_name_tex = escape_latex_special_chars(part_name_raw)
-            tex_file.write(f"\\section*{{{part_name_tex}}}\n\\hrulefill\n\n")
-            questions = part_data.get('children', [])
-            for q_idx, question in enumerate(questions):
-                q_order_index = question.get('orderIndex', q_idx + 1)
-                q_id = question.get('questionid', f'unknownID_{q_idx+1}')
-                q_type_code = question.get('type'); q_type_name_raw = get_question_type_name(q_type_code)
-                q_type_name_tex = escape_latex_special_chars(q_type_name_raw)
-                question_folder_name_for_tex = f"question_{q_order_index}_{q_id}"
-                tex_file.write(f"\\subsection*{{{q_order_index}. ({q_type_name_tex}) \\small ID: {q_id}}}\n\n")
-                def write_tex_content_with_images(label_raw, content_html, image_prefix, question_specific_dir, img_alt_text):
-                    content_text_raw = get_clean_text_from_html(content_html)
-                    content_text_tex = escape_latex_special_chars(content_text_raw).replace('\n\n', '\n\\par\n')
-                    if label_raw: tex_file.write(f"\\textbf{{{escape_latex_special_chars(label_raw)}:}}\n\n{content_text_tex}\n")
-                    else: tex_file.write(f"{content_text_tex}\n")
-                    if os.path.exists(question_specific_dir):
-                        for img_file in sorted(os.listdir(question_specific_dir)):
-                            if img_file.startswith(image_prefix):
-                                img_path_tex = os.path.join(question_folder_name_for_tex, img_file).replace("\\", "/")
-                                tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.8\\textwidth, height=0.25\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
-                    tex_file.write("\n")
-                question_specific_dir_path = os.path.join(exam_main_folder_path, question_folder_name_for_tex)
-                write_tex_content_with_images("题干", question.get('title', ''), "title_img_", question_specific_dir_path, "题干图片")
-                items = question.get('item', [])
-                if items:
-                    tex_file.write(f"\\textbf{{{escape_latex_special_chars('选项')}:}}\n")
-                    tex_file.write("\\begin{itemize}[leftmargin=*]\n")
-                    for item_idx, item_obj in enumerate(items):
-                        item_order_in_json = item_obj.get('orderIndex', item_idx + 1)
-                        item_html = item_obj.get('title', '')
-                        option_letter_soup = BeautifulSoup(item_html, 'html.parser')
-                        first_p = option_letter_soup.find('p'); option_prefix_raw = ""
-                        option_letter_for_img_name = str(item_order_in_json)
-                        if first_p:
-                            p_text = first_p.get_text(strip=True)
-                            if len(p_text) == 1 and p_text.isalpha():
-                                option_prefix_raw = f"{p_text}. "; option_letter_for_img_name = p_text
-                        item_text_cleaned_raw = get_clean_text_from_html(item_html)
-                        full_option_text_raw = item_text_cleaned_raw
-                        if option_prefix_raw and not item_text_cleaned_raw.startswith(option_prefix_raw.strip().rstrip('.')):
-                            full_option_text_raw = option_prefix_raw + item_text_cleaned_raw
-                        tex_file.write(f"  \\item ")
-                        write_tex_content_with_images(None, full_option_text_raw, f"option_{option_letter_for_img_name}_img_", question_specific_dir_path, "选项图片")
-                    tex_file.write("\\end{itemize}\n\n")
-                correct_info = question.get('correctAnswerAndReplay', {})
-                correct_answers_list = correct_info.get('correctAnswer', [])
-                tex_file.write(f"\\textbf{{{escape_latex_special_chars('正确答案')}:}}\n")
-                if not correct_answers_list: tex_file.write(escape_latex_special_chars("未提供") + "\n")
-                else:
-                    for ans_idx, ans_content_html in enumerate(correct_answers_list):
-                        ans_text_raw = get_clean_text_from_html(ans_content_html)
-                        ans_text_tex = escape_latex_special_chars(ans_text_raw).replace('\n\n', '\n\\par\n')
-                        tex_file.write(f"{ans_text_tex}\n")
-                        if os.path.exists(question_specific_dir_path):
-                            for img_file in sorted(os.listdir(question_specific_dir_path)):
-                                if img_file.startswith(f"correct_answer_{ans_idx+1}_img_"):
-                                    img_path_tex = os.path.join(question_folder_name_for_tex, img_file).replace("\\", "/")
-                                    tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.7\\textwidth, height=0.2\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
-                tex_file.write("\n")
-                correct_replay_html = correct_info.get('correctReplay', '')
-                if correct_replay_html:
-                    write_tex_content_with_images("答案解析", correct_replay_html, "correct_replay_img_", question_specific_dir_path, "解析图片")
-                tex_file.write("\\vspace{0.5em}\\hrulefill\\vspace{1em}\n\n")
+        image_index = stream_export(exam, base_exam_dir, engine, selected_renderers(), stem, metrics, postprocessor,
+                                    [bank_writer], selection=selection)
+    finally:
+        if own_engine: engine.close()
+        if postprocessor: postprocessor.close()
+    if postprocessor: print(postprocessor.summary(), end="")
+    update_question_bank(exam_id, exam.title, base_exam_dir, bank_rows, metrics, prune=not selection.partial)
+    return image_index
+
+def archive_export_exam(exam, base_exam_dir, stem, engine=None, metrics=None, exam_id=None):
+    """
+    Archive export (``--archive``): the exam goes into ``<base_exam_dir>.zip`` as one sequential stream:
+    the question texts, then the images as they finish downloading, then the exam files of the selected
+    formats, image_index.json and export_metrics.json. Nothing is written to the exam folder. Returns the archive path.
+    """
+    archive_path = base_exam_dir + ARCHIVE_SUFFIX
+    with ExamArchive(archive_path, base_exam_dir) as archive:
+        with metrics.stage("process_exam_data"):
+            image_index = process_exam_data(exam, base_exam_dir, engine, metrics, exam_id, archive=archive)
+        render_exam_files(exam, base_exam_dir, stem, metrics, image_index, archive)
+        archive.write_text(METRICS_FILENAME, json.dumps(metrics.to_dict(), ensure_ascii=False, indent=1))
+        entries = archive.entries
+    print(f"Archive written: {os.path.abspath(archive_path)} ({entries} entries, {os.path.getsize(archive_path) / 1024:.0f} KiB)")
+    return archive_path
+
+def link_bank_images(entry, images_dir):
+    """Hardlinks the entry's images into the bank folder; returns their paths relative to it."""
+    rel_paths = []
+    for image_path in entry.image_paths:
+        if not os.path.isfile(image_path): continue
+        file_name = f"{entry.fingerprint[:12]}_{os.path.basename(image_path)}"
+        BlobStore.materialize(image_path, os.path.join(images_dir, file_name))
+        rel_paths.append(f"images/{file_name}")
+    return rel_paths
+
+def write_markdown_bank_entry(md_file, number, entry, image_paths):
+    md_file.write(f"### {number}. ({entry.type_name}) (ID: {entry.question_id})\n\n")
+    md_file.write(f"*出现于: {'、'.join(entry.exams)}*\n\n")
+    md_file.write(f"**题干:**\n{entry.title}\n")
+    for img_path_md in image_paths: md_file.write(f"![题目图片]({img_path_md})\n")
+    md_file.write("\n")
+    if entry.options: md_file.write("**选项:**\n" + "".join(f"- {option}\n" for option in entry.options) + "\n")
+    md_file.write(f"**正确答案:**\n{entry.answers or '未提供'}\n\n")
+    if entry.replay: md_file.write(f"**答案解析:**\n{entry.replay}\n\n")
+    md_file.write("---\n\n")
+
+def write_tex_bank_entry(tex_file, number, entry, image_paths):
+    tex_file.write(f"\\subsection*{{{number}. ({escape_latex_special_chars(entry.type_name)}) \\small ID: {entry.question_id}}}\n\n")
+    tex_file.write(f"\\textit{{{escape_latex_special_chars('出现于: ' + '、'.join(entry.exams))}}}\n\n")
+    tex_file.write(f"\\textbf{{{escape_latex_special_chars('题干')}:}}\n\n{text_to_tex(entry.title)}\n")
+    for img_path_tex in image_paths:
+        tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.8\\textwidth, height=0.25\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
+    tex_file.write("\n")
+    if entry.options:
+        tex_file.write(f"\\textbf{{{escape_latex_special_chars('选项')}:}}\n\\begin{{itemize}}[leftmargin=*]\n")
+        for option in entry.options: tex_file.write(f"  \\item {text_to_tex(option)}\n")
+        tex_file.write("\\end{itemize}\n\n")
+    tex_file.write(f"\\textbf{{{escape_latex_special_chars('正确答案')}:}}\n")
+    tex_file.write(f"{text_to_tex(entry.answers) if entry.answers else escape_latex_special_chars('未提供')}\n\n")
+    if entry.replay:
+        tex_file.write(f"\\textbf{{{escape_latex_special_chars('答案解析')}:}}\n\n{text_to_tex(entry.replay)}\n\n")
+    tex_file.write("\\vspace{0.5em}\\hrulefill\\vspace{1em}\n\n")
+
+def generate_dedup_bank(output_dir=DEDUP_BANK_DIR):
+    """
+    Writes 题库.md and 题库.tex with every distinct question of all exports once (by fingerprint),
+    grouped by type, from the texts stored in the question bank (no report is parsed again). Images
+    are hardlinked into the bank's images folder.
+    """
+    if not QUESTION_BANK_PATH or not os.path.exists(QUESTION_BANK_PATH):
+        print(f"题库不存在: {QUESTION_BANK_PATH}，请先导出考试。"); return None
+    started = time.perf_counter()
+    with QuestionBank(QUESTION_BANK_PATH) as bank:
+        entries = bank.unique_questions(); total = bank.count()
+    images_dir = os.path.join(output_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    markdown_output_path = os.path.join(output_dir, "题库.md")
+    tex_output_path = os.path.join(output_dir, "题库.tex")
+    with open(markdown_output_path, 'w', encoding='utf-8') as md_file, open(tex_output_path, 'w', encoding='utf-8') as tex_file:
+        md_file.write(f"# 题库 (共 {len(entries)} 题)\n\n")
+        write_tex_preamble(tex_file, "题库")
+        current_type = None
+        for number, entry in enumerate(entries, 1):
+            if entry.type_code != current_type:
+                current_type = entry.type_code
+                md_file.write(f"## {entry.type_name}\n\n")
+                tex_file.write(f"\\section*{{{escape_latex_special_chars(entry.type_name)}}}\n\\hrulefill\n\n")
+            image_paths = link_bank_images(entry, images_dir)
+            write_markdown_bank_entry(md_file, number, entry, image_paths)
+            write_tex_bank_entry(tex_file, number, entry, image_paths)
         tex_file.write(r"\end{document}" + "\n")
-    print(f"TeX 试卷已生成: {os.path.abspath(tex_output_path)}")
+    print(f"去重题库: {len(entries)} 道不同的题目 (共 {total} 道已导出题目)，用时 {time.perf_counter() - started:.2f}s")
+    print(f"Markdown 题库已生成: {os.path.abspath(markdown_output_path)}")
+    print(f"TeX 题库已生成: {os.path.abspath(tex_output_path)}")
+    return output_dir
+
+def load_exam_report(exam_id, trace_id, auth_token, api_client=None, offline=False, use_cache=True):
+    """Returns the report from the cache when fresh (any age when offline), else fetches and caches it."""
+    report_cache = ReportCache(REPORT_CACHE_DIR, REPORT_CACHE_TTL_SECONDS)
+    if use_cache or offline:
+        cached = report_cache.load(exam_id, trace_id, max_age=float('inf') if offline else None)
+        if cached:
+            print(f"Using cached exam report for examId: {exam_id} (fetched {cached.age_seconds / 60:.0f} min ago).")
+            return cached.report
+    if offline: print(f"离线模式: 没有考试 {exam_id} (traceId {trace_id}) 的缓存报告。"); return None
+    exam_data = get_exam_report(exam_id, trace_id, auth_token, API_HEADERS, client=api_client)
+    if exam_data and exam_data.get("result"): report_cache.store(exam_id, trace_id, exam_data)
+    return exam_data
+
+def export_exam(exam_id, trace_id, auth_token, api_client=None, engine=None, offline=False, use_cache=True, profile=False,
+                render_pool=None):
+    """
+    Fetches, exports and renders one exam; returns its output folder, or None if the report could not be fetched.
+    ``offline`` re-renders Markdown/TeX from the cached report and the images already on disk, without network.
+    With a ``render_pool`` the images are downloaded first and Markdown and TeX are then rendered in worker
+    processes, one task per format, instead of streaming in this thread.
+    Timings are written to export_metrics.json in the exam folder; ``profile`` also dumps a cProfile of the export.
+    With EXPORT_ARCHIVE (not offline, no render pool) the exam is written as one ZIP and its path is returned.
+    """
+    from ulearning_export.exporter import exam_output_names
+    from ulearning_export.http_client import HttpClient
+    from ulearning_export.model import normalize_exam, stream_exam
+    from ulearning_export.render_pool import RenderTask
+    metrics = ExportMetrics(label=f"exam {exam_id}")
+    with metrics.stage("fetch_report"):
+        exam_data = load_exam_report(exam_id, trace_id, auth_token, api_client or HttpClient(metrics=metrics), offline, use_cache)
+    if not exam_data: print(f"未能获取考试数据 (examId: {exam_id})。"); return None
+
+    selection = export_selection()
+    current_exam_dir_name, stem = exam_output_names(exam_id, exam_data, selection)
+    current_exam_output_dir = os.path.join(BASE_OUTPUT_DIR, current_exam_dir_name)
+    use_archive = EXPORT_ARCHIVE and not offline and render_pool is None
+    if use_archive: os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
+    else: os.makedirs(current_exam_output_dir, exist_ok=True)
+    print(f"\n数据将保存到: {current_exam_output_dir + ARCHIVE_SUFFIX if use_archive else current_exam_output_dir}")
+    if selection.partial or not selection.images: print(f"Selective export: {selection.describe()}")
+
+    def render():
+        if use_archive:
+            with metrics.stage("parse"): exam = normalize_exam(exam_data, selection)
+            archive_export_exam(exam, current_exam_output_dir, stem, engine, metrics, exam_id)
+        elif render_pool is not None:
+            with metrics.stage("parse"): exam = normalize_exam(exam_data, selection)
+            if not offline:
+                with metrics.stage("process_exam_data"):
+                    process_exam_data(exam, current_exam_output_dir, engine, metrics, exam_id)
+            else:
+                update_question_bank(exam_id, exam.title, current_exam_output_dir,
+                                     question_bank_rows(exam, ImageIndex.load(current_exam_output_dir)), metrics,
+                                     prune=not selection.partial)
+            tasks = [RenderTask(renderer.name, functools.partial(render_exam, renderer.name), renderer.output_name(stem))
+                     for renderer in split_renderers(selected_renderers())[1]]
+            render_pool.render(exam, current_exam_output_dir, tasks, metrics)
+        elif offline: # Re-render only: every HTML fragment is parsed here, once
+            with metrics.stage("parse"): exam = normalize_exam(exam_data, selection)
+            image_index = ImageIndex.load(current_exam_output_dir)
+            render_exam_files(exam, current_exam_output_dir, stem, metrics, image_index)
+            update_question_bank(exam_id, exam.title, current_exam_output_dir, question_bank_rows(exam, image_index), metrics,
+                                 prune=not selection.partial)
+        else: # Questions stream from the JSON through downloads into the selected writers
+            stream_export_exam(stream_exam(exam_data, selection), current_exam_output_dir, stem, engine, metrics, exam_id)
+    profile_path = (f"{current_exam_output_dir}_{PROFILE_FILENAME}" if use_archive
+                    else os.path.join(current_exam_output_dir, PROFILE_FILENAME))
+    profiled(render, profile, profile_path, lambda message: print(message, end=""))
+
+    print(metrics.summary_line(), end="")
+    if use_archive: return current_exam_output_dir + ARCHIVE_SUFFIX # Metrics are inside the archive
+    print(f"Metrics written to {os.path.abspath(metrics.save(current_exam_output_dir))}")
+    return current_exam_output_dir
+
+def run_batch_export(jobs, auth_token, parallel_exams, offline=False, use_cache=True, profile=False, render_processes=0):
+    """
+    Exports many exams concurrently with one shared API client and one shared image engine. Their HTTP
+    metrics cover the whole batch and are written to batch_metrics.json; each exam still gets its own
+    export_metrics.json with stage and question timings. ``render_processes`` > 0 renders every
+    (exam, format) pair in a shared process pool of that size.
+    """
+    from ulearning_export.download import create_session
+    from ulearning_export.render_pool import RenderPool
+    started = time.perf_counter()
+    batch_metrics = ExportMetrics(label="batch")
+    render_pool = RenderPool(render_processes) if render_processes > 0 else None
+    try:
+        with create_session(API_HEADERS, pool_size=parallel_exams) as api_session, create_image_engine(batch_metrics) as engine:
+            api_client = engine.client.with_session(api_session) # Shares the retry budget and per-host limits
+            results = run_batch(jobs, lambda job: export_exam(job.exam_id, job.trace_id, auth_token, api_client, engine,
+                                                              offline, use_cache, profile, render_pool),
+                                max_parallel=parallel_exams)
+    finally:
+        if render_pool: render_pool.close()
+    total_seconds = time.perf_counter() - started
+    batch_metrics.save(BASE_OUTPUT_DIR, "batch_metrics.json")
+    print("\n" + format_summary(results, total_seconds), end="")
+    print(f"汇总报告: {os.path.abspath(write_summary(results, total_seconds, BASE_OUTPUT_DIR))}")
+    return results
+
+def compile_exam_pdfs(exam_dirs, pdf_workers=DEFAULT_PDF_WORKERS):
+    """Optional post-export stage: compiles the TeX files of the exported exam folders to PDF in parallel."""
+    tex_paths = [tex_path for exam_dir in exam_dirs if exam_dir and os.path.isdir(exam_dir) # Archives are skipped
+                 for tex_path in find_tex_files(exam_dir)]
+    compile_tex_files(tex_paths, max_workers=pdf_workers)
+
+def search_question_bank(query, limit=DEFAULT_SEARCH_LIMIT):
+    if not QUESTION_BANK_PATH or not os.path.exists(QUESTION_BANK_PATH):
+        print(f"题库不存在: {QUESTION_BANK_PATH}，请先导出考试。"); return
+    with QuestionBank(QUESTION_BANK_PATH) as bank:
+        started = time.perf_counter()
+        hits = bank.search(query, limit)
+        print(format_hits(hits), end="")
+        print(f"{len(hits)} result(s) among {bank.count()} questions in {(time.perf_counter() - started) * 1000:.1f} ms.")
+
+def parse_formats(value):
+    """``--formats tex,images`` -> format names; unknown formats are an argparse error."""
+    try: return normalize_formats([name for name in value.split(",") if name.strip()])
+    except ValueError as e: raise argparse.ArgumentTypeError(str(e))
+
+def selection_argument(parse):
+    """argparse ``type`` for a selection option: the parser's ValueError message becomes the usage error."""
+    def parse_argument(value):
+        try: return parse(value)
+        except ValueError as e: raise argparse.ArgumentTypeError(str(e))
+    return parse_argument
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="优学院考试数据导出工具 (文本、图片、Markdown、TeX)")
+    parser.add_argument("--exam", action="append", default=[], type=parse_exam_spec, metavar="EXAM_ID:TRACE_ID",
+                        help="要导出的考试，可重复指定以批量导出")
+    parser.add_argument("--jobs", metavar="FILE", help="批量任务文件: 每行一个 'examId traceId'，或 JSON 列表")
+    parser.add_argument("--token", help="Authorization Token (默认使用脚本开头的 AUTHORIZATION_TOKEN)")
+    parser.add_argument("--parallel-exams", type=int, default=DEFAULT_PARALLEL_EXAMS, help="批量模式下同时导出的考试数量")
+    parser.add_argument("--offline", action="store_true",
+                        help="离线重新生成: 只用缓存的考试报告和已下载的图片重新生成 Markdown/TeX，不访问网络")
+    parser.add_argument("--no-cache", action="store_true", help="忽略缓存，重新请求考试报告")
+    parser.add_argument("--render-processes", type=int, default=0, metavar="N",
+                        help="批量模式下用 N 个进程并行生成 Markdown/TeX (每个考试的每种格式一个任务)；默认 0 表示在导出线程中边下载边生成")
+    parser.add_argument("--pdf", action="store_true",
+                        help="导出后用本机的 latexmk/xelatex 并行编译 TeX 为 PDF (TeX 未变化时跳过，辅助文件放在 .build 中)")
+    parser.add_argument("--pdf-workers", type=int, default=DEFAULT_PDF_WORKERS, help="同时编译的 TeX 文件数")
+    parser.add_argument("--revalidate-images", action="store_true",
+                        help="用条件请求 (If-None-Match/If-Modified-Since) 重新检查已下载的图片，服务器上有变化时才重新下载")
+    parser.add_argument("--max-image-mb", type=float, metavar="MB",
+                        help="单张图片的大小上限，超过则下载失败 (默认 50 MB)")
+    parser.add_argument("--optimize-images", action="store_true",
+                        help="图片后处理: 按文件头修正扩展名，无损重新压缩 PNG，把 TeX 不支持的格式转为 PNG (另存为 *.print.*，需要 Pillow)")
+    parser.add_argument("--max-dpi", type=int, metavar="DPI",
+                        help="图片后处理: 把 TeX 中用到的图片缩小到打印尺寸下不超过 DPI (需要 Pillow)")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="图片后处理: 生成缩略图，Markdown 中显示缩略图并链接到原图 (需要 Pillow)")
+    parser.add_argument("--archive", action="store_true",
+                        help="每个考试导出为一个 ZIP 文件 (exam_<id>_<标题>.zip)，而不是包含大量小文件的文件夹；不适用于 --offline 和 --render-processes")
+    parser.add_argument("--formats", type=parse_formats, metavar="FORMATS",
+                        help=f"要生成的输出格式，逗号分隔 (可选: {', '.join(format_names())}；默认全部)，未选的格式完全不生成；"
+                             "不选 images 时不下载图片，Markdown/TeX 只引用之前已下载的图片")
+    parser.add_argument("--parts", type=selection_argument(parse_number_list), metavar="1,3",
+                        help="只导出这些部分 (从 1 开始，与日志中的 Part 编号一致)；选择了部分、题号或题型时，试卷文件名带有选择标记，不会覆盖完整试卷")
+    parser.add_argument("--questions", type=selection_argument(parse_ranges), metavar="1-10,15",
+                        help="只导出题目顺序号 (orderIndex) 在这些范围内的题目")
+    parser.add_argument("--types", type=selection_argument(parse_number_list), metavar="1,2",
+                        help="只导出这些题型 (1 单选题, 2 多选题, 3 不定项选择题, 4 判断题, 5 填空题/简答题)")
+    parser.add_argument("--search", metavar="TEXT",
+                        help="在题库 (所有已导出考试的题目) 中搜索题干、选项、答案和解析，多个词用空格分隔，不导出")
+    parser.add_argument("--search-limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="搜索结果的最大数量")
+    parser.add_argument("--dedup-bank", action="store_true",
+                        help=f"用题库生成去重的合并题库 ({DEDUP_BANK_DIR}/题库.md 和 .tex)；与 --exam/--jobs 一起使用时在批量导出后生成，否则只生成题库")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"用 cProfile 分析导出过程，结果保存为考试文件夹中的 {PROFILE_FILENAME}")
+    return parser.parse_args()
 
 def main():
-    global EXAM_ID, TRACE_ID, AUTHORIZATION_TOKEN, API_HEADERS
+    global EXAM_ID, TRACE_ID, AUTHORIZATION_TOKEN, API_HEADERS, IMAGE_OPTIMIZE, IMAGE_MAX_DPI, IMAGE_THUMBNAILS, EXPORT_ARCHIVE
+    global IMAGE_MAX_BYTES, IMAGE_REVALIDATE, EXPORT_FORMATS, EXPORT_PARTS, EXPORT_QUESTIONS, EXPORT_TYPES
+    args = parse_args()
     print("--- 优学院考试数据导出工具 (文本、图片、Markdown、TeX) ---")
+    IMAGE_OPTIMIZE = IMAGE_OPTIMIZE or args.optimize_images
+    IMAGE_MAX_DPI = args.max_dpi or IMAGE_MAX_DPI
+    IMAGE_THUMBNAILS = IMAGE_THUMBNAILS or args.thumbnails
+    EXPORT_ARCHIVE = EXPORT_ARCHIVE or args.archive
+    IMAGE_REVALIDATE = IMAGE_REVALIDATE or args.revalidate_images
+    if args.max_image_mb: IMAGE_MAX_BYTES = int(args.max_image_mb * 1024 * 1024)
+    if args.formats is not None: EXPORT_FORMATS = args.formats
+    if args.parts is not None: EXPORT_PARTS = args.parts
+    if args.questions is not None: EXPORT_QUESTIONS = args.questions
+    if args.types is not None: EXPORT_TYPES = args.types
+    if args.search is not None: search_question_bank(args.search, args.search_limit); return
+
+    if args.token: AUTHORIZATION_TOKEN = args.token
+    batch_jobs = list(args.exam)
+    if args.jobs: batch_jobs.extend(load_jobs_file(args.jobs))
+    if args.dedup_bank and not batch_jobs: generate_dedup_bank(); return
+
+    if batch_jobs and args.offline:
+        results = run_batch_export(batch_jobs, AUTHORIZATION_TOKEN, args.parallel_exams, offline=True, profile=args.profile,
+                                   render_processes=args.render_processes)
+        if args.pdf: compile_exam_pdfs([r.output_dir for r in results if r.ok], args.pdf_workers)
+        if args.dedup_bank: generate_dedup_bank()
+        return
+    if batch_jobs:
+        if not AUTHORIZATION_TOKEN: AUTHORIZATION_TOKEN = input("请输入 Authorization Token: ").strip()
+        if not AUTHORIZATION_TOKEN: print("错误: Token不能为空。"); return
+        API_HEADERS["authorization"] = AUTHORIZATION_TOKEN
+        results = run_batch_export(batch_jobs, AUTHORIZATION_TOKEN, args.parallel_exams, use_cache=not args.no_cache,
+                                   profile=args.profile, render_processes=args.render_processes)
+        if args.pdf: compile_exam_pdfs([r.output_dir for r in results if r.ok], args.pdf_workers)
+        if args.dedup_bank: generate_dedup_bank()
+        return
 
     if not EXAM_ID: EXAM_ID = input("请输入 Exam ID: ").strip()
     if not TRACE_ID: TRACE_ID = input("请输入 Trace ID: ").strip()
+    if args.offline:
+        if not all([EXAM_ID, TRACE_ID]): print("错误: ID不能为空。"); return
+        current_exam_output_dir = export_exam(EXAM_ID, TRACE_ID, AUTHORIZATION_TOKEN, offline=True, profile=args.profile)
+        if current_exam_output_dir: print(f"\n--- 离线重新生成完成: {os.path.abspath(current_exam_output_dir)} ---")
+        if current_exam_output_dir and args.pdf: compile_exam_pdfs([current_exam_output_dir], args.pdf_workers)
+        return
     if not AUTHORIZATION_TOKEN: AUTHORIZATION_TOKEN = input("请输入 Authorization Token: ").strip()
 
     if not all([EXAM_ID, TRACE_ID, AUTHORIZATION_TOKEN]): print("错误: ID和Token不能为空。"); return
@@ -399,31 +517,12 @@ def main():
     # AUTHORIZATION_TOKEN = refreshed_token # If new token is reliably returned
     # API_HEADERS["authorization"] = AUTHORIZATION_TOKEN
 
-    exam_data = get_exam_report(EXAM_ID, TRACE_ID, AUTHORIZATION_TOKEN, API_HEADERS)
-    if not exam_data: print("未能获取考试数据。"); return
-
-
-    exam_title_raw = exam_data.get("result", {}).get("examTitle", "UnknownExam")
-
-    sanitized_exam_title_for_folder = sanitize_filename(exam_title_raw) 
-    
-    current_exam_dir_name = f"exam_{EXAM_ID}_{sanitized_exam_title_for_folder}"
-    current_exam_output_dir = os.path.join(BASE_OUTPUT_DIR, current_exam_dir_name)
-    os.makedirs(current_exam_output_dir, exist_ok=True)
-    print(f"\n数据将保存到: {current_exam_output_dir}")
-
-    process_exam_data(exam_data, current_exam_output_dir)
-    
-
-    md_filename = f"{sanitized_exam_title_for_folder}_完整试卷.md"
-    tex_filename = f"{sanitized_exam_title_for_folder}_完整试卷.tex"
-
-
-    generate_markdown_exam(exam_data, current_exam_output_dir, md_file_name_full=md_filename)
-    generate_tex_exam(exam_data, current_exam_output_dir, tex_file_name_full=tex_filename)
+    current_exam_output_dir = export_exam(EXAM_ID, TRACE_ID, AUTHORIZATION_TOKEN, use_cache=not args.no_cache, profile=args.profile)
+    if not current_exam_output_dir: return
+    if args.pdf: compile_exam_pdfs([current_exam_output_dir], args.pdf_workers)
 
     print("\n--- 数据导出与试卷生成处理完成 ---")
     print(f"请检查输出目录: {os.path.abspath(current_exam_output_dir)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,12 @@
+"""
+Unit tests: ``python -m pytest tests``.
+
+The repository has no package metadata, so the tests import
+``ulearning_export`` and the benchmark helpers from the checkout.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+sys.path.insert(0, REPO_ROOT)
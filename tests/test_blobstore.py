@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+
+from ulearning_export.blobstore import URL_INDEX_FILENAME, BlobStore
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def writer(data, calls=None):
+    def fetch(tmp_path):
+        if calls is not None: calls.append(tmp_path)
+        with open(tmp_path, 'wb') as f: f.write(data)
+        return sha256(data), ("info", len(data))
+    return fetch
+
+
+def read(path):
+    with open(path, 'rb') as f: return f.read()
+
+
+def test_get_or_fetch_fetches_each_url_once(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    calls = []
+    blob_path, info = store.get_or_fetch("http://h/a.png", ".png", writer(b"A", calls))
+    assert info == ("info", 1) and read(blob_path) == b"A"
+    assert os.path.basename(blob_path) == sha256(b"A") + ".png"
+    assert store.get_or_fetch("http://h/a.png", ".png", writer(b"other", calls)) == (blob_path, None)
+    assert len(calls) == 1
+    assert not [name for name in os.listdir(store.root_dir) if name.endswith(".part")]
+
+
+def test_same_bytes_under_two_urls_share_a_blob(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first, _ = store.get_or_fetch("http://h/a.png", ".png", writer(b"same"))
+    second, info = store.get_or_fetch("http://h/b.png", ".png", writer(b"same"))
+    assert first == second and info is not None
+    assert sorted(name for name in os.listdir(str(tmp_path)) if name.endswith(".png")) == [sha256(b"same") + ".png"]
+
+
+def test_failed_fetch_leaves_nothing(tmp_path):
+    store = BlobStore(str(tmp_path))
+    def fail(tmp_path):
+        with open(tmp_path, 'wb') as f: f.write(b"partial")
+        raise OSError("connection reset")
+    try: store.get_or_fetch("http://h/a.png", ".png", fail)
+    except OSError: pass
+    assert store.lookup_url("http://h/a.png") is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_materialize_links_and_replaces(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    blob_path, _ = store.get_or_fetch("http://h/a.png", ".png", writer(b"A"))
+    dest = tmp_path / "question_1" / "title_img_1.png"
+    dest.parent.mkdir()
+    dest.write_bytes(b"stale")
+    BlobStore.materialize(blob_path, str(dest))
+    assert read(str(dest)) == b"A"
+    assert os.path.samefile(blob_path, str(dest)) # Hardlinked on this filesystem
+    BlobStore.materialize(blob_path, str(dest)) # Already the blob: kept
+    assert read(str(dest)) == b"A"
+
+
+def test_adopt_replaces_the_urls_blob(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    old_blob, _ = store.get_or_fetch("http://h/a.png", ".png", writer(b"old"))
+    store.get_or_fetch("http://h/b.png", ".png", writer(b"old"))
+    downloaded = tmp_path / "title_img_1.png"
+    downloaded.write_bytes(b"new")
+    new_blob = store.adopt("http://h/a.png", str(downloaded), sha256(b"new"))
+    assert store.lookup_url("http://h/a.png") == new_blob and read(new_blob) == b"new"
+    assert store.lookup_url("http://h/b.png") == old_blob and read(old_blob) == b"old" # Still used by b.png
+
+    again = tmp_path / "copy.png"
+    again.write_bytes(b"new")
+    assert store.adopt("http://h/c.png", str(again), sha256(b"new")) == new_blob # Existing blob: linked, not re-added
+    assert os.path.samefile(new_blob, str(again))
+
+
+def test_save_and_reload(tmp_path):
+    root = str(tmp_path / "blobs")
+    store = BlobStore(root)
+    store.save() # Nothing added: no index written
+    assert not os.path.exists(os.path.join(root, URL_INDEX_FILENAME))
+    blob_path, _ = store.get_or_fetch("http://h/a.png", ".png", writer(b"A"))
+    store.put_bytes("http://h/b.jpg", ".jpg", b"B")
+    store.save()
+    reloaded = BlobStore(root)
+    assert reloaded.lookup_url("http://h/a.png") == blob_path
+    assert read(reloaded.lookup_url("http://h/b.jpg")) == b"B"
+    os.remove(blob_path)
+    assert reloaded.lookup_url("http://h/a.png") is None # Index entry without its blob
+
+
+def test_corrupt_index_is_ignored(tmp_path):
+    (tmp_path / URL_INDEX_FILENAME).write_text("{not json", encoding='utf-8')
+    assert BlobStore(str(tmp_path)).lookup_url("http://h/a.png") is None
+
+
+def test_concurrent_saves_use_their_own_temp_files(tmp_path):
+    root = str(tmp_path)
+    stores = [BlobStore(root) for _ in range(4)]
+    for i, store in enumerate(stores): store.put_bytes(f"http://h/{i}.png", ".png", bytes([i]))
+    errors = []
+    def save_repeatedly(store):
+        try:
+            for _ in range(50):
+                store._dirty = True
+                store.save()
+        except OSError as e: errors.append(e)
+    threads = [threading.Thread(target=save_repeatedly, args=(store,)) for store in stores]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    assert not [name for name in os.listdir(root) if name.endswith(".tmp")]
+    assert len(BlobStore(root)._url_index) == 1 # Separate stores: the last save wins (share one store instead)
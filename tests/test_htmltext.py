@@ -0,0 +1,62 @@
+"""``htmltext`` must convert every fragment exactly like the BeautifulSoup implementation it replaced."""
+import pytest
+
+pytest.importorskip("bs4")
+
+from htmltext_parity import EDGE_CASES, fast_parse, fuzz_fragments, reference_parse, report_fragments  # noqa: E402
+from mock_utestapi import MockConfig, build_exam_report  # noqa: E402
+from ulearning_export import htmltext  # noqa: E402
+
+FRAGMENTS = {
+    "nested_lists": "<ol><li>一<ul><li>a</li><li>b<ol><li>深</li></ol></li></ul></li><li>二</li></ol>",
+    "unclosed_lists": "<ul><li>a<li>b<ul><li>c</ul>tail",
+    "entities": "<p>&lt;x&gt; &amp; &quot;y&quot;&nbsp;&copy; &#65;&#x42; &notanentity; &amp</p>",
+    "windows_1252_refs": "<p>&#128;&#150;&#0;&#x110000;</p>",
+    "br_variants": "<p>a<br>b<br/>c<br />d</br>e</p>",
+    "blank_lines": "<p>a</p>\n \n<p></p><p></p><p>b</p>",
+    "images": '<p>看图<img src="a.png"> <img src=" a.png "><img src=""><IMG SRC="b.png"/></p><img>',
+    "image_in_option": '<p>A</p><p><img src="opt.png" width="10"></p>',
+    "table": "<table><thead><tr><th>x</th><th>y</th></tr></thead><tr><td>1</td><td><p>2</p></td></tr></table>",
+    "table_unclosed": "<table><tr><td>1<td>2<tr><td>3</table>after",
+    "malformed_nesting": "<div><p>x</div>y</p>z",
+    "stray_end_tags": "</p>stray</b><p>unclosed",
+    "broken_tag": "a < b > c <b",
+    "script_style": "<script>var s = '<p>';</script><style>p {}</style><p>visible</p>",
+    "comments_cdata": "<!-- c --><p>a<!--x-->b</p><![CDATA[ raw ]]>",
+    "pre_whitespace": "<pre>  keep \n  spaces  </pre><p> <b> bold </b> tail </p>",
+    "first_p_letter": "<p>B</p><p>选项内容</p>",
+    "fullwidth_spaces": "　<p>全角　</p>",
+}
+
+
+@pytest.mark.parametrize("html_content", list(FRAGMENTS.values()), ids=list(FRAGMENTS))
+def test_fixture_fragments_match_reference(html_content):
+    assert fast_parse(html_content) == reference_parse(html_content)
+
+
+@pytest.mark.parametrize("html_content", EDGE_CASES)
+def test_edge_cases_match_reference(html_content):
+    assert fast_parse(html_content) == reference_parse(html_content)
+
+
+def test_mock_exam_fragments_match_reference():
+    corpus = report_fragments(build_exam_report(MockConfig(questions=60, seed=3), "http://mock"))
+    assert corpus
+    assert [fast_parse(html) for html in corpus] == [reference_parse(html) for html in corpus]
+
+
+def test_fuzzed_fragments_match_reference():
+    mismatches = [html for html in fuzz_fragments(500, seed=12) if fast_parse(html) != reference_parse(html)]
+    assert mismatches == []
+
+
+def test_parse_fragment_is_memoized_and_immutable():
+    first = htmltext.parse_fragment(FRAGMENTS["images"])
+    assert htmltext.parse_fragment(FRAGMENTS["images"]) is first
+    assert first.image_urls == ("a.png", "b.png")
+
+
+@pytest.mark.parametrize("value", [None, "", 42])
+def test_non_string_input_is_empty(value):
+    fragment = htmltext.parse_fragment(value)
+    assert (fragment.text, fragment.image_urls, fragment.first_p_text) == ("", (), None)
@@ -0,0 +1,79 @@
+import pytest
+import requests
+
+from ulearning_export.download import ImageTooLargeError, stream_body
+from ulearning_export.http_client import CircuitBreaker, CircuitOpenError, HttpClient, RetryPolicy
+
+URL = "http://images.example/a.png"
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+def raising(error):
+    def attempt(): raise error
+    return attempt
+
+
+@pytest.fixture
+def client():
+    """A client without retries whose breaker for the image host opens on one failure and half-opens at once."""
+    with HttpClient(policy=RetryPolicy(max_attempts=1), log_func=lambda message: None) as client:
+        client._breakers["images.example"] = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        yield client
+
+
+def open_circuit(client):
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.call(URL, raising(requests.exceptions.ConnectionError("refused")))
+    breaker = client._breakers["images.example"]
+    assert breaker._opened_at is not None
+    return breaker
+
+
+def oversized_image_error():
+    response = requests.Response()
+    response.headers["Content-Length"] = "2048"
+    with pytest.raises(ImageTooLargeError) as error: stream_body(response, lambda chunk: None, max_bytes=1024)
+    return error.value
+
+
+@pytest.mark.parametrize("error", [oversized_image_error(), http_error(404), OSError("disk full")],
+                         ids=["image_too_large", "http_404", "local_write_error"])
+def test_trial_answered_by_the_host_closes_the_circuit(client, error):
+    breaker = open_circuit(client)
+    with pytest.raises(type(error)): client.call(URL, raising(error))
+    assert breaker._opened_at is None and not breaker._trial_running
+    assert client.call(URL, lambda: "ok") == "ok"
+
+
+def test_trial_without_an_answer_reopens_the_circuit(client):
+    breaker = open_circuit(client)
+    with pytest.raises(requests.exceptions.InvalidURL): client.call(URL, raising(requests.exceptions.InvalidURL("bad")))
+    assert breaker._opened_at is not None and not breaker._trial_running
+    assert client.call(URL, lambda: "ok") == "ok" # The next trial is let through and closes it
+
+
+def test_failed_retryable_trial_reopens_the_circuit(client):
+    breaker = open_circuit(client)
+    breaker.reset_timeout = 60
+    with pytest.raises(CircuitOpenError): client.call(URL, lambda: "not sent")
+    breaker.reset_timeout = 0
+    with pytest.raises(requests.exceptions.Timeout): client.call(URL, raising(requests.exceptions.Timeout("slow")))
+    assert breaker._opened_at is not None and not breaker._trial_running
+
+
+def test_shared_breaker_recovers_for_other_clients(client):
+    open_circuit(client)
+    with pytest.raises(ImageTooLargeError): client.call(URL, raising(oversized_image_error()))
+    other = client.with_session(requests.Session())
+    assert other.call(URL, lambda: "ok") == "ok"
+
+
+def test_non_retryable_http_error_does_not_count_as_host_failure(client):
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.HTTPError): client.call(URL, raising(http_error(404)))
+    assert client._breakers["images.example"]._opened_at is None
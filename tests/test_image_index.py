@@ -0,0 +1,72 @@
+import json
+import os
+
+from ulearning_export.download import ImageJob, ImageResult
+from ulearning_export.image_index import IMAGE_INDEX_FILENAME, ImageIndex, split_filename_prefix
+
+ROWS = [
+    ("question_1_1001", "title", 1, "question_1_1001/title_img_1.png"),
+    ("question_1_1001", "title", 2, "question_1_1001/title_img_2.gif",
+     {"print": "question_1_1001/title_img_2.print.png", "thumb": "question_1_1001/title_img_2.thumb.jpg"}),
+    ("question_2_1002", "option_A", 1, "question_2_1002/option_A_img_1.jpg"),
+]
+
+
+def test_split_filename_prefix():
+    assert split_filename_prefix("option_A_img_2") == ("option_A", 2)
+    assert split_filename_prefix("correct_answer_1_img_10") == ("correct_answer_1", 10)
+    assert split_filename_prefix("title") is None
+
+
+def test_get_by_ordinal_and_variant():
+    index = ImageIndex(ROWS)
+    assert len(index) == 3
+    assert index.get("question_1_1001", "title") == ["question_1_1001/title_img_1.png", "question_1_1001/title_img_2.gif"]
+    assert index.get("question_1_1001", "title", "print") == ["question_1_1001/title_img_1.png",
+                                                             "question_1_1001/title_img_2.print.png"]
+    assert index.variant("question_1_1001/title_img_2.gif", "thumb") == "question_1_1001/title_img_2.thumb.jpg"
+    assert index.variant("question_1_1001/title_img_1.png", "thumb") is None
+    assert index.get("question_9_1009", "title") == []
+
+
+def test_dumps_writes_4_and_5_element_rows():
+    rows = json.loads(ImageIndex(ROWS).dumps())
+    assert sorted(len(row) for row in rows) == [4, 4, 5]
+    assert [row for row in rows if len(row) == 5][0][4]["print"] == "question_1_1001/title_img_2.print.png"
+
+
+def test_save_load_round_trip(tmp_path):
+    index = ImageIndex(ROWS)
+    index.save(str(tmp_path))
+    loaded = ImageIndex.load(str(tmp_path))
+    assert loaded.dumps() == index.dumps()
+    assert loaded.get("question_1_1001", "title", "thumb")[1] == "question_1_1001/title_img_2.thumb.jpg"
+    assert not os.path.exists(os.path.join(str(tmp_path), IMAGE_INDEX_FILENAME + ".tmp"))
+
+
+def test_load_skips_malformed_rows(tmp_path):
+    (tmp_path / IMAGE_INDEX_FILENAME).write_text(json.dumps(
+        [["q", "title", 1, "q/title_img_1.png"], ["q", "title"], "row", ["q", "title", 2, "q/b.png", {}, "extra"]]),
+        encoding='utf-8')
+    assert ImageIndex.load(str(tmp_path)).get("q", "title") == ["q/title_img_1.png"]
+    (tmp_path / IMAGE_INDEX_FILENAME).write_text("{broken", encoding='utf-8')
+    assert len(ImageIndex.load(str(tmp_path))) == 0
+    assert len(ImageIndex.load(str(tmp_path / "missing"))) == 0
+
+
+def test_re_adding_without_variants_drops_them():
+    index = ImageIndex(ROWS)
+    index.add("question_1_1001", "title", 2, "question_1_1001/title_img_2.gif")
+    assert index.get("question_1_1001", "title", "print")[1] == "question_1_1001/title_img_2.gif"
+    assert all(len(row) == 4 for row in json.loads(index.dumps()))
+
+
+def test_add_results(tmp_path):
+    exam_dir = str(tmp_path)
+    question_dir = os.path.join(exam_dir, "question_1_1001")
+    ok = ImageResult(ImageJob("http://h/a.png", question_dir, "title_img_1"), True)
+    ok.variants = {"print": os.path.join(question_dir, "title_img_1.print.png")}
+    failed = ImageResult(ImageJob("http://h/b.png", question_dir, "title_img_2"), False, error="503")
+    index = ImageIndex.from_results([ok, failed], exam_dir)
+    assert index.get("question_1_1001", "title") == ["question_1_1001/title_img_1.png"]
+    assert index.get("question_1_1001", "title", "print") == ["question_1_1001/title_img_1.print.png"]
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+from ulearning_export import imageproc
+from ulearning_export.download import ImageJob, ImageResult
+from ulearning_export.imageproc import ImagePostprocessor, sniff_image_format
+
+Image = imageproc.Image
+needs_pillow = pytest.mark.skipif(Image is None, reason="Pillow is not installed")
+
+
+@pytest.mark.parametrize("head, ext", [
+    (b"\x89PNG\r\n\x1a\n....", ".png"),
+    (b"\xff\xd8\xff\xe0", ".jpg"),
+    (b"GIF89a", ".gif"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", ".webp"),
+    (b"%PDF-1.7", ".pdf"),
+    (b"  <svg xmlns=", ".svg"),
+    (b"<?xml version='1.0'?><svg>", ".svg"),
+    (b"<html>", None),
+])
+def test_sniff_image_format(head, ext):
+    assert sniff_image_format(head) == ext
+
+
+def downloaded(path):
+    job = ImageJob("http://h/" + os.path.basename(path), os.path.dirname(path), "title_img_1")
+    job.save_path = path
+    return ImageResult(job, True, bytes_written=os.path.getsize(path))
+
+
+@pytest.fixture
+def postprocessor():
+    with ImagePostprocessor(optimize=True, log_func=lambda message: None, max_workers=2) as postprocessor:
+        yield postprocessor
+
+
+def test_wrong_extension_gets_a_print_link(tmp_path, postprocessor):
+    path = tmp_path / "title_img_1.png"
+    path.write_bytes(b"%PDF-1.4 not really a png")
+    result = postprocessor.process(downloaded(str(path)))
+    assert result.variants == {"print": str(tmp_path / "title_img_1.pdf")}
+    assert os.path.samefile(str(path), result.variants["print"])
+
+
+@needs_pillow
+def test_png_without_gain_is_not_recompressed_again(tmp_path, postprocessor, monkeypatch):
+    path = tmp_path / "title_img_1.png"
+    Image.new("L", (4, 4)).save(str(path), "PNG", optimize=True) # Nothing left to gain
+    assert postprocessor.process(downloaded(str(path))).variants is None
+    assert (tmp_path / "title_img_1.print.nogain").exists()
+    assert not (tmp_path / "title_img_1.print.png").exists()
+
+    saves = []
+    monkeypatch.setattr(Image.Image, "save", lambda image, *args, **kwargs: saves.append(args))
+    assert postprocessor.process(downloaded(str(path))).variants is None
+    assert saves == []
+
+    os.utime(str(path), ns=(1, 1)) # A re-downloaded image: try again
+    postprocessor.process(downloaded(str(path)))
+    assert len(saves) == 1
+
+
+@needs_pillow
+def test_png_with_gain_gets_a_print_version(tmp_path, postprocessor):
+    path = tmp_path / "title_img_1.png"
+    Image.new("RGB", (200, 200), "white").save(str(path), "PNG", compress_level=0)
+    (tmp_path / "title_img_1.print.nogain").write_bytes(b"") # Marker of an earlier image at this path
+    os.utime(str(tmp_path / "title_img_1.print.nogain"), ns=(1, 1))
+    result = postprocessor.process(downloaded(str(path)))
+    assert result.variants == {"print": str(tmp_path / "title_img_1.print.png")}
+    assert os.path.getsize(result.variants["print"]) < os.path.getsize(str(path))
+    assert not (tmp_path / "title_img_1.print.nogain").exists()
+    assert postprocessor.stats["recompressed"] == 1
+
+
+@needs_pillow
+def test_decompression_bomb_skips_only_that_image(tmp_path, postprocessor, monkeypatch):
+    bomb = tmp_path / "title_img_1.png"
+    Image.new("L", (100, 100)).save(str(bomb), "PNG")
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000) # 10000 pixels is over twice the limit: an error
+    result = postprocessor.process(downloaded(str(bomb)))
+    assert result.ok and result.variants is None
+    assert postprocessor.stats["errors"] == 1
+
+    download = Future()
+    chained = postprocessor.chain(download)
+    download.set_result(downloaded(str(bomb)))
+    assert chained.result(timeout=10).variants is None # The streaming export is not failed
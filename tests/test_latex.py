@@ -0,0 +1,77 @@
+import re
+
+import pytest
+
+from ulearning_export.latex import escape_latex_special_chars, text_to_tex
+
+_ESCAPED_RE = re.compile(r'\\[\\{}$%#&_^]') # A backslash escape, or \\ (line break) inside math
+
+
+def unescaped(tex, chars):
+    """The characters among ``chars`` in ``tex`` that TeX sees as specials (not part of an escape)."""
+    return [char for char in _ESCAPED_RE.sub("", tex) if char in chars]
+
+
+def braces_balanced(tex):
+    depth = 0
+    for char in unescaped(tex, "{}"):
+        depth += 1 if char == "{" else -1
+        if depth < 0: return False
+    return depth == 0
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", ""),
+    (None, ""),
+    ("plain 文本", "plain 文本"),
+    ("a_b & 50% #1", r"a\_b \& 50\% \#1"),
+    ("~^", r"\textasciitilde{}\^{}"),
+    ("$x$", r"\$x\$"),
+    ("{x}", r"\{x\}"),
+    ("\\{}", r"\textbackslash{}\{\}"), # The braces of \textbackslash{} are not escaped again
+])
+def test_escape_latex_special_chars(text, expected):
+    assert escape_latex_special_chars(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("x $a_b$ y", "x $a_b$ y"),
+    ("$$x^2$$", "$$x^2$$"),
+    (r"\(x_1\)", r"\(x_1\)"),
+    ("$50%$", r"$50\%$"),
+    ("$a$ and $b$", "$a$ and $b$"),
+    ("p1\n\np2", "p1\n\\par\np2"),
+])
+def test_text_to_tex_keeps_math(text, expected):
+    assert text_to_tex(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("price $5 and $6", r"price \$5 and \$6"), # Currency, not a formula
+    ("one $ dollar", r"one \$ dollar"),
+    ("$a$5", r"\$a\$5"),
+    ("$a_{b$ c", r"\$a\_\{b\$ c"), # Unbalanced braces: text, not math
+    ("$a}{b$", r"\$a\}\{b\$"),
+    ("{unbalanced", r"\{unbalanced"),
+    ("closing}", r"closing\}"),
+    ("\\[a\n\nb\\]", "\\textbackslash{}[a\n\\par\nb\\textbackslash{}]"), # Spans a blank line
+])
+def test_text_to_tex_escapes_unbalanced_math(text, expected):
+    assert text_to_tex(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "$", "$$", "$$$", "a $b", "$a$$b", "$a$ $", "$ a$", "$a $", "$$a$", "$a$$",
+    "{", "}", "}{", "$}$", "${$", "$a}$b{$", "$\\}$", "\\", "\\$", "$\\$", "\\(a", "a\\)", "\\(a{\\)",
+    "$x_{1}$ costs $5", "x^{2} $y", "$a\n\nb$", "%$#&_^~",
+])
+def test_text_to_tex_output_is_balanced(text):
+    tex = text_to_tex(text)
+    assert len(unescaped(tex, "$")) % 2 == 0, tex
+    assert braces_balanced(tex), tex
+    assert not unescaped(tex, "%#"), tex # Would comment out or break the rest of the line
+
+
+def test_memoized():
+    assert text_to_tex.cache_info().maxsize and escape_latex_special_chars.cache_info().maxsize
+    assert text_to_tex("$a$ x") is text_to_tex("$a$ x")
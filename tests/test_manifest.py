@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from ulearning_export.download import ImageJob, ImageResult
+from ulearning_export.manifest import MANIFEST_FILENAME, ExportManifest, question_content_hash
+
+
+class FakeEngine:
+    """Writes ``bodies[url]`` to each job's path, fails the URLs in ``failing``; records what it was asked for."""
+
+    def __init__(self, bodies, failing=(), raise_after=None):
+        self.bodies = bodies
+        self.failing = set(failing)
+        self.raise_after = raise_after
+        self.revalidate = False
+        self.requested = []
+        self.log_func = lambda message: None
+
+    def download_all(self, jobs, on_result=None):
+        results = []
+        for job in jobs:
+            if self.raise_after is not None and len(self.requested) >= self.raise_after: raise KeyboardInterrupt
+            self.requested.append(job.url)
+            if job.url in self.failing: result = ImageResult(job, False, error=f"HTTP error 503 for {job.url}")
+            else:
+                with open(job.save_path, 'wb') as f: f.write(self.bodies[job.url])
+                result = ImageResult(job, True, bytes_written=len(self.bodies[job.url]), etag=f'"{job.url}"')
+            if on_result is not None: on_result(result)
+            results.append(result)
+        return results
+
+
+@pytest.fixture
+def exam(tmp_path):
+    question_dir = tmp_path / "question_1_1001"
+    question_dir.mkdir()
+    bodies = {f"http://h/{i}.png": bytes([i]) * (i + 1) for i in range(3)}
+    def jobs(): return [ImageJob(url, str(question_dir), f"title_img_{i + 1}") for i, url in enumerate(bodies)]
+    return str(tmp_path), bodies, jobs
+
+
+def test_failed_job_is_retried_on_the_next_run(exam):
+    exam_dir, bodies, jobs = exam
+    engine = FakeEngine(bodies, failing={"http://h/1.png"})
+    results = ExportManifest(exam_dir).download_missing(engine, jobs())
+    assert [r.ok for r in results] == [True, False, True]
+    assert not os.path.exists(jobs()[1].save_path)
+
+    engine = FakeEngine(bodies)
+    seen = []
+    results = ExportManifest(exam_dir).download_missing(engine, jobs(), on_result=seen.append)
+    assert engine.requested == ["http://h/1.png"] # Only the failed image is fetched again
+    assert all(r.ok for r in results) and len(seen) == 3
+    assert sorted(r.job.url for r in results if r.reused) == ["http://h/0.png", "http://h/2.png"]
+
+    engine = FakeEngine(bodies)
+    ExportManifest(exam_dir).download_missing(engine, jobs())
+    assert engine.requested == []
+
+
+def test_truncated_or_changed_images_are_fetched_again(exam):
+    exam_dir, bodies, jobs = exam
+    ExportManifest(exam_dir).download_missing(FakeEngine(bodies), jobs())
+    with open(jobs()[0].save_path, 'wb') as f: f.write(b"") # Truncated: size no longer matches
+    changed = jobs(); changed[2].url = "http://h/new.png"
+    engine = FakeEngine(dict(bodies, **{"http://h/new.png": b"new"}))
+    ExportManifest(exam_dir).download_missing(engine, changed)
+    assert engine.requested == ["http://h/0.png", "http://h/new.png"]
+
+
+def test_interrupted_run_keeps_finished_images(exam):
+    exam_dir, bodies, jobs = exam
+    with pytest.raises(KeyboardInterrupt):
+        ExportManifest(exam_dir).download_missing(FakeEngine(bodies, raise_after=2), jobs())
+    assert os.path.exists(os.path.join(exam_dir, MANIFEST_FILENAME))
+    engine = FakeEngine(bodies)
+    ExportManifest(exam_dir).download_missing(engine, jobs())
+    assert engine.requested == ["http://h/2.png"]
+
+
+def test_question_records_round_trip(exam):
+    exam_dir, _, _ = exam
+    text_path = os.path.join(exam_dir, "question_1_1001", "question_data.txt")
+    content_hash = question_content_hash({"title": "<p>Q</p>", "type": 1})
+    assert content_hash == question_content_hash({"type": 1, "title": "<p>Q</p>"}) # Key order does not matter
+    manifest = ExportManifest(exam_dir)
+    with open(text_path, 'w', encoding='utf-8') as f: f.write("Q")
+    manifest.record_question("question_1_1001", content_hash, text_path)
+    manifest.save()
+    reloaded = ExportManifest(exam_dir)
+    assert reloaded.question_unchanged("question_1_1001", content_hash, text_path)
+    assert not reloaded.question_unchanged("question_1_1001", question_content_hash({"type": 2}), text_path)
+    os.remove(text_path)
+    assert not reloaded.question_unchanged("question_1_1001", content_hash, text_path)
+
+
+def test_other_manifest_versions_are_ignored(exam):
+    exam_dir, _, _ = exam
+    with open(os.path.join(exam_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        f.write('{"version": 999, "questions": {"q": {}}, "images": {}}')
+    assert ExportManifest(exam_dir).questions == {}
@@ -0,0 +1,95 @@
+import pytest
+
+from ulearning_export.model import normalize_exam, stream_exam
+from ulearning_export.selection import ExportSelection, parse_number_list, parse_ranges
+
+
+def make_report():
+    def question(order_index, type_code):
+        return {"orderIndex": order_index, "questionid": 100 + order_index, "type": type_code, "title": f"<p>Q{order_index}</p>"}
+    return {"result": {"examTitle": "T", "part": [
+        {"partname": "一", "children": [question(1, 1), question(2, 2), question(3, 1)]},
+        {"partname": "二", "children": [question(4, 4), {"questionid": 105, "type": "2", "title": "<p>Q5</p>"}]},
+    ]}}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1-5,8", ((1, 5), (8, 8))),
+    (" 2 ", ((2, 2),)),
+    ("3 - 3", ((3, 3),)),
+    ("1-2,,4", ((1, 2), (4, 4))),
+])
+def test_parse_ranges(value, expected):
+    assert parse_ranges(value) == expected
+
+
+@pytest.mark.parametrize("value, message", [
+    ("", "Expected ranges like '1-5,8', got ''"),
+    (",", "Expected ranges like '1-5,8', got ','"),
+    ("1-x", "Expected ranges like '1-5,8', got '1-x'"),
+    ("1,-3", "Expected ranges like '1-5,8', got '-3'"),
+    ("5-2", "Empty range: '5-2'"),
+])
+def test_parse_ranges_errors(value, message):
+    with pytest.raises(ValueError) as error: parse_ranges(value)
+    assert str(error.value) == message
+
+
+def test_parse_number_list():
+    assert parse_number_list("1,3") == frozenset({1, 3})
+    assert parse_number_list(" 2 ,, 2") == frozenset({2})
+
+
+@pytest.mark.parametrize("value", ["", ",", "a", "1,b", "0", "-1", "1.5", "²"])
+def test_parse_number_list_errors(value):
+    with pytest.raises(ValueError) as error: parse_number_list(value)
+    assert str(error.value) == f"Expected comma-separated positive numbers, got {value!r}"
+
+
+@pytest.mark.parametrize("selection, tag", [
+    (ExportSelection(), ""),
+    (ExportSelection(images=False), ""),
+    (ExportSelection(parts={3, 1}), "P1+3"),
+    (ExportSelection(question_ranges=((1, 5), (8, 8))), "Q1-5+8"),
+    (ExportSelection(types={2, 1}), "T1+2"),
+    (ExportSelection(parts={1}, question_ranges=((1, 4),), types={1}), "P1_Q1-4_T1"),
+])
+def test_tag(selection, tag):
+    assert selection.tag() == tag
+    assert selection.partial == bool(tag)
+
+
+def test_describe():
+    assert ExportSelection().describe() == "everything"
+    assert ExportSelection(parts={2}, types={1}, images=False).describe() == "parts 2; types 1; no image downloads"
+
+
+def test_selects_question_on_raw_json():
+    selection = ExportSelection(question_ranges=((2, 3),), types={2})
+    assert selection.selects_question({"orderIndex": 2, "type": 2}, 0)
+    assert selection.selects_question({"orderIndex": "3", "type": "2"}, 0)
+    assert not selection.selects_question({"orderIndex": 2, "type": 1}, 0)
+    assert not selection.selects_question({"orderIndex": 4, "type": 2}, 0)
+    assert selection.selects_question({"type": 2}, 1) # orderIndex falls back on the position
+    assert not selection.selects_question({"orderIndex": "x", "type": 2}, 1)
+
+
+def test_normalize_exam_prunes_parts_and_questions():
+    exam = normalize_exam(make_report(), ExportSelection(types={2}))
+    assert [part.index for part in exam.parts] == [0, 1]
+    assert [q.order_index for q in exam.questions()] == [2, 2] # Q5 has no orderIndex: its position in part 2
+    assert [q.question_id for q in exam.questions()] == [102, 105]
+
+    exam = normalize_exam(make_report(), ExportSelection(parts={2}))
+    assert [q.question_id for q in exam.questions()] == [104, 105]
+
+    exam = normalize_exam(make_report(), ExportSelection(question_ranges=((1, 1),)))
+    assert [part.index for part in exam.parts] == [0] # Part 2 is left without questions
+    assert [q.question_id for q in exam.questions()] == [101]
+
+
+def test_stream_exam_matches_normalize_exam():
+    selection = ExportSelection(parts={1, 2}, question_ranges=((2, 4),))
+    expected = [q.folder_name for q in normalize_exam(make_report(), selection).questions()]
+    assert [q.folder_name for q in stream_exam(make_report(), selection).questions()] == expected == [
+        "question_2_102", "question_3_103", "question_4_104", "question_2_105"]
@@ -0,0 +1,7 @@
+"""
+Shared building blocks for the ulearning export scripts.
+
+The entry-point scripts (``export_test.py``, ``export-with-gui.py`` and
+``test(success).py``) import from this package so that performance work only
+has to land in one place.
+"""
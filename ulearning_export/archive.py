@@ -0,0 +1,105 @@
+"""
+Single-file exam archives.
+
+A folder export is a tree of hundreds of small files, which is slow to copy,
+sync and back up. ``ExamArchive`` writes the same tree as one ZIP file instead:
+question texts, images, the Markdown and TeX files and the image index are
+appended one entry after the other in a single front-to-back stream (images
+stored as they are, text deflated). The file is written as ``<name>.zip.part``
+and renamed when complete, so an interrupted export never leaves a truncated
+archive behind.
+
+The ZIP central directory at the end of the file is the random-access index:
+any entry (``unzip -p``, ``zipfile``, file managers) is read with one seek,
+without unpacking the rest. Entry names are the paths the folder export uses,
+relative to the exam folder, so the relative image links in the Markdown and
+TeX files resolve inside the archive and after extracting it.
+
+Entries cannot interleave, so writers from several threads (the image
+download workers) are serialized by a lock and every entry is written in one
+go; callers buffer a downloaded image in memory instead of in a temp file.
+"""
+import io
+import os
+import shutil
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+ARCHIVE_SUFFIX = ".zip"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class ExamArchive:
+    """
+    One exam written as a ZIP at ``path``; ``root_dir`` is the exam folder
+    the entry names are relative to (``entry_name`` maps a path inside it).
+    Use as a context manager: the archive is committed on success and
+    discarded when the block raises.
+    """
+
+    def __init__(self, path, root_dir):
+        self.path = path
+        self.root_dir = root_dir
+        self._tmp_path = path + ".part"
+        self._zip = zipfile.ZipFile(self._tmp_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._lock = threading.Lock()
+        self.entries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None: self.close()
+        else: self.abort()
+
+    def entry_name(self, path):
+        """``<root_dir>/question_1_1001/title_img_1.png`` -> ``question_1_1001/title_img_1.png``."""
+        return os.path.relpath(path, self.root_dir).replace("\\", "/")
+
+    def _info(self, name, compress):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        return info
+
+    @contextmanager
+    def open_entry(self, name, compress=False):
+        """Binary file object writing the entry ``name``; the archive is locked until the block ends."""
+        with self._lock:
+            with self._zip.open(self._info(name, compress), 'w', force_zip64=True) as entry:
+                yield entry
+            self.entries += 1
+
+    @contextmanager
+    def open_text(self, name):
+        """Text file object (UTF-8, deflated) for the entry ``name``, like ``open(path, 'w')``."""
+        with self.open_entry(name, compress=True) as entry:
+            text = io.TextIOWrapper(entry, encoding='utf-8')
+            yield text
+            text.flush(); text.detach() # Leave closing the entry to open_entry
+
+    def write_bytes(self, name, data, compress=False):
+        with self.open_entry(name, compress) as entry: entry.write(data)
+        return len(data)
+
+    def write_text(self, name, text):
+        return self.write_bytes(name, text.encode('utf-8'), compress=True)
+
+    def write_file(self, name, source_path, compress=False):
+        """Copies the file at ``source_path`` into the entry ``name`` in chunks; returns its size."""
+        with open(source_path, 'rb') as source, self.open_entry(name, compress) as entry:
+            shutil.copyfileobj(source, entry, COPY_CHUNK_SIZE)
+            return source.tell()
+
+    def close(self):
+        """Writes the central directory and moves the finished archive into place."""
+        self._zip.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self._zip.close()
+        finally:
+            if os.path.exists(self._tmp_path): os.remove(self._tmp_path)
@@ -0,0 +1,270 @@
+"""
+Batch export scheduler.
+
+Runs the export of many ``(examId, traceId)`` pairs concurrently. The
+caller supplies ``export_func(job)`` which performs one complete export
+(report fetch, images, rendering) and returns the exam's output folder;
+the scheduler bounds how many exams run at once, times every job and
+collects a summary. Image concurrency across all running exams is bounded
+by sharing one ``DownloadEngine`` between the jobs.
+
+``JobManager`` is the long-lived variant for the GUI: exams are queued at
+any time onto a worker pool, each job has an observable status, and a
+``CancelToken`` per job lets the export cancel or pause cooperatively at
+its checkpoints (between questions and before every image download).
+"""
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .log import print_log
+
+DEFAULT_PARALLEL_EXAMS = 2
+BATCH_SUMMARY_FILENAME = "batch_summary.json"
+_SPEC_SPLIT_RE = re.compile(r'[\s,:;]+')
+
+
+class ExamJob:
+    __slots__ = ("exam_id", "trace_id")
+
+    def __init__(self, exam_id, trace_id):
+        self.exam_id = str(exam_id).strip()
+        self.trace_id = str(trace_id).strip()
+
+    def __repr__(self):
+        return f"ExamJob({self.exam_id}:{self.trace_id})"
+
+
+class ExamJobResult:
+    __slots__ = ("job", "ok", "output_dir", "error", "seconds")
+
+    def __init__(self, job, ok, output_dir=None, error=None, seconds=0.0):
+        self.job = job
+        self.ok = ok
+        self.output_dir = output_dir
+        self.error = error
+        self.seconds = seconds
+
+
+class ExportCancelled(Exception):
+    """Raised at a checkpoint of an export whose ``CancelToken`` was cancelled."""
+
+
+class CancelToken:
+    """
+    Cooperative cancel / pause flag shared between a job and its export.
+    ``checkpoint()`` blocks while paused and raises ``ExportCancelled``
+    once cancelled; exports call it wherever stopping is safe.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set() # Wake a paused export so it can stop
+
+    def pause(self):
+        if not self.cancelled: self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def checkpoint(self):
+        self._running.wait()
+        if self.cancelled: raise ExportCancelled()
+
+
+JOB_QUEUED, JOB_RUNNING, JOB_PAUSED, JOB_DONE, JOB_FAILED, JOB_CANCELLED = (
+    "queued", "running", "paused", "done", "failed", "cancelled")
+JOB_FINISHED = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class ManagedJob:
+    """
+    One queued export of a ``JobManager``: ``status`` is one of the
+    ``JOB_*`` constants, ``progress`` the latest ``ProgressSnapshot`` the
+    export reported (or None); ``options`` is whatever the caller passed to
+    ``submit`` for its ``export_func``.
+    """
+    __slots__ = ("job_id", "job", "options", "status", "token", "progress", "output_dir", "error", "seconds", "started",
+                 "future")
+
+    def __init__(self, job_id, job, options=None):
+        self.job_id = job_id
+        self.job = job
+        self.options = options
+        self.status = JOB_QUEUED
+        self.token = CancelToken()
+        self.progress = None
+        self.output_dir = None
+        self.error = None
+        self.seconds = 0.0
+        self.started = False
+        self.future = None
+
+
+class JobManager:
+    """
+    Runs ``export_func(managed_job)`` for every submitted job on a pool of
+    ``max_workers`` threads. ``export_func`` returns the output folder (None
+    on failure), checks ``managed_job.token`` and may report progress with
+    ``report_progress``. ``on_update(managed_job)`` is called from worker
+    threads (and the caller's thread) after every status or progress change.
+    """
+
+    def __init__(self, export_func, max_workers=DEFAULT_PARALLEL_EXAMS, on_update=None):
+        self.export_func = export_func
+        self.on_update = on_update
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)))
+
+    def _notify(self, managed):
+        if self.on_update is not None: self.on_update(managed)
+
+    def _set_status(self, managed, status):
+        with self._lock:
+            if managed.status in JOB_FINISHED: return
+            managed.status = status
+        self._notify(managed)
+
+    def submit(self, job, options=None):
+        managed = ManagedJob(next(self._ids), job, options)
+        with self._lock: self.jobs[managed.job_id] = managed
+        self._notify(managed)
+        managed.future = self._executor.submit(self._run, managed)
+        return managed
+
+    def _run(self, managed):
+        with self._lock:
+            if managed.status in JOB_FINISHED: return
+            managed.started = True
+            managed.status = JOB_PAUSED if managed.token.paused else JOB_RUNNING
+        self._notify(managed)
+        started = time.perf_counter()
+        try:
+            managed.token.checkpoint()
+            output_dir = self.export_func(managed)
+            status = JOB_DONE if output_dir is not None else JOB_FAILED
+            managed.output_dir = output_dir
+            if output_dir is None: managed.error = "export failed"
+        except ExportCancelled:
+            status = JOB_CANCELLED
+        except Exception as e:
+            status, managed.error = JOB_FAILED, f"{type(e).__name__}: {e}"
+        managed.seconds = time.perf_counter() - started
+        self._set_status(managed, status)
+
+    def report_progress(self, managed, snapshot):
+        managed.progress = snapshot
+        self._notify(managed)
+
+    def cancel(self, managed):
+        managed.token.cancel()
+        if managed.future is not None and managed.future.cancel(): # Had not started yet
+            self._set_status(managed, JOB_CANCELLED)
+
+    def pause(self, managed):
+        if managed.status in JOB_FINISHED: return
+        managed.token.pause()
+        self._set_status(managed, JOB_PAUSED)
+
+    def resume(self, managed):
+        if managed.status != JOB_PAUSED: return
+        managed.token.resume()
+        self._set_status(managed, JOB_RUNNING if managed.started else JOB_QUEUED)
+
+    def active_jobs(self):
+        with self._lock: return [m for m in self.jobs.values() if m.status not in JOB_FINISHED]
+
+    def shutdown(self, cancel=True):
+        """Stops accepting jobs; with ``cancel`` every unfinished job is cancelled (without waiting)."""
+        if cancel:
+            for managed in self.active_jobs(): self.cancel(managed)
+        self._executor.shutdown(wait=False)
+
+
+def parse_exam_spec(spec):
+    """``"130009:12463893"`` (or separated by comma/whitespace) -> ``ExamJob``."""
+    fields = [f for f in _SPEC_SPLIT_RE.split(spec.strip()) if f]
+    if len(fields) != 2: raise ValueError(f"Expected 'examId:traceId', got {spec!r}")
+    return ExamJob(fields[0], fields[1])
+
+
+def load_jobs_file(path):
+    """
+    Reads exam jobs from ``path``: either a JSON list of
+    ``{"examId": ..., "traceId": ...}`` objects, or a text file with one
+    ``examId traceId`` pair per line (``#`` starts a comment).
+    """
+    with open(path, 'r', encoding='utf-8') as f: content = f.read()
+    if content.lstrip().startswith('['):
+        return [ExamJob(entry["examId"], entry["traceId"]) for entry in json.loads(content)]
+    jobs = []
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line: jobs.append(parse_exam_spec(line))
+    return jobs
+
+
+def run_batch(jobs, export_func, max_parallel=DEFAULT_PARALLEL_EXAMS, log_func=print_log):
+    """Runs ``export_func(job)`` for every job, at most ``max_parallel`` at a time; returns results in job order."""
+    def run_one(job):
+        started = time.perf_counter()
+        try:
+            output_dir = export_func(job)
+            ok, error = output_dir is not None, (None if output_dir is not None else "export failed")
+        except Exception as e:
+            output_dir, ok, error = None, False, f"{type(e).__name__}: {e}"
+        result = ExamJobResult(job, ok, output_dir, error, time.perf_counter() - started)
+        status = "OK" if ok else f"FAILED ({error})"
+        log_func(f"[batch] exam {job.exam_id} finished in {result.seconds:.1f}s: {status}\n")
+        return result
+
+    jobs = list(jobs)
+    if not jobs: return []
+    log_func(f"[batch] Exporting {len(jobs)} exams, {max_parallel} at a time...\n")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(jobs)))) as pool:
+        return list(pool.map(run_one, jobs))
+
+
+def format_summary(results, total_seconds):
+    ok_count = sum(1 for r in results if r.ok)
+    lines = [f"批量导出完成: {ok_count} 成功, {len(results) - ok_count} 失败, 总耗时 {total_seconds:.1f}s"]
+    for r in results:
+        detail = r.output_dir if r.ok else r.error
+        lines.append(f"  {'OK  ' if r.ok else 'FAIL'} exam {r.job.exam_id} (trace {r.job.trace_id}) {r.seconds:6.1f}s  {detail}")
+    return "\n".join(lines) + "\n"
+
+
+def write_summary(results, total_seconds, output_dir):
+    """Writes ``batch_summary.json`` into ``output_dir`` and returns its path."""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, BATCH_SUMMARY_FILENAME)
+    summary = {
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_seconds": round(total_seconds, 3),
+        "succeeded": sum(1 for r in results if r.ok),
+        "failed": sum(1 for r in results if not r.ok),
+        "exams": [{"examId": r.job.exam_id, "traceId": r.job.trace_id, "ok": r.ok, "seconds": round(r.seconds, 3),
+                   "output_dir": r.output_dir, "error": r.error} for r in results],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return path
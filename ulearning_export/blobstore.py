@@ -0,0 +1,141 @@
+"""
+Content-addressed image store shared by every exam export.
+
+Downloaded images live once in ``<BASE_OUTPUT_DIR>/.blobs/<sha256><ext>``;
+question folders get hardlinks (or copies where the filesystem cannot link).
+A persisted URL index maps image URLs to blob names, so an image that was
+fetched for any earlier question or exam costs no network and no extra disk.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+URL_INDEX_FILENAME = "url_index.json"
+
+
+class BlobStore:
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.index_path = os.path.join(root_dir, URL_INDEX_FILENAME)
+        os.makedirs(root_dir, exist_ok=True)
+        self._url_index = self._load_index()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._url_locks = {}
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f: data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _lock_for(self, url):
+        with self._lock:
+            lock = self._url_locks.get(url)
+            if lock is None: lock = self._url_locks[url] = threading.Lock()
+            return lock
+
+    def blob_path(self, blob_name):
+        return os.path.join(self.root_dir, blob_name)
+
+    def lookup_url(self, url):
+        """Returns the blob path already stored for ``url``, or None."""
+        blob_name = self._url_index.get(url)
+        if blob_name and os.path.isfile(self.blob_path(blob_name)): return self.blob_path(blob_name)
+        return None
+
+    def get_or_fetch(self, url, ext, fetch_func):
+        """
+        Returns ``(blob_path, fetch_info)`` for ``url``.
+
+        ``fetch_func(tmp_path)`` is only called when the URL is not in the
+        store yet; it must write the body to ``tmp_path`` and return
+        ``(sha256_hexdigest, fetch_info)``, hashing while it streams.
+        ``fetch_info`` is passed back, and is None when the blob was already
+        stored. Concurrent callers
+        asking for the same URL wait for a single fetch.
+        """
+        with self._lock_for(url):
+            existing = self.lookup_url(url)
+            if existing: return existing, None
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix=".part")
+            os.close(fd)
+            try:
+                digest, fetch_info = fetch_func(tmp_path)
+                blob_name = f"{digest}{ext}"
+                final_path = self.blob_path(blob_name)
+                if os.path.exists(final_path): os.remove(tmp_path) # Same bytes already stored under another URL
+                else: os.replace(tmp_path, final_path)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+            with self._lock:
+                self._url_index[url] = blob_name
+                self._dirty = True
+            return final_path, fetch_info
+
+    def put_bytes(self, url, ext, data):
+        """Stores ``data`` already fetched for ``url`` (unless the URL is stored) and returns the blob path."""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f: f.write(data)
+            return hashlib.sha256(data).hexdigest(), None
+        return self.get_or_fetch(url, ext, write)[0]
+
+    def adopt(self, url, file_path, digest):
+        """
+        Makes the freshly downloaded ``file_path`` (sha256 ``digest``) the blob
+        for ``url``, replacing the one stored before (which stays for other URLs).
+        """
+        blob_name = f"{digest}{os.path.splitext(file_path)[1]}"
+        final_path = self.blob_path(blob_name)
+        with self._lock_for(url):
+            if os.path.exists(final_path): self.materialize(final_path, file_path)
+            else:
+                try:
+                    os.link(file_path, final_path)
+                except OSError:
+                    shutil.copyfile(file_path, final_path)
+            with self._lock:
+                self._url_index[url] = blob_name
+                self._dirty = True
+        return final_path
+
+    @staticmethod
+    def materialize(blob_path, dest_path):
+        """Makes ``dest_path`` refer to the blob: hardlink when possible, copy otherwise."""
+        if os.path.exists(dest_path):
+            try:
+                if os.path.samefile(blob_path, dest_path): return
+            except OSError:
+                pass
+            os.remove(dest_path)
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            shutil.copyfile(blob_path, dest_path)
+
+    def save(self):
+        """
+        Persists the URL index (atomically, through a temp file of its own) if anything was added.
+        Stores of other processes saving into the same directory no longer clobber each other's temp
+        file, but the last one to save wins: exports running at once should share one store.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty: return
+                snapshot = dict(self._url_index)
+                self._dirty = False
+            fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, prefix=URL_INDEX_FILENAME, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=0)
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
@@ -0,0 +1,394 @@
+"""
+Concurrent image download engine.
+
+All image jobs of an exam are collected up front and then fetched through a
+bounded thread pool that shares one keep-alive ``requests.Session``, so the
+TCP/TLS handshake to the image host is paid once per pooled connection instead
+of once per image. Requests go through the shared ``HttpClient`` (retries,
+rate limit, circuit breaker); a transfer that breaks off is restarted.
+
+Bodies are read through a preallocated per-thread buffer into a temp file
+that is renamed over the final path only once the transfer is complete: a
+body shorter than ``Content-Length``, failing ``Content-MD5`` or larger than
+the size limit never reaches the export, where a truncated image would break
+the Markdown and the TeX build. With ``revalidate`` the manifest sends the
+stored ETag/Last-Modified as a conditional request and a 304 keeps the image.
+"""
+import base64
+import copy
+import email.utils
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError, SSLError
+
+from .http_client import HttpClient, create_session
+from .log import print_log
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST_LIMIT = 4
+DEFAULT_TIMEOUT = 20
+READ_BUFFER_SIZE = 256 * 1024
+DEFAULT_MAX_IMAGE_BYTES = 50 * 1024 * 1024
+_read_buffers = threading.local()
+
+
+class IncompleteImageError(requests.exceptions.ChunkedEncodingError):
+    """The body did not match ``Content-Length`` or ``Content-MD5``; retried like any broken transfer."""
+
+
+class ImageTooLargeError(requests.exceptions.RequestException):
+    """The image exceeds the size limit; not retried."""
+
+
+def guess_image_extension(url):
+    original_filename = os.path.basename(urlparse(url).path)
+    _, ext = os.path.splitext(original_filename)
+    if not ext or len(ext) > 5: ext = ".png"
+    return ext
+
+
+class ImageJob:
+    """One image to fetch: ``url`` saved as ``<filename_prefix><ext>`` inside ``question_dir``."""
+    __slots__ = ("url", "question_dir", "filename_prefix", "save_path", "validators")
+
+    def __init__(self, url, question_dir, filename_prefix):
+        self.url = url
+        self.question_dir = question_dir
+        self.filename_prefix = filename_prefix
+        self.save_path = os.path.join(question_dir, f"{filename_prefix}{guess_image_extension(url)}")
+        self.validators = None # Conditional request headers when revalidating an image already saved
+
+
+class ImageResult:
+    """
+    Outcome of one ``ImageJob``; ``error`` is a short message when ``ok`` is
+    False, ``reused`` is True when the bytes came from the blob store (or
+    the server answered 304 Not Modified) and ``etag``/``last_modified`` are
+    the server's validators for freshly fetched images. ``variants``
+    maps derived versions ("print", "thumb") to their paths once the
+    optional post-processing stage has run.
+    """
+    __slots__ = ("job", "ok", "error", "bytes_written", "reused", "etag", "last_modified", "variants")
+
+    def __init__(self, job, ok, error=None, bytes_written=0, reused=False, etag=None, last_modified=None):
+        self.job = job
+        self.ok = ok
+        self.error = error
+        self.bytes_written = bytes_written
+        self.reused = reused
+        self.etag = etag
+        self.last_modified = last_modified
+        self.variants = None
+
+
+def plan_question_jobs(images_to_process, question_dir, log_func=None):
+    """
+    Turns the ``(url, filename_prefix)`` pairs collected for one question into
+    ``ImageJob`` objects, skipping relative URLs and URLs already queued for
+    the same question.
+    """
+    jobs = []
+    queued_urls = set()
+    for img_url, filename_prefix in images_to_process:
+        if not img_url.startswith(('http://', 'https://')):
+            if log_func: log_func(f"  Skipping invalid image URL: {img_url}\n")
+            continue
+        if img_url in queued_urls: continue
+        queued_urls.add(img_url)
+        jobs.append(ImageJob(img_url, question_dir, filename_prefix))
+    return jobs
+
+
+def validator_headers(etag=None, last_modified=None, mtime=None):
+    """Conditional request headers from stored validators; the file's ``mtime`` stands in for a missing Last-Modified."""
+    headers = {}
+    if etag: headers["If-None-Match"] = etag
+    if last_modified: headers["If-Modified-Since"] = last_modified
+    elif mtime is not None and not etag: headers["If-Modified-Since"] = email.utils.formatdate(mtime, usegmt=True)
+    return headers or None
+
+
+def _read_buffer():
+    """The calling thread's preallocated read buffer, reused for all of its downloads."""
+    view = getattr(_read_buffers, "view", None)
+    if view is None: view = _read_buffers.view = memoryview(bytearray(READ_BUFFER_SIZE))
+    return view
+
+
+def stream_body(response, write, hasher=None, max_bytes=DEFAULT_MAX_IMAGE_BYTES):
+    """
+    Reads the body of a ``stream=True`` response with ``readinto`` into the
+    thread's buffer and passes each filled slice to ``write`` (and
+    ``hasher``); returns the body size. Raises ``ImageTooLargeError`` beyond
+    ``max_bytes`` and ``IncompleteImageError`` when the body does not match
+    ``Content-Length`` or ``Content-MD5``. urllib3 errors are mapped to the
+    requests exceptions ``iter_content`` would raise, so retries still apply.
+    """
+    length = response.headers.get("Content-Length", "")
+    expected_length = int(length) if length.isdigit() else None
+    if max_bytes and expected_length is not None and expected_length > max_bytes:
+        raise ImageTooLargeError(f"{expected_length} bytes, limit is {max_bytes}", response=response)
+    encoded = response.headers.get("Content-Encoding", "identity").lower() != "identity"
+    content_md5 = None if encoded else response.headers.get("Content-MD5")
+    md5 = hashlib.md5() if content_md5 else None
+    raw = response.raw
+    raw.decode_content = True
+    view = _read_buffer()
+    size = 0
+    try:
+        while True:
+            n = raw.readinto(view)
+            if not n: break
+            size += n
+            if max_bytes and size > max_bytes: raise ImageTooLargeError(f"more than {max_bytes} bytes", response=response)
+            chunk = view[:n]
+            write(chunk)
+            if hasher is not None: hasher.update(chunk)
+            if md5 is not None: md5.update(chunk)
+    except ProtocolError as e: raise requests.exceptions.ChunkedEncodingError(e)
+    except DecodeError as e: raise requests.exceptions.ContentDecodingError(e)
+    except ReadTimeoutError as e: raise requests.exceptions.ConnectionError(e)
+    except SSLError as e: raise requests.exceptions.SSLError(e)
+    received = raw.tell() # Bytes on the wire, before any content decoding
+    if expected_length is not None and received != expected_length:
+        raise IncompleteImageError(f"received {received} of {expected_length} bytes")
+    if md5 is not None and base64.b64encode(md5.digest()).decode('ascii') != content_md5.strip():
+        raise IncompleteImageError("Content-MD5 mismatch")
+    return size
+
+
+def download_image(session, url, save_path, timeout=DEFAULT_TIMEOUT, hasher=None, max_bytes=DEFAULT_MAX_IMAGE_BYTES,
+                   validators=None, atomic=True):
+    """
+    Streams ``url`` (feeding ``hasher`` if given) into a temp file next to
+    ``save_path`` and, once ``stream_body`` has verified it, renames it into
+    place, so ``save_path`` only ever holds a complete image. ``atomic=False``
+    writes ``save_path`` directly, for callers that pass a temp file already.
+    ``validators`` are conditional request headers. Returns None when the
+    server answers 304 Not Modified, else ``(bytes_written, etag, last_modified)``.
+    """
+    with session.get(url, stream=True, timeout=timeout, headers=validators) as response:
+        if validators and response.status_code == 304: return None
+        response.raise_for_status()
+        if not atomic:
+            with open(save_path, 'wb') as f: bytes_written = stream_body(response, f.write, hasher, max_bytes)
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(save_path) or ".",
+                                            prefix=os.path.basename(save_path) + ".", suffix=".part")
+            try:
+                with os.fdopen(fd, 'wb') as f: bytes_written = stream_body(response, f.write, hasher, max_bytes)
+                os.replace(tmp_path, save_path)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+        return bytes_written, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+
+def read_image(session, url, timeout=DEFAULT_TIMEOUT, max_bytes=DEFAULT_MAX_IMAGE_BYTES):
+    """Reads and verifies ``url`` into memory; returns ``(body, etag)``. Used where the bytes go into an archive entry."""
+    body = bytearray()
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        stream_body(response, body.extend, max_bytes=max_bytes)
+        return body, response.headers.get("ETag")
+
+
+class DownloadEngine:
+    """
+    Fetches ``ImageJob`` lists through a bounded worker pool.
+
+    ``max_workers`` caps the total number of transfers in flight (also when
+    several exams share one engine and call ``download_all`` concurrently)
+    and ``per_host_limit`` caps how many of them may target the same host.
+    The engine owns its session unless one is passed in; ``client`` is the
+    ``HttpClient`` to share rate limits and circuit breakers with (a client
+    sharing its state is bound to the engine's session) and ``metrics`` an
+    ``ExportMetrics`` that receives every request. With a ``blob_store``
+    every image is fetched at most once across questions and exams and the
+    question folders receive links to the stored blob. A ``cancel_token``
+    (``batch.CancelToken``) is checked before every download, so a paused
+    export stops starting new transfers and a cancelled one raises
+    ``ExportCancelled`` from ``download_all``. With an ``archive``
+    (``archive.ExamArchive``) ``download_all`` writes the images into archive
+    entries instead of files. Images larger than ``max_image_bytes`` fail;
+    ``revalidate`` tells the export manifest to re-check saved images with
+    conditional requests instead of trusting them. ``bound`` gives one export
+    of several running at once its own log, metrics and cancel token on the
+    engine's shared session, blob store and transfer limits.
+    """
+
+    def __init__(self, headers=None, max_workers=DEFAULT_MAX_WORKERS, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                 timeout=DEFAULT_TIMEOUT, log_func=print_log, session=None, blob_store=None, client=None,
+                 metrics=None, cancel_token=None, max_image_bytes=DEFAULT_MAX_IMAGE_BYTES, revalidate=False):
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.timeout = timeout
+        self.max_image_bytes = max_image_bytes
+        self.revalidate = revalidate
+        self.log_func = log_func or print_log
+        self._owns_session = session is None
+        self.session = session if session is not None else create_session(headers, pool_size=self.max_workers)
+        self.blob_store = blob_store
+        self.cancel_token = cancel_token
+        if client is None: self.client = HttpClient(self.session, log_func=self.log_func, metrics=metrics)
+        else: self.client = client.with_session(self.session, log_func=self.log_func, metrics=metrics)
+        self._global_slots = threading.BoundedSemaphore(self.max_workers)
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._executor is not None: self._executor.shutdown(wait=True)
+        if self._owns_session: self.session.close()
+
+    def bound(self, log_func=None, metrics=None, cancel_token=None):
+        """
+        An engine for one export that shares this engine's session, blob store, ``max_workers`` and
+        per-host slots (so concurrent exports together stay within them) but logs to ``log_func``,
+        records into ``metrics`` and checks ``cancel_token``. Closing it leaves this engine open.
+        """
+        engine = copy.copy(self)
+        engine.log_func = log_func or self.log_func
+        engine.cancel_token = cancel_token
+        engine.client = self.client.with_session(self.session, log_func=engine.log_func, metrics=metrics)
+        engine._owns_session = False
+        engine._executor = None
+        engine._executor_lock = threading.Lock()
+        return engine
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+    def _fetch(self, url, save_path, hashed=False, validators=None, atomic=True):
+        """
+        Returns ``(bytes_written, etag, last_modified, sha256 hexdigest or None)``,
+        or None for 304 Not Modified; every retry rewrites the file from scratch.
+        """
+        def attempt():
+            hasher = hashlib.sha256() if hashed else None
+            with self._global_slots, self._host_slot(url): # Slots are not held while backing off
+                fetched = download_image(self.client.session, url, save_path, self.timeout, hasher,
+                                         self.max_image_bytes, validators, atomic)
+            if fetched is None: return None
+            return fetched + ((hasher.hexdigest() if hasher else None),)
+        return self.client.call(url, attempt)
+
+    def _fetch_via_store(self, job):
+        def fetch(tmp_path): # The store's temp file already makes the write atomic
+            bytes_written, etag, last_modified, digest = self._fetch(job.url, tmp_path, hashed=True, atomic=False)
+            return digest, (bytes_written, etag, last_modified)
+        blob_path, fetch_info = self.blob_store.get_or_fetch(job.url, os.path.splitext(job.save_path)[1], fetch)
+        self.blob_store.materialize(blob_path, job.save_path)
+        if fetch_info is None: return os.path.getsize(blob_path), None, None, True
+        return fetch_info + (False,)
+
+    def _revalidate(self, job):
+        """Conditional re-fetch of a saved image: 304 keeps it, a new body replaces it (and becomes the URL's blob)."""
+        fetched = self._fetch(job.url, job.save_path, hashed=self.blob_store is not None, validators=job.validators)
+        if fetched is None: return os.path.getsize(job.save_path), None, None, True
+        bytes_written, etag, last_modified, digest = fetched
+        if self.blob_store is not None: self.blob_store.adopt(job.url, job.save_path, digest)
+        return bytes_written, etag, last_modified, False
+
+    def _fetch_bytes(self, url):
+        def attempt():
+            with self._global_slots, self._host_slot(url):
+                return read_image(self.client.session, url, self.timeout, self.max_image_bytes)
+        return self.client.call(url, attempt)
+
+    def _fetch_into_archive(self, job, archive):
+        """Copies a stored blob into the job's archive entry, else downloads it into memory and writes the entry."""
+        entry_name = archive.entry_name(job.save_path)
+        blob_path = self.blob_store.lookup_url(job.url) if self.blob_store is not None else None
+        if blob_path: return archive.write_file(entry_name, blob_path), None, None, True
+        body, etag = self._fetch_bytes(job.url)
+        archive.write_bytes(entry_name, body)
+        if self.blob_store is not None: self.blob_store.put_bytes(job.url, os.path.splitext(job.save_path)[1], body)
+        return len(body), etag, None, False
+
+    def _run_job(self, job, archive=None):
+        if self.cancel_token is not None: self.cancel_token.checkpoint()
+        try:
+            if archive is not None:
+                bytes_written, etag, last_modified, reused = self._fetch_into_archive(job, archive)
+            elif job.validators:
+                bytes_written, etag, last_modified, reused = self._revalidate(job)
+            elif self.blob_store is not None:
+                bytes_written, etag, last_modified, reused = self._fetch_via_store(job)
+            else:
+                bytes_written, etag, last_modified, _ = self._fetch(job.url, job.save_path); reused = False
+            action = "Downloaded" if not reused else "Not modified" if job.validators else "Reused"
+            self.log_func(f"  {action} {os.path.basename(job.save_path)} ({bytes_written} bytes)\n")
+            return ImageResult(job, True, bytes_written=bytes_written, reused=reused, etag=etag, last_modified=last_modified)
+        except requests.exceptions.Timeout:
+            error = f"Timeout downloading: {job.url}"
+        except requests.exceptions.HTTPError as e:
+            error = f"HTTP error {e.response.status_code} for {job.url}: {e}"
+        except requests.exceptions.RequestException as e:
+            error = f"Error downloading {job.url}: {e}"
+        except OSError as e:
+            error = f"Error writing {job.save_path}: {e}"
+        self.log_func(f"  {error}\n")
+        return ImageResult(job, False, error=error)
+
+    def submit(self, job, on_result=None):
+        """
+        Queues one job on the engine's long-lived pool and returns a
+        ``Future`` of its ``ImageResult``; used by the streaming pipeline,
+        which consumes results question by question while later ones are
+        still downloading. ``on_result`` runs on the worker thread.
+        """
+        with self._executor_lock:
+            if self._executor is None: self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        def run_and_report():
+            result = self._run_job(job)
+            if on_result is not None: on_result(result)
+            return result
+        return self._executor.submit(run_and_report)
+
+    def finish(self, results):
+        """Persists the blob store index and logs the summary line for ``results``."""
+        if self.blob_store is not None: self.blob_store.save()
+        failed = sum(1 for r in results if not r.ok)
+        reused = sum(1 for r in results if r.reused)
+        self.log_func(f"Image downloads finished: {len(results) - failed} ok ({reused} reused from store), {failed} failed.\n")
+
+    def download_all(self, jobs, on_result=None, archive=None):
+        """
+        Downloads every job and returns one ``ImageResult`` per job, in job
+        order. ``on_result(result)`` is called from the worker thread as soon
+        as each job finishes. With an ``archive`` each image becomes the
+        archive entry for its ``save_path``; nothing is written to disk.
+        """
+        jobs = list(jobs)
+        if not jobs: return []
+        self.log_func(f"Downloading {len(jobs)} images with {self.max_workers} workers "
+                      f"(max {self.per_host_limit} per host)...\n")
+
+        def run_and_report(job):
+            result = self._run_job(job, archive)
+            if on_result is not None: on_result(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+            results = list(pool.map(run_and_report, jobs))
+        self.finish(results)
+        return results
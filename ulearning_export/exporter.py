@@ -0,0 +1,199 @@
+"""
+Export core shared by every entry point.
+
+The CLI (``export_test.py``), the GUI (``export-with-gui.py``) and the
+image-only mode (``test(success).py``) run the same stages from here:
+fetch the report (``fetch_exam_report``), normalize it (``model``),
+write the per-question files and download the images
+(``process_exam_data``) and render the exam files (``renderers``), or all
+of it in one pass (``stream_export``). Which outputs are written is the
+list of renderers passed in, so the image-only mode is simply an export
+without renderers; which questions, and whether images are downloaded at
+all, is the ``selection.ExportSelection`` the exam was normalized with.
+The entry points keep their configuration, logging and UI; a fix to a
+stage lands here once.
+
+This module imports the whole export stack; the entry points import it
+inside their export functions so they start fast.
+"""
+import contextlib
+import json
+import os
+import re
+
+import requests
+
+from .download import plan_question_jobs
+from .http_client import HttpClient
+from .image_index import IMAGE_INDEX_FILENAME, ImageIndex
+from .log import print_log
+from .manifest import ExportManifest, question_content_hash
+from .pipeline import StreamWriter, export_streaming
+from .renderers import output_location, open_output_text, split_renderers
+
+
+def sanitize_filename(filename):
+    if filename is None: filename = "untitled"
+    filename = str(filename)
+    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    filename = re.sub(r'\s+', '_', filename)
+    filename = re.sub(r'_+', '_', filename)
+    filename = filename.strip('_')
+    return filename[:100]
+
+
+def exam_output_names(exam_id, exam_data, selection=None):
+    """
+    ``(exam folder name, file name stem)`` for a report: ``exam_<id>_<title>`` and the sanitized title,
+    followed by the selection's tag for a partial ``selection`` (its files go into the same folder).
+    """
+    stem = sanitize_filename((exam_data.get("result") or {}).get("examTitle", "UnknownExam"))
+    folder_name = f"exam_{exam_id}_{stem}"
+    if selection is not None and selection.partial: stem = f"{stem}_{selection.tag()}"
+    return folder_name, stem
+
+
+def _base_image_index(exam_dir, selection, archive=None):
+    """
+    Index new image results are added to: empty for a full export, the saved one when the selection
+    leaves questions out or skips the downloads (so the images of the other questions stay indexed).
+    """
+    if archive is None and selection is not None and (selection.partial or not selection.images):
+        return ImageIndex.load(exam_dir)
+    return ImageIndex()
+
+
+# --- Fetch ---
+def refresh_session(base_api_url, ua_token, trace_id, headers, client=None, log_func=print_log):
+    refresh_url = f"{base_api_url}/users/login/refresh10Session?uaToken={ua_token}&traceId={trace_id}"
+    log_func(f"Attempting to refresh session for traceId: {trace_id}...\n")
+    headers = headers.copy(); headers["authorization"] = ua_token
+    try:
+        with (client or HttpClient(log_func=log_func)) as http: response = http.get(refresh_url, headers=headers, timeout=10)
+        response.raise_for_status(); log_func("Session refresh request successful.\n")
+    except requests.exceptions.RequestException as e:
+        log_func(f"Error refreshing session: {e}\nProceeding with the current token.\n")
+    return ua_token
+
+
+def fetch_exam_report(base_api_url, exam_id, trace_id, auth_token, headers, client=None, log_func=print_log):
+    """The ``getExamReport`` JSON, or None (the reason is logged). Batch runs pass one shared ``client``."""
+    report_url = f"{base_api_url}/exams/user/study/getExamReport?examId={exam_id}&traceId={trace_id}"
+    log_func(f"Fetching exam report for examId: {exam_id}, traceId: {trace_id}...\n")
+    headers = headers.copy(); headers["authorization"] = auth_token
+    try:
+        with (client or HttpClient(log_func=log_func)) as http: response = http.get(report_url, headers=headers, timeout=15)
+        response.raise_for_status(); return response.json()
+    except requests.exceptions.Timeout: log_func(f"Timeout: {report_url}\n")
+    except requests.exceptions.HTTPError as e:
+        log_func(f"HTTP error: {e.response.status_code} - {e}\nServer response: {e.response.text[:500]}...\n")
+        if e.response.status_code == 401: log_func("Authorization error (401).\n")
+    except requests.exceptions.RequestException as e: log_func(f"Request error: {e}\n")
+    except json.JSONDecodeError: log_func(f"JSON Decode Error. Response: {response.text[:500]}...\n")
+    return None
+
+
+# --- Questions and images ---
+def write_question_outputs(question, question_dir, renderers, manifest=None, archive=None, log_func=print_log):
+    """
+    Writes the files of the question renderers into ``question_dir``. With a ``manifest``, files written
+    from identical question JSON that still exist are kept; with an ``archive`` they become archive entries.
+    """
+    log_func(f" Processing Question {question.order_index} (ID: {question.question_id}) -> '{question.folder_name}'\n")
+    content_hash = question_content_hash(question.source) if renderers and manifest is not None else None
+    for renderer in renderers:
+        output_path = os.path.join(question_dir, renderer.output_name())
+        if manifest is not None:
+            if renderer.name == "txt": question_key = question.folder_name # Manifests from before the registry
+            else: question_key = f"{question.folder_name}/{renderer.output_name()}"
+            if manifest.question_unchanged(question_key, content_hash, output_path):
+                log_func(f"  Unchanged since last export, keeping {renderer.output_name()}\n"); continue
+        with open_output_text(output_path, archive) as f: renderer.write_question(f, question, None)
+        if manifest is not None: manifest.record_question(question_key, content_hash, output_path)
+
+
+def process_exam_data(exam, exam_dir, engine, renderers=(), log_func=print_log, metrics=None, progress=None,
+                      cancel_token=None, archive=None, postprocessor=None, selection=None):
+    """
+    Writes the question renderers' files (e.g. question_data.txt) for new or changed questions, then
+    downloads the missing or changed images of the exam concurrently on ``engine``. Progress is tracked
+    in the exam's export manifest so re-runs are incremental and interrupted runs resume. Returns the
+    ImageIndex the exam renderers look images up in (also saved as image_index.json).
+
+    Questions and images done are reported to ``progress``, image counters go to ``metrics`` and
+    ``cancel_token`` is checked before every question. With an ``archive`` (ExamArchive of ``exam_dir``)
+    every file becomes an archive entry instead, written in full each time (no manifest). A
+    ``postprocessor`` (ImagePostprocessor) runs over the downloaded images before the index is built.
+    A ``selection`` without images queues no downloads and returns the index saved by an earlier export.
+    """
+    if exam is None: log_func("Exam JSON invalid or 'result' missing.\n"); return ImageIndex()
+    if not exam.parts: log_func("No 'part' in exam data.\n"); return ImageIndex()
+    download_images = selection is None or selection.images
+    question_renderers, _ = split_renderers(renderers)
+    manifest = ExportManifest(exam_dir) if archive is None else None
+    exam_image_jobs = []
+    if progress: progress.add_totals(questions=sum(len(part.questions) for part in exam.parts))
+
+    for part in exam.parts:
+        if not part.questions: log_func(f"No questions in part {part.index + 1}.\n"); continue
+        log_func(f"\nProcessing Part {part.index + 1} (Name: {part.name})...\n")
+        for question in part.questions:
+            if cancel_token: cancel_token.checkpoint()
+            question_dir = os.path.join(exam_dir, question.folder_name)
+            if archive is None: os.makedirs(question_dir, exist_ok=True)
+            write_question_outputs(question, question_dir, question_renderers, manifest, archive, log_func)
+            if download_images: exam_image_jobs.extend(plan_question_jobs(question.image_requests(), question_dir, log_func))
+            if progress: progress.question_done()
+
+    if not download_images:
+        log_func("Images not selected, skipping the image downloads.\n")
+        if manifest is not None: manifest.save()
+        return _base_image_index(exam_dir, selection, archive)
+    if progress: progress.add_totals(images=len(exam_image_jobs))
+    on_result = progress.image_done if progress else None
+    if archive is not None: image_results = engine.download_all(exam_image_jobs, on_result, archive=archive)
+    else: image_results = manifest.download_missing(engine, exam_image_jobs, on_result)
+    if metrics: metrics.count_images(image_results)
+    if postprocessor:
+        with postprocessor: postprocessor.process_all(image_results)
+        log_func(postprocessor.summary())
+    image_index = _base_image_index(exam_dir, selection, archive)
+    image_index.add_results(image_results, exam_dir)
+    if archive is not None: archive.write_text(IMAGE_INDEX_FILENAME, image_index.dumps())
+    else: image_index.save(exam_dir)
+    return image_index
+
+
+# --- Streaming export ---
+def stream_export(exam, exam_dir, engine, renderers, stem, metrics=None, postprocessor=None, extra_writers=(),
+                  log_func=print_log, selection=None):
+    """
+    Streaming export: each question's files are written and its images queued as it is normalized,
+    and the question goes into every exam renderer's file as soon as its images are done, while later
+    images are still downloading. ``exam`` comes from ``model.stream_exam`` (single pass);
+    ``extra_writers`` (StreamWriter) receive the parts and questions too. Images are only queued when
+    the ``selection`` includes them. Returns the ImageIndex.
+    """
+    if exam is None: log_func("Exam JSON invalid or 'result' missing.\n"); return ImageIndex()
+    question_renderers, exam_renderers = split_renderers(renderers)
+    output_paths = [os.path.join(exam_dir, renderer.output_name(stem)) for renderer in exam_renderers]
+    with contextlib.ExitStack() as files:
+        outputs = [(renderer, files.enter_context(open(path, 'w', encoding='utf-8')))
+                   for renderer, path in zip(exam_renderers, output_paths)]
+        writers = []
+        for renderer, f in outputs:
+            if renderer.begin: renderer.begin(f, exam.title)
+            write_part = (lambda part, r=renderer, f=f: r.write_part(f, part)) if renderer.write_part else (lambda part: None)
+            writers.append(StreamWriter(renderer.name, write_part,
+                                        lambda question, image_index, r=renderer, f=f: r.write_question(f, question, image_index)))
+        image_index = export_streaming(
+            exam, exam_dir, engine, writers + list(extra_writers),
+            lambda question, question_dir, manifest: write_question_outputs(question, question_dir, question_renderers,
+                                                                            manifest, log_func=log_func),
+            log_func=log_func, metrics=metrics, postprocessor=postprocessor,
+            download_images=selection is None or selection.images, image_index=_base_image_index(exam_dir, selection))
+        for renderer, f in outputs:
+            if renderer.end: renderer.end(f)
+    for renderer, path in zip(exam_renderers, output_paths):
+        log_func(f"{renderer.label} 试卷已生成: {output_location(path)}\n")
+    return image_index
@@ -0,0 +1,223 @@
+"""
+HTML fragment helpers: clean text and image sources from question HTML.
+
+``parse_fragment`` extracts everything the writers need from one fragment
+(clean text, ``<img>`` sources and the text of the first ``<p>``) in a
+single pass over the standard library's ``html.parser`` events; no tree is
+built. The result matches what the earlier BeautifulSoup ('html.parser')
+implementation produced: the same tag stack rules (void elements, unmatched
+end tags, unclosed tags), entity handling, whitespace-only string
+collapsing and exclusion of script/style/template contents, comments and
+declarations. ``tests/test_htmltext.py`` checks that against the
+BeautifulSoup reference, ``benchmarks/htmltext_parity.py`` on larger
+corpora and with timings.
+
+Parsed fragments are memoized (``FRAGMENT_CACHE_SIZE`` entries), since
+option labels, empty answers and repeated stems recur across an exam and
+across exams; ``ParsedFragment`` is therefore immutable in practice
+(``image_urls`` is a tuple).
+"""
+import re
+from functools import lru_cache
+from html.entities import html5
+from html.parser import HTMLParser
+
+FRAGMENT_CACHE_SIZE = 8192
+
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_EDGE_NEWLINES_RE = re.compile(r'^\s*\n|\n\s*$')
+_DECIMAL_REF_RE = re.compile(r'^([0-9]+)(.*)', re.S)
+_HEX_REF_RE = re.compile(r'^([0-9a-f]+)(.*)', re.S)
+
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_ENTITIES = {name[:-1]: char for name, char in html5.items() if name.endswith(';')}
+_VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+                        "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+                        "image", "isindex", "nextid", "spacer"))
+_PRESERVE_WHITESPACE_TAGS = frozenset(("pre", "textarea"))
+_NON_TEXT_CONTAINERS = frozenset(("script", "style", "template", "rt", "rp")) # Their strings are not page text
+
+_TEXT, _CDATA, _MARKUP = 0, 1, 2 # Kinds of string run: page text, CDATA section, comment/declaration/PI
+
+
+class ParsedFragment:
+    __slots__ = ("text", "image_urls", "first_p_text")
+
+    def __init__(self, text="", image_urls=(), first_p_text=None):
+        self.text = text
+        self.image_urls = tuple(image_urls)
+        self.first_p_text = first_p_text
+
+
+EMPTY_FRAGMENT = ParsedFragment()
+
+
+def _numeric_reference(name):
+    """``&#...;`` body -> (character, trailing data), resolving like browsers (windows-1252 for 0x80-0x9F)."""
+    base, pattern = 10, _DECIMAL_REF_RE
+    if name[:1] in ("x", "X"): name, base, pattern = name[1:], 16, _HEX_REF_RE
+    extra = ""
+    try:
+        number = int(name, base)
+    except ValueError:
+        match = pattern.search(name)
+        if match is None: return "", name
+        number, extra = int(match.group(1), base), match.group(2)
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff: return "\ufffd", extra
+    if 0x80 <= number <= 0x9f:
+        try:
+            return bytes((number,)).decode('cp1252'), extra
+        except UnicodeDecodeError:
+            pass
+    return chr(number), extra
+
+
+class _FragmentParser(HTMLParser):
+    """Collects text runs, ``<img>`` sources and the first ``<p>``'s strings while tracking the open tags."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.pieces = []
+        self.image_urls = []
+        self.first_p_strings = None # List once the first <p> opens
+        self._first_p_depth = None # Stack depth of the first <p> while it is open
+        self._data = []
+        self._stack = []
+        self._open_counts = {}
+        self._preserve_depth = 0
+        self._container_depth = 0
+        self._closed_void = []
+
+    # --- Text runs ---
+    def _flush(self, kind=_TEXT):
+        if not self._data: return
+        text = "".join(self._data); self._data = []
+        if not self._preserve_depth and not text.strip(_ASCII_SPACES): text = "\n" if "\n" in text else " "
+        if kind == _MARKUP or (kind == _TEXT and self._container_depth): return
+        self.pieces.append(text)
+        if self._first_p_depth is not None:
+            text = text.strip()
+            if text: self.first_p_strings.append(text)
+
+    # --- Tag stack ---
+    def _push(self, tag):
+        self._stack.append(tag)
+        self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+        if tag in _PRESERVE_WHITESPACE_TAGS: self._preserve_depth += 1
+        if tag in _NON_TEXT_CONTAINERS: self._container_depth += 1
+        if tag == "p" and self.first_p_strings is None:
+            self.first_p_strings = []; self._first_p_depth = len(self._stack)
+
+    def _pop(self):
+        tag = self._stack.pop()
+        self._open_counts[tag] -= 1
+        if tag in _PRESERVE_WHITESPACE_TAGS: self._preserve_depth -= 1
+        if tag in _NON_TEXT_CONTAINERS: self._container_depth -= 1
+        if tag == "p":
+            if self._first_p_depth == len(self._stack) + 1: self._first_p_depth = None
+            self.pieces.append("\n")
+        return tag
+
+    def _pop_to(self, tag):
+        if not self._open_counts.get(tag): return # Unmatched end tags are ignored
+        while self._pop() != tag: pass
+
+    def _start(self, tag, attrs, close_void):
+        self._flush()
+        if tag == "img":
+            src = None
+            for name, value in attrs:
+                if name == "src": src = value or "" # Duplicate attributes: the last one wins
+            src = src.strip() if src else ""
+            if src and src not in self.image_urls: self.image_urls.append(src)
+        elif tag == "br":
+            self.pieces.append("\n")
+        self._push(tag)
+        if close_void and tag in _VOID_TAGS:
+            self._end(tag, False)
+            self._closed_void.append(tag) # A later </br>, </img>, ... is then skipped
+
+    def _end(self, tag, check_closed_void=True):
+        if check_closed_void and tag in self._closed_void: self._closed_void.remove(tag); return
+        self._flush()
+        self._pop_to(tag)
+
+    # --- HTMLParser events ---
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, True)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, False)
+        self._end(tag, False)
+
+    def handle_endtag(self, tag):
+        self._end(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_entityref(self, name):
+        char = _ENTITIES.get(name)
+        self._data.append(char if char is not None else "&" + name)
+
+    def handle_charref(self, name):
+        char, extra = _numeric_reference(name)
+        self._data.append(char); self._data.append(extra)
+
+    def handle_comment(self, data):
+        self._flush(); self._data.append(data); self._flush(_MARKUP)
+
+    def handle_decl(self, decl):
+        self._flush(); self._data.append(decl); self._flush(_MARKUP)
+
+    def handle_pi(self, data):
+        self._flush(); self._data.append(data); self._flush(_MARKUP)
+
+    def unknown_decl(self, data):
+        self._flush()
+        is_cdata = data.upper().startswith("CDATA[")
+        self._data.append(data[6:] if is_cdata else data)
+        self._flush(_CDATA if is_cdata else _MARKUP)
+
+    def finish(self):
+        self.close()
+        self._flush()
+        while self._stack: self._pop()
+
+
+def _finish_text(raw_text):
+    text = _BLANK_LINES_RE.sub('\n\n', raw_text)
+    text = _EDGE_NEWLINES_RE.sub('', text)
+    return text.strip()
+
+
+def convert_fragment(html_content):
+    """Uncached single-pass conversion of one HTML string into a ``ParsedFragment``."""
+    parser = _FragmentParser()
+    parser.feed(html_content)
+    parser.finish()
+    first_p_text = "".join(parser.first_p_strings) if parser.first_p_strings is not None else None
+    return ParsedFragment(_finish_text("".join(parser.pieces)), parser.image_urls, first_p_text)
+
+
+_convert_cached = lru_cache(maxsize=FRAGMENT_CACHE_SIZE)(convert_fragment)
+
+
+def parse_fragment(html_content):
+    """Returns the (shared, memoized) ``ParsedFragment`` for ``html_content``."""
+    if not html_content or not isinstance(html_content, str): return EMPTY_FRAGMENT
+    return _convert_cached(html_content)
+
+
+def fragment_cache_info():
+    """``functools`` cache statistics (hits, misses, maxsize, currsize) of ``parse_fragment``."""
+    return _convert_cached.cache_info()
+
+
+def get_clean_text_from_html(html_content):
+    return parse_fragment(html_content).text
+
+
+def extract_image_urls_from_html(html_content):
+    """Unique ``<img src>`` values in document order."""
+    return list(parse_fragment(html_content).image_urls)
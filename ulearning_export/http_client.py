@@ -0,0 +1,274 @@
+"""
+Shared HTTP request layer with retries, rate limiting and circuit breaking.
+
+Every API call (``getExamReport``, ``refresh10Session``) and every image
+download goes through an ``HttpClient``:
+
+* transient failures (connection errors, timeouts, broken streams, HTTP
+  408/429/5xx) are retried with exponential backoff and full jitter, bounded
+  per call by ``RetryPolicy.max_attempts`` and overall by a ``RetryBudget`` so
+  an outage cannot multiply the request volume;
+* ``Retry-After`` on 429/503 is honoured and also pauses the host's
+  ``TokenBucket``, so the other worker threads back off too;
+* a per-host token bucket caps the request rate to each host;
+* a per-host ``CircuitBreaker`` fails fast once a host keeps failing, and lets
+  a single trial request through after a cool-down.
+"""
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .log import print_log
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 20.0
+MAX_RETRY_AFTER = 60.0
+DEFAULT_RATE_PER_HOST = 20.0 # Requests per second
+DEFAULT_BURST_PER_HOST = 20
+DEFAULT_FAILURE_THRESHOLD = 8
+DEFAULT_RESET_TIMEOUT = 30.0
+RETRY_STATUS_CODES = frozenset((408, 429, 500, 502, 503, 504))
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+
+def create_session(headers=None, pool_size=DEFAULT_POOL_SIZE):
+    """Returns a ``requests.Session`` whose connection pool can serve ``pool_size`` threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers: session.headers.update(headers)
+    return session
+
+
+def parse_retry_after(value):
+    """``Retry-After`` header (seconds or HTTP date) -> seconds to wait, or None."""
+    if not value: return None
+    value = value.strip()
+    if value.isdigit(): return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None: return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request while the host's circuit is open."""
+
+
+class RetryPolicy:
+    __slots__ = ("max_attempts", "base_delay", "max_delay")
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, retry_number):
+        """Full-jitter exponential backoff for the ``retry_number``-th retry (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry_number - 1))))
+
+
+class RetryBudget:
+    """Allows ``min_retries`` plus ``ratio`` retries per first attempt, shared by all calls of a client."""
+
+    def __init__(self, ratio=0.2, min_retries=10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self._requests = 0
+        self._retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock: self._requests += 1
+
+    def try_spend(self):
+        with self._lock:
+            if self._retries >= self.min_retries + self.ratio * self._requests: return False
+            self._retries += 1
+            return True
+
+
+class TokenBucket:
+    """Blocking token bucket: ``rate`` tokens per second, at most ``capacity`` stored."""
+
+    def __init__(self, rate=DEFAULT_RATE_PER_HOST, capacity=DEFAULT_BURST_PER_HOST):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1: self._tokens -= 1; return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hands out no tokens for ``seconds`` (used when the server sends ``Retry-After``)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0; self._updated = self._paused_until
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures; while open every
+    call fails fast. After ``reset_timeout`` seconds one trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None: return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.reset_timeout: return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0; self._opened_at = None; self._trial_running = False
+
+    def record_failure(self):
+        """Returns True if this failure opened (or re-opened) the circuit."""
+        with self._lock:
+            self._failures += 1
+            reopened = self._trial_running
+            self._trial_running = False
+            if reopened or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class HttpClient:
+    """
+    Retrying, rate-limited request layer over a ``requests.Session``.
+
+    ``get`` sends one GET and returns the response (raising ``HTTPError``
+    only for retryable statuses that are still failing after the last
+    attempt); ``call`` retries an arbitrary ``attempt()`` callable, which is
+    how streamed downloads restart from scratch when the body breaks off.
+    ``with_session`` returns a client for another session that shares this
+    client's rate limits, circuit breakers and retry budget. Every attempt
+    is reported to ``metrics`` (an ``ExportMetrics``) when one is set.
+    """
+
+    def __init__(self, session=None, policy=None, budget=None, rate_per_host=None, burst_per_host=None,
+                 log_func=print_log, metrics=None):
+        self._owns_session = session is None
+        self.session = session if session is not None else create_session()
+        self.policy = policy or RetryPolicy()
+        self.budget = budget or RetryBudget()
+        # Module defaults are read here (not at import) so a tool can tune them for every client it creates
+        self.rate_per_host = rate_per_host if rate_per_host is not None else DEFAULT_RATE_PER_HOST
+        self.burst_per_host = burst_per_host if burst_per_host is not None else DEFAULT_BURST_PER_HOST
+        self.log_func = log_func or print_log
+        self.metrics = metrics
+        self._buckets = {}
+        self._breakers = {}
+        self._hosts_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._owns_session: self.session.close()
+
+    def with_session(self, session, log_func=None, metrics=None):
+        client = HttpClient(session, self.policy, self.budget, self.rate_per_host, self.burst_per_host,
+                            log_func or self.log_func, metrics or self.metrics)
+        client._buckets, client._breakers, client._hosts_lock = self._buckets, self._breakers, self._hosts_lock
+        client._owns_session = False
+        return client
+
+    def _host_guards(self, url):
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None: bucket = self._buckets[host] = TokenBucket(self.rate_per_host, self.burst_per_host)
+            breaker = self._breakers.get(host)
+            if breaker is None: breaker = self._breakers[host] = CircuitBreaker()
+            return bucket, breaker
+
+    def call(self, url, attempt):
+        """Runs ``attempt()`` for ``url`` under the rate limit and circuit breaker, retrying transient failures."""
+        bucket, breaker = self._host_guards(url)
+        self.budget.record_request()
+        attempt_number = 1
+        while True:
+            if not breaker.allow(): raise CircuitOpenError(f"Circuit open for {urlparse(url).netloc}, not requesting {url}")
+            bucket.acquire()
+            started = time.perf_counter()
+            try:
+                result = attempt()
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if self.metrics: self.metrics.record_request(url, time.perf_counter() - started, status, failed=True)
+                if status not in RETRY_STATUS_CODES:
+                    breaker.record_success() # The host answered; the request itself is wrong
+                    raise
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                if retry_after is not None: bucket.pause(min(retry_after, MAX_RETRY_AFTER))
+                reason = f"HTTP {status}"
+                error = e
+            except RETRY_EXCEPTIONS as e:
+                if self.metrics: self.metrics.record_request(url, time.perf_counter() - started, type(e).__name__, failed=True)
+                retry_after, reason, error = None, type(e).__name__, e
+            except Exception as e: # Not retried (e.g. ImageTooLargeError, InvalidURL, a failed local write)
+                if self.metrics: self.metrics.record_request(url, time.perf_counter() - started, type(e).__name__, failed=True)
+                # Settles a half-open trial either way. The host answered if the error carries its response;
+                # errors outside requests come from our side (writing the body), after it answered.
+                host_answered = getattr(e, "response", None) is not None or not isinstance(e, requests.exceptions.RequestException)
+                if host_answered: breaker.record_success()
+                elif breaker.record_failure(): self.log_func(f"  Circuit opened for {urlparse(url).netloc} after repeated failures.\n")
+                raise
+            else:
+                if self.metrics: self.metrics.record_request(url, time.perf_counter() - started, getattr(result, "status_code", 200))
+                breaker.record_success()
+                return result
+
+            if breaker.record_failure(): self.log_func(f"  Circuit opened for {urlparse(url).netloc} after repeated failures.\n")
+            if attempt_number >= self.policy.max_attempts or not self.budget.try_spend(): raise error
+            delay = self.policy.backoff(attempt_number)
+            if retry_after is not None: delay = max(delay, min(retry_after, MAX_RETRY_AFTER))
+            attempt_number += 1
+            self.log_func(f"  {reason} for {url}; retrying in {delay:.1f}s (attempt {attempt_number}/{self.policy.max_attempts})\n")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        def attempt():
+            response = self.session.get(url, **kwargs)
+            if response.status_code in RETRY_STATUS_CODES: response.raise_for_status()
+            return response
+        return self.call(url, attempt)
@@ -0,0 +1,98 @@
+"""
+Index of exported images: (question folder, slot, ordinal) -> relative path.
+
+The download stage builds it from the ``ImageResult`` list and persists it
+as ``image_index.json`` in the exam folder, so the Markdown and TeX writers
+look images up directly instead of listing and sorting every question
+folder once per title, option, answer and replay.
+
+Slots are the filename prefixes without the ordinal: ``title``,
+``option_A``, ``correct_answer_1``, ``correct_replay``. Images handled by
+the optional post-processing stage also record their derived versions
+(``print`` for TeX, ``thumb`` for Markdown) as a fifth row element.
+"""
+import json
+import os
+import re
+
+IMAGE_INDEX_FILENAME = "image_index.json"
+_PREFIX_RE = re.compile(r'^(?P<slot>.+)_img_(?P<ordinal>\d+)$')
+
+
+def split_filename_prefix(filename_prefix):
+    """``"option_A_img_2"`` -> ``("option_A", 2)``; None if the prefix has no ordinal."""
+    match = _PREFIX_RE.match(filename_prefix)
+    if not match: return None
+    return match.group('slot'), int(match.group('ordinal'))
+
+
+class ImageIndex:
+    def __init__(self, entries=None):
+        self._entries = {} # (folder_name, slot) -> {ordinal: relative path}
+        self._variants = {} # relative path -> {variant name: relative path}
+        for entry in entries or ():
+            self.add(*entry)
+
+    def add(self, folder_name, slot, ordinal, rel_path, variants=None):
+        self._entries.setdefault((folder_name, slot), {})[ordinal] = rel_path
+        if variants: self._variants[rel_path] = dict(variants)
+        else: self._variants.pop(rel_path, None)
+
+    def get(self, folder_name, slot, variant=None):
+        """
+        Relative paths (``/``-separated, relative to the exam folder) for one
+        slot, by ordinal; with ``variant``, that derived version where one
+        exists, else the original.
+        """
+        ordinals = self._entries.get((folder_name, slot))
+        if not ordinals: return []
+        paths = [ordinals[k] for k in sorted(ordinals)]
+        if variant is None or not self._variants: return paths
+        return [self._variants.get(path, {}).get(variant, path) for path in paths]
+
+    def variant(self, rel_path, variant):
+        """The derived version ``variant`` of the image at ``rel_path``, or None."""
+        return self._variants.get(rel_path, {}).get(variant)
+
+    def __len__(self):
+        return sum(len(ordinals) for ordinals in self._entries.values())
+
+    def add_results(self, results, exam_dir):
+        """Adds the successful ``ImageResult`` objects among ``results``."""
+        for result in results:
+            if not result.ok: continue
+            parsed = split_filename_prefix(result.job.filename_prefix)
+            if parsed is None: continue
+            rel_path = os.path.relpath(result.job.save_path, exam_dir).replace("\\", "/")
+            variants = {name: os.path.relpath(path, exam_dir).replace("\\", "/")
+                        for name, path in (result.variants or {}).items()}
+            self.add(os.path.basename(result.job.question_dir), parsed[0], parsed[1], rel_path, variants)
+
+    @classmethod
+    def from_results(cls, results, exam_dir):
+        """Builds the index from successful ``ImageResult`` objects."""
+        index = cls()
+        index.add_results(results, exam_dir)
+        return index
+
+    def dumps(self):
+        """The persisted form: a JSON list with one row per line, which keeps diffs readable."""
+        rows = [[folder_name, slot, ordinal, rel_path] + ([self._variants[rel_path]] if rel_path in self._variants else [])
+                for (folder_name, slot), ordinals in sorted(self._entries.items())
+                for ordinal, rel_path in sorted(ordinals.items())]
+        return "[\n" + ",\n".join(json.dumps(row, ensure_ascii=False) for row in rows) + "\n]\n"
+
+    def save(self, exam_dir):
+        path = os.path.join(exam_dir, IMAGE_INDEX_FILENAME)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f: f.write(self.dumps())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, exam_dir):
+        """Loads the persisted index; returns an empty index if there is none."""
+        try:
+            with open(os.path.join(exam_dir, IMAGE_INDEX_FILENAME), 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        return cls(tuple(row) for row in rows if isinstance(row, list) and len(row) in (4, 5))
@@ -0,0 +1,236 @@
+"""
+Optional image post-processing stage.
+
+Downloaded images are named after their URL, which is sometimes wrong (a
+JPEG saved as ``.png``), and formula screenshots are often much larger than
+print needs. ``ImagePostprocessor`` derives, per downloaded image:
+
+* ``print``: the version the TeX writer includes. The real format is
+  sniffed from the magic bytes and the file is given its correct extension
+  (a link, no copy); with Pillow, formats TeX cannot include (GIF, WebP,
+  BMP, TIFF) are converted to PNG, PNGs are recompressed losslessly (kept
+  only if smaller) and, with ``max_dpi``, images larger than the printed
+  size at that resolution are downscaled;
+* ``thumb``: with ``thumbnails`` and Pillow, a small preview the Markdown
+  writer shows, linking to the full image.
+
+The originals are never modified (they are hardlinks into the blob store
+and tracked by the export manifest); derived files sit next to them
+(``title_img_1.print.png``, ``title_img_1.thumb.jpg``), carry the
+original's mtime and are only redone when it changes. A PNG that lossless
+recompression does not shrink gets an empty ``title_img_1.print.nogain``
+marker instead, stamped the same way, so it is not recompressed again on
+every run. The work runs on its own thread pool, chained to the download
+futures, so download workers never wait for it. An image that cannot be
+processed (unreadable, or over Pillow's decompression bomb limit) is
+logged and keeps only its original; the export goes on. Pillow is
+optional; without it only the format sniffing and renaming happen.
+"""
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError: # Pillow is optional
+    Image = None
+
+from .log import print_log
+
+DEFAULT_POSTPROCESS_WORKERS = min(4, os.cpu_count() or 1)
+PRINT_WIDTH_INCHES = 5.0 # 0.8\textwidth on A4 with 1in margins
+PRINT_HEIGHT_INCHES = 2.9 # 0.25\textheight
+THUMBNAIL_SIZE = 240
+THUMBNAIL_JPEG_QUALITY = 80
+RESIZED_JPEG_QUALITY = 90
+TEX_FORMATS = frozenset((".png", ".jpg", ".pdf"))
+_EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".tiff": ".tif"}
+
+
+def sniff_image_format(head):
+    """File extension for the image format the leading bytes ``head`` belong to, or None if unknown."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"): return ".png"
+    if head.startswith(b"\xff\xd8\xff"): return ".jpg"
+    if head[:6] in (b"GIF87a", b"GIF89a"): return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP": return ".webp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"): return ".tif"
+    if head.startswith(b"%PDF-"): return ".pdf"
+    if head.startswith(b"BM"): return ".bmp"
+    text = head.lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in head.lower()): return ".svg"
+    return None
+
+
+def sniff_file_format(path, head_size=256):
+    with open(path, 'rb') as f: return sniff_image_format(f.read(head_size))
+
+
+def normalized_extension(path):
+    ext = os.path.splitext(path)[1].lower()
+    return _EXTENSION_ALIASES.get(ext, ext)
+
+
+def _is_fresh(derived_path, source_path):
+    """A derived file carries its source's mtime; a re-downloaded source (a different blob) has another one."""
+    try:
+        return os.stat(derived_path).st_mtime_ns == os.stat(source_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _stamp(derived_path, source_path):
+    source_stat = os.stat(source_path)
+    os.utime(derived_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+
+def _link_or_copy(source_path, dest_path):
+    if os.path.exists(dest_path):
+        if os.path.samefile(source_path, dest_path): return
+        os.remove(dest_path)
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copyfile(source_path, dest_path); _stamp(dest_path, source_path)
+
+
+class ImagePostprocessor:
+    """
+    ``process(result)`` fills ``result.variants`` (variant name -> path)
+    for one successful ``ImageResult``; ``process_all`` does a list in
+    parallel and ``chain(future)`` returns a future that resolves once the
+    downloaded image has been post-processed. ``stats`` counts the work
+    done; ``summary()`` formats it for the log.
+    """
+
+    def __init__(self, optimize=True, max_dpi=None, thumbnails=False, max_workers=DEFAULT_POSTPROCESS_WORKERS,
+                 log_func=print_log):
+        self.optimize = optimize
+        self.max_dpi = max_dpi
+        self.thumbnails = thumbnails
+        self.log_func = log_func or print_log
+        self.stats = {"images": 0, "renamed": 0, "converted": 0, "recompressed": 0, "downscaled": 0,
+                      "thumbnails": 0, "bytes_saved": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)))
+        if Image is None and (optimize or max_dpi or thumbnails):
+            self.log_func("Pillow 未安装: 只检测图片格式并修正扩展名，跳过压缩、缩放和缩略图 (pip install Pillow)。\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock: self.stats[name] += amount
+
+    # --- Scheduling ---
+    def chain(self, image_future):
+        """Future of the same ``ImageResult``, resolved after post-processing (which runs on this pool)."""
+        chained = Future()
+        def run(result):
+            try:
+                chained.set_result(self.process(result))
+            except BaseException as e:
+                chained.set_exception(e)
+        def on_downloaded(future):
+            if future.exception() is not None: chained.set_exception(future.exception()); return
+            self._executor.submit(run, future.result())
+        image_future.add_done_callback(on_downloaded)
+        return chained
+
+    def process_all(self, results):
+        return list(self._executor.map(self.process, results))
+
+    # --- Work ---
+    def process(self, result):
+        if not result.ok: return result
+        source_path = result.job.save_path
+        variants = {}
+        try:
+            real_ext = sniff_file_format(source_path) or normalized_extension(source_path)
+            print_path = source_path
+            if real_ext != normalized_extension(source_path): # Wrong extension from the URL
+                print_path = os.path.splitext(source_path)[0] + real_ext
+                _link_or_copy(source_path, print_path)
+                self._count("renamed")
+            if Image is not None and real_ext != ".svg" and real_ext != ".pdf":
+                print_path = self._print_version(print_path, real_ext)
+                if self.thumbnails:
+                    thumb_path = self._thumbnail(print_path)
+                    if thumb_path: variants["thumb"] = thumb_path
+            if print_path != source_path: variants["print"] = print_path
+        except Exception as e: # Unreadable images raise OSError, ValueError, Image.DecompressionBombError and more
+            self._count("errors")
+            self.log_func(f"  Post-processing failed for {os.path.basename(source_path)}: {e}\n")
+        self._count("images")
+        result.variants = variants or None
+        return result
+
+    def _max_print_size(self):
+        if not self.max_dpi: return None
+        return int(self.max_dpi * PRINT_WIDTH_INCHES), int(self.max_dpi * PRINT_HEIGHT_INCHES)
+
+    def _print_version(self, path, ext):
+        """Path of the TeX-ready version of ``path``: converted, recompressed and/or downscaled as configured."""
+        convert = ext not in TEX_FORMATS
+        max_size = self._max_print_size()
+        if not (convert or self.optimize or max_size): return path
+        stem = os.path.splitext(path)[0]
+        with Image.open(path) as image:
+            resize = bool(max_size) and (image.width > max_size[0] or image.height > max_size[1])
+            if not (convert or resize or ext == ".png"): return path # JPEG: Pillow cannot re-encode losslessly
+            out_ext = ".jpg" if ext == ".jpg" else ".png"
+            out_path = f"{stem}.print{out_ext}"
+            if _is_fresh(out_path, path): return out_path
+            no_gain_path = f"{stem}.print.nogain"
+            if not (convert or resize) and _is_fresh(no_gain_path, path): return path # Recompressed before, no gain
+            image.load()
+            if resize: image.thumbnail(max_size, Image.LANCZOS)
+            if out_ext == ".jpg":
+                if image.mode not in ("RGB", "L"): image = image.convert("RGB")
+                image.save(out_path, "JPEG", quality=RESIZED_JPEG_QUALITY, optimize=True, progressive=True)
+            else:
+                if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"): image = image.convert("RGBA")
+                image.save(out_path, "PNG", optimize=True)
+        _stamp(out_path, path)
+        saved = os.path.getsize(path) - os.path.getsize(out_path)
+        if not (convert or resize) and saved <= 0: # Lossless recompression did not help
+            os.remove(out_path)
+            with open(no_gain_path, 'wb'): pass
+            _stamp(no_gain_path, path)
+            return path
+        if os.path.exists(no_gain_path): os.remove(no_gain_path)
+        self._count("converted" if convert else "downscaled" if resize else "recompressed")
+        self._count("bytes_saved", max(saved, 0))
+        return out_path
+
+    def _thumbnail(self, path):
+        """Writes ``<stem>.thumb.(png|jpg)`` for images larger than ``THUMBNAIL_SIZE``; returns its path or None."""
+        stem = os.path.splitext(path)[0]
+        if stem.endswith(".print"): stem = stem[:-len(".print")]
+        with Image.open(path) as image:
+            if image.width <= THUMBNAIL_SIZE and image.height <= THUMBNAIL_SIZE: return None
+            keep_png = image.mode in ("1", "P", "LA", "RGBA") or "transparency" in image.info
+            thumb_path = f"{stem}.thumb{'.png' if keep_png else '.jpg'}"
+            if _is_fresh(thumb_path, path): return thumb_path
+            image.load()
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+            if keep_png:
+                image.save(thumb_path, "PNG", optimize=True)
+            else:
+                if image.mode not in ("RGB", "L"): image = image.convert("RGB")
+                image.save(thumb_path, "JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+        _stamp(thumb_path, path)
+        self._count("thumbnails")
+        return thumb_path
+
+    def summary(self):
+        s = self.stats
+        return (f"Image post-processing: {s['images']} images, {s['renamed']} extension fixes, {s['converted']} converted, "
+                f"{s['recompressed']} recompressed, {s['downscaled']} downscaled, {s['thumbnails']} thumbnails, "
+                f"{s['bytes_saved'] / 1024:.0f} KiB saved, {s['errors']} errors.\n")
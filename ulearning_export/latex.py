@@ -0,0 +1,71 @@
+"""
+Plain text -> TeX conversion for the TeX writers.
+
+``escape_latex_special_chars`` escapes every TeX special character in one
+``str.translate`` pass, so the braces of an inserted ``\\textbackslash{}``
+can no longer be escaped again by a later replacement.
+``text_to_tex`` converts a whole content block: blank lines become
+``\\par`` and formulas already written in TeX math (``$...$``, ``$$...$$``,
+``\\(...\\)``, ``\\[...\\]``) are passed through instead of having their
+``$``, ``_``, ``^`` and braces escaped. Only ``%`` and ``#`` (and ``&``
+outside environments) are escaped inside math, since they would comment
+out or break the rest of the line. A candidate formula that spans a blank
+line or has unbalanced braces is treated as ordinary text.
+
+Both functions are memoized: part names, question type names, labels and
+recurring option texts are converted once per process.
+"""
+import re
+from functools import lru_cache
+
+TEX_CACHE_SIZE = 8192
+
+_TEXT_TABLE = str.maketrans({
+    '\\': r'\textbackslash{}', '{': r'\{', '}': r'\}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
+    '_': r'\_', '^': r'\^{}', '~': r'\textasciitilde{}',
+})
+_MATH_TABLE = str.maketrans({'%': r'\%', '#': r'\#', '&': r'\&'})
+_MATH_ENV_TABLE = str.maketrans({'%': r'\%', '#': r'\#'}) # '&' is an alignment tab inside \begin{...}
+
+# Display math first; inline $...$ must hug its content ("$5 and $6" is not a formula) and not precede a digit
+_MATH_RE = re.compile(r'\$\$.+?\$\$|\\\(.+?\\\)|\\\[.+?\\\]|\$(?=[^\s$])[^$\n]*?(?<=[^\s\\])\$(?!\d)', re.S)
+
+
+@lru_cache(maxsize=TEX_CACHE_SIZE)
+def escape_latex_special_chars(text):
+    if not text: return ""
+    return text.translate(_TEXT_TABLE)
+
+
+def _balanced_braces(formula):
+    depth = 0
+    for i, char in enumerate(formula):
+        if char in "{}" and i and formula[i - 1] == '\\': continue
+        if char == '{': depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth < 0: return False
+    return depth == 0
+
+
+def _math_to_tex(formula):
+    if "\n\n" in formula or not _balanced_braces(formula): return None
+    return formula.translate(_MATH_ENV_TABLE if "\\begin{" in formula else _MATH_TABLE)
+
+
+@lru_cache(maxsize=TEX_CACHE_SIZE)
+def text_to_tex(text):
+    """Escapes a content block for TeX body text, keeping its math and turning blank lines into ``\\par``."""
+    if not text: return ""
+    if '$' not in text and '\\' not in text: # No possible math: the common case
+        return text.translate(_TEXT_TABLE).replace('\n\n', '\n\\par\n')
+    pieces = []
+    position = 0
+    for match in _MATH_RE.finditer(text):
+        formula = _math_to_tex(match.group())
+        if formula is None: continue # Left in the text between formulas, so it is escaped there
+        pieces.append(text[position:match.start()].translate(_TEXT_TABLE).replace('\n\n', '\n\\par\n'))
+        pieces.append(formula)
+        position = match.end()
+    pieces.append(text[position:].translate(_TEXT_TABLE).replace('\n\n', '\n\\par\n'))
+    return "".join(pieces)
@@ -0,0 +1,12 @@
+"""
+Default log sink of the package.
+
+Kept in its own dependency-free module so that modules which only need to
+log (batch, pdf_compile, render_pool, ...) do not import ``requests``
+through ``download``; the entry points stay fast to start.
+"""
+
+
+def print_log(message):
+    """Default log sink: messages already carry their trailing newline."""
+    print(message, end="")
@@ -0,0 +1,159 @@
+"""
+Per-exam export manifest for incremental and resumable re-exports.
+
+The manifest lives next to the exported questions
+(``exam_<id>_<title>/export_manifest.json``) and records, per question, a
+hash of its report JSON and the text file written for it, and per image the
+source URL, ETag, Last-Modified, size and output path. A re-run rewrites only
+questions whose JSON changed and downloads only images that are new, changed
+or missing (with an engine set to ``revalidate``, saved images are re-checked
+with conditional requests instead); because the manifest is flushed while the
+export progresses, an interrupted run picks up where it stopped.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from .download import ImageResult, validator_headers
+
+MANIFEST_FILENAME = "export_manifest.json"
+MANIFEST_VERSION = 1
+SAVE_INTERVAL_SECONDS = 1.0
+
+
+def question_content_hash(question):
+    canonical = json.dumps(question, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ExportManifest:
+    def __init__(self, exam_dir):
+        self.exam_dir = exam_dir
+        self.path = os.path.join(exam_dir, MANIFEST_FILENAME)
+        self.questions = {}
+        self.images = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION: return
+        self.questions = data.get("questions", {})
+        self.images = data.get("images", {})
+
+    def _rel(self, path):
+        return os.path.relpath(path, self.exam_dir).replace("\\", "/")
+
+    # --- Questions ---
+    def question_unchanged(self, question_key, content_hash, text_path):
+        """True if ``question_key`` was written from identical JSON and its text file still exists."""
+        entry = self.questions.get(question_key)
+        return bool(entry and entry.get("hash") == content_hash and os.path.isfile(text_path))
+
+    def record_question(self, question_key, content_hash, text_path):
+        with self._lock:
+            self.questions[question_key] = {"hash": content_hash, "text_path": self._rel(text_path)}
+        self.maybe_save()
+
+    # --- Images ---
+    def image_is_current(self, job):
+        """True if ``job.save_path`` already holds the complete image for ``job.url``."""
+        entry = self.images.get(self._rel(job.save_path))
+        if not entry or entry.get("url") != job.url: return False
+        try:
+            return os.path.getsize(job.save_path) == entry.get("size")
+        except OSError:
+            return False
+
+    def revalidation_headers(self, job):
+        """Conditional request headers for the saved image of ``job``, from its recorded validators."""
+        entry = self.images.get(self._rel(job.save_path), {})
+        try: mtime = os.path.getmtime(job.save_path)
+        except OSError: mtime = None
+        return validator_headers(entry.get("etag"), entry.get("last_modified"), mtime)
+
+    def _queue_revalidation(self, engine, job):
+        """True if the current image of ``job`` is to be re-checked by ``engine`` (with validators set on the job)."""
+        if not engine.revalidate: return False
+        job.validators = self.revalidation_headers(job)
+        return job.validators is not None
+
+    def download_missing(self, engine, jobs, on_result=None):
+        """
+        Runs only the jobs whose image is not current through ``engine``,
+        recording each success as it completes. Returns an ``ImageResult``
+        for every job; skipped ones are marked ``reused``. ``on_result``
+        additionally sees every result (skipped ones first), e.g. for
+        progress reporting.
+        """
+        current, pending = [], []
+        for job in jobs:
+            if self.image_is_current(job) and not self._queue_revalidation(engine, job):
+                size = self.images[self._rel(job.save_path)]["size"]
+                current.append(ImageResult(job, True, bytes_written=size, reused=True))
+            else:
+                pending.append(job)
+        if current: engine.log_func(f"{len(current)} images already up to date, skipping.\n")
+        revalidating = sum(1 for job in pending if job.validators)
+        if revalidating: engine.log_func(f"Revalidating {revalidating} saved images with conditional requests.\n")
+        if on_result is not None:
+            for result in current: on_result(result)
+        def record(result):
+            self.record_image(result)
+            if on_result is not None: on_result(result)
+        try:
+            results = engine.download_all(pending, on_result=record)
+        finally:
+            self.save() # Also when cancelled: finished images are kept for the next run
+        return current + results
+
+    def submit_missing(self, engine, jobs):
+        """
+        Streaming counterpart of ``download_missing``: returns one ``Future``
+        per job, already resolved (``reused``) for current images and queued
+        on ``engine`` for the rest.
+        """
+        futures = []
+        for job in jobs:
+            if self.image_is_current(job) and not self._queue_revalidation(engine, job):
+                future = Future()
+                future.set_result(ImageResult(job, True, bytes_written=self.images[self._rel(job.save_path)]["size"], reused=True))
+            else:
+                future = engine.submit(job, on_result=self.record_image)
+            futures.append(future)
+        return futures
+
+    def record_image(self, result):
+        """Records a successful ``ImageResult``; failed jobs stay pending for the next run."""
+        if not result.ok: return
+        key = self._rel(result.job.save_path)
+        with self._lock:
+            previous = self.images.get(key, {})
+            same_url = previous.get("url") == result.job.url
+            etag = result.etag or (previous.get("etag") if same_url else None)
+            last_modified = result.last_modified or (previous.get("last_modified") if same_url else None)
+            try: size = os.path.getsize(result.job.save_path)
+            except OSError: size = result.bytes_written
+            self.images[key] = {"url": result.job.url, "etag": etag, "last_modified": last_modified, "size": size}
+        self.maybe_save()
+
+    # --- Persistence ---
+    def maybe_save(self):
+        """Flushes the manifest at most once per ``SAVE_INTERVAL_SECONDS`` so a crash loses little progress."""
+        if time.monotonic() - self._last_save >= SAVE_INTERVAL_SECONDS: self.save()
+
+    def save(self):
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "questions": dict(self.questions), "images": dict(self.images)}
+            self._last_save = time.monotonic()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,142 @@
+"""
+Structured export instrumentation.
+
+An ``ExportMetrics`` collects, thread-safely, what one export spent its time
+on: wall time per stage (report fetch, parsing, question files, image waits,
+Markdown/TeX writing), a timing row per question, bytes downloaded, HTTP
+request counts with a latency histogram per host, and counters such as the
+number of HTML fragments parsed. ``save`` writes it as
+``export_metrics.json`` next to the export; ``summary_line`` is the short
+version for the log. ``profiled`` wraps a call in cProfile and dumps a
+pstats file when profiling is requested.
+"""
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+METRICS_FILENAME = "export_metrics.json"
+PROFILE_FILENAME = "export_profile.pstats"
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class ExportMetrics:
+    def __init__(self, label=None):
+        self.label = label
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {} # name -> [seconds, count]
+        self._counters = {}
+        self._questions = []
+        self._hosts = {} # host -> {"requests", "failures", "statuses", "histogram", "total_ms", "max_ms"}
+
+    # --- Recording ---
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - started)
+
+    def add_stage_time(self, name, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds; entry[1] += 1
+
+    def count(self, name, amount=1):
+        with self._lock: self._counters[name] = self._counters.get(name, 0) + amount
+
+    def count_images(self, results):
+        """Image counters for a list of ``ImageResult`` objects."""
+        self.count("images", len(results))
+        self.count("images_reused", sum(1 for r in results if r.reused))
+        self.count("images_failed", sum(1 for r in results if not r.ok))
+        self.count("image_bytes_downloaded", sum(r.bytes_written for r in results if r.ok and not r.reused))
+
+    def record_question(self, folder_name, **timings):
+        """One row per question, e.g. ``parse_s``, ``images``, ``image_bytes``, ``wall_s``."""
+        row = {"question": folder_name}
+        row.update({k: round(v, 6) if isinstance(v, float) else v for k, v in timings.items()})
+        with self._lock: self._questions.append(row)
+
+    def record_request(self, url, seconds, status=None, failed=False):
+        """Called by ``HttpClient`` for every attempt; ``status`` is the HTTP status or the exception name."""
+        host = urlparse(url).netloc
+        elapsed_ms = seconds * 1000.0
+        bucket = next((f"<={limit}ms" for limit in LATENCY_BUCKETS_MS if elapsed_ms <= limit), f">{LATENCY_BUCKETS_MS[-1]}ms")
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = self._hosts[host] = {"requests": 0, "failures": 0, "statuses": {}, "histogram": {},
+                                             "total_ms": 0.0, "max_ms": 0.0}
+            entry["requests"] += 1
+            if failed: entry["failures"] += 1
+            key = str(status)
+            entry["statuses"][key] = entry["statuses"].get(key, 0) + 1
+            entry["histogram"][bucket] = entry["histogram"].get(bucket, 0) + 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    # --- Output ---
+    def to_dict(self):
+        with self._lock:
+            hosts = {}
+            for host, entry in self._hosts.items():
+                hosts[host] = dict(entry, total_ms=round(entry["total_ms"], 3), max_ms=round(entry["max_ms"], 3),
+                                   mean_ms=round(entry["total_ms"] / entry["requests"], 3) if entry["requests"] else 0.0,
+                                   histogram={b: entry["histogram"][b] for b in self._bucket_order() if b in entry["histogram"]})
+            return {
+                "label": self.label,
+                "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+                "wall_seconds": round(time.perf_counter() - self._started, 6),
+                "stages": {name: {"seconds": round(seconds, 6), "count": count}
+                           for name, (seconds, count) in self._stages.items()},
+                "counters": dict(self._counters),
+                "http": hosts,
+                "questions": list(self._questions),
+            }
+
+    @staticmethod
+    def _bucket_order():
+        return [f"<={limit}ms" for limit in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+
+    def summary_line(self):
+        data = self.to_dict()
+        stages = ", ".join(f"{name} {entry['seconds']:.2f}s" for name, entry in data["stages"].items())
+        requests_made = sum(entry["requests"] for entry in data["http"].values())
+        downloaded_kb = data["counters"].get("image_bytes_downloaded", 0) / 1024
+        return (f"Timing: total {data['wall_seconds']:.2f}s ({stages}); "
+                f"{requests_made} HTTP requests, {downloaded_kb:.0f} KiB of images downloaded.\n")
+
+    def save(self, output_dir, filename=METRICS_FILENAME):
+        path = os.path.join(output_dir, filename)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        os.replace(path + ".tmp", path)
+        return path
+
+
+def profiled(func, enabled, output_path, log_func=None, top=20):
+    """
+    Runs ``func()`` and returns its result; with ``enabled`` the call runs
+    under cProfile, the stats go to ``output_path`` and the ``top``
+    functions by cumulative time are logged. Only the calling thread is
+    profiled (download workers are not).
+    """
+    if not enabled: return func()
+    import cProfile, pstats # Only loaded when profiling: they are slow to import and rarely needed
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        profiler.dump_stats(output_path)
+        if log_func:
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+            log_func(f"Profile written to {os.path.abspath(output_path)}\n{report.getvalue()}")
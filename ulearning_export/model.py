@@ -0,0 +1,168 @@
+"""
+Normalized exam model.
+
+``normalize_exam`` converts the ``getExamReport`` JSON into ``Exam`` /
+``Part`` / ``Question`` / ``Option`` objects exactly once; every HTML
+fragment is parsed a single time and the writers (question_data.txt,
+Markdown, TeX) and the image download stage all consume the parsed result.
+``stream_exam`` is the single-pass variant used by the streaming pipeline:
+parts and questions are normalized only as the consumer advances, so just
+the questions in flight are held in parsed form. Both take an optional
+``selection.ExportSelection``: unselected parts and questions are dropped
+from the raw JSON and never parsed.
+"""
+import copy
+
+from .htmltext import EMPTY_FRAGMENT, parse_fragment
+
+QUESTION_TYPE_NAMES = {1: "单选题", 2: "多选题", 3: "不定项选择题", 4: "判断题", 5: "填空题/简答题"}
+
+
+def get_question_type_name(type_code):
+    return QUESTION_TYPE_NAMES.get(type_code, f"未知题型 ({type_code})")
+
+
+class Option:
+    """
+    One answer option. ``label`` is the option letter when the first ``<p>``
+    of the option is a single letter (else None), ``image_label`` is the
+    letter or the option's order index, and ``display_text`` is the text
+    with the ``"A. "`` prefix added when the text does not already start
+    with the letter.
+    """
+    __slots__ = ("order_index", "text", "label", "image_label", "display_text", "image_urls")
+
+    def __init__(self, item_obj, item_idx):
+        self.order_index = item_obj.get('orderIndex', item_idx + 1)
+        fragment = parse_fragment(item_obj.get('title', ''))
+        p_text = fragment.first_p_text
+        self.label = p_text if (p_text and len(p_text) == 1 and p_text.isalpha()) else None
+        self.image_label = self.label if self.label else str(self.order_index)
+        self.text = fragment.text
+        if self.label and not self.text.startswith(self.label): self.display_text = f"{self.label}. {self.text}"
+        else: self.display_text = self.text
+        self.image_urls = fragment.image_urls
+
+
+class Question:
+    """
+    One question with its parsed stem (``title``), ``options``,
+    ``correct_answers`` (list of fragments), ``replay`` (fragment or None)
+    and the student's answer. ``source`` keeps the original JSON object.
+    """
+    __slots__ = ("order_index", "question_id", "type_code", "type_name", "folder_name", "title", "options",
+                 "correct_answers", "replay", "student_answer", "student_grade", "has_student_answer", "source")
+
+    def __init__(self, question, q_idx):
+        self.source = question
+        self.order_index = question.get('orderIndex', q_idx + 1)
+        self.question_id = question.get('questionid', f'unknownID_{q_idx+1}')
+        self.type_code = question.get('type')
+        self.type_name = get_question_type_name(self.type_code)
+        self.folder_name = f"question_{self.order_index}_{self.question_id}"
+        self.title = parse_fragment(question.get('title', ''))
+        self.options = [Option(item_obj, item_idx) for item_idx, item_obj in enumerate(question.get('item', []) or [])]
+        correct_info = question.get('correctAnswerAndReplay', {}) or {}
+        self.correct_answers = [parse_fragment(ans) for ans in correct_info.get('correctAnswer', []) or []]
+        replay_html = correct_info.get('correctReplay', '')
+        self.replay = parse_fragment(replay_html) if replay_html else None
+        student_answer_info = question.get('studentAnswer', {})
+        self.has_student_answer = bool(student_answer_info)
+        if self.has_student_answer:
+            self.student_answer = parse_fragment(student_answer_info.get('answer', '')).text
+            self.student_grade = student_answer_info.get('grade')
+        else:
+            self.student_answer = ""; self.student_grade = None
+
+    def render_copy(self):
+        """A copy without ``source``, for rendering in another process."""
+        question = copy.copy(self); question.source = None
+        return question
+
+    def fragment_count(self):
+        """Number of HTML fragments parsed for this question (for instrumentation)."""
+        return (1 + len(self.options) + len(self.correct_answers) + (1 if self.replay else 0)
+                + (1 if self.has_student_answer else 0))
+
+    def image_requests(self):
+        """``(url, filename_prefix)`` pairs for every image of the question, in writer order."""
+        pairs = [(url, f"title_img_{i+1}") for i, url in enumerate(self.title.image_urls)]
+        for option in self.options:
+            pairs.extend((url, f"option_{option.image_label}_img_{i+1}") for i, url in enumerate(option.image_urls))
+        for ans_idx, answer in enumerate(self.correct_answers):
+            pairs.extend((url, f"correct_answer_{ans_idx+1}_img_{i+1}") for i, url in enumerate(answer.image_urls))
+        replay = self.replay or EMPTY_FRAGMENT
+        pairs.extend((url, f"correct_replay_img_{i+1}") for i, url in enumerate(replay.image_urls))
+        return pairs
+
+
+class Part:
+    """
+    A part of the exam; a ``lazy`` part has ``questions`` None and parses them in ``iter_questions``.
+    Only the questions ``selection`` selects are kept (with their original position, which
+    ``Question`` falls back on for a missing orderIndex or ID).
+    """
+    __slots__ = ("index", "name", "questions", "_children")
+
+    def __init__(self, part_data, part_idx, lazy=False, selection=None):
+        self.index = part_idx
+        self.name = part_data.get('partname', f'第 {part_idx + 1} 部分')
+        self._children = [(q_idx, question) for q_idx, question in enumerate(part_data.get('children', []) or [])
+                          if selection is None or selection.selects_question(question, q_idx)]
+        self.questions = None if lazy else [Question(question, q_idx) for q_idx, question in self._children]
+
+    def question_count(self):
+        return len(self.questions) if self.questions is not None else len(self._children)
+
+    def render_copy(self):
+        """A copy holding the parsed questions only, without the part's raw JSON."""
+        part = copy.copy(self)
+        part.questions = [question.render_copy() for question in self.iter_questions()]
+        part._children = []
+        return part
+
+    def iter_questions(self):
+        if self.questions is not None: return iter(self.questions)
+        return (Question(question, q_idx) for q_idx, question in self._children)
+
+
+class Exam:
+    __slots__ = ("title", "parts")
+
+    def __init__(self, title, parts):
+        self.title = title
+        self.parts = parts
+
+    def questions(self):
+        for part in self.parts:
+            yield from part.iter_questions()
+
+    def render_copy(self):
+        """The parsed exam without the report JSON it was normalized from (what the renderers need)."""
+        return Exam(self.title, [part.render_copy() for part in self.parts])
+
+
+def _selected_parts(result, lazy, selection):
+    """Parts in report order; with a question filter, parts left without questions are dropped."""
+    for part_idx, part_data in enumerate(result.get('part', []) or []):
+        if selection is not None and not selection.selects_part(part_idx): continue
+        part = Part(part_data, part_idx, lazy, selection)
+        if selection is not None and selection.filters_questions and not part.question_count(): continue
+        yield part
+
+
+def normalize_exam(exam_json, selection=None):
+    """Returns the ``Exam`` for a ``getExamReport`` response, or None if it has no ``result``."""
+    if not exam_json or 'result' not in exam_json: return None
+    result = exam_json['result'] or {}
+    return Exam(result.get('examTitle'), list(_selected_parts(result, False, selection)))
+
+
+def stream_exam(exam_json, selection=None):
+    """
+    Like ``normalize_exam`` but single-pass: ``parts`` is a generator of lazy
+    parts whose questions are parsed one at a time by ``iter_questions``.
+    """
+    if not exam_json or 'result' not in exam_json: return None
+    result = exam_json['result'] or {}
+    return Exam(result.get('examTitle'), _selected_parts(result, True, selection))
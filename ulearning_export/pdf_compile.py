@@ -0,0 +1,150 @@
+"""
+Optional TeX -> PDF stage.
+
+Compiles the exported ``.tex`` files with a locally installed TeX engine:
+``latexmk -xelatex`` when available (it decides how many runs are needed),
+else plain ``xelatex`` (re-run while the log asks for it). XeLaTeX is
+required by the ``ctex`` preamble the exporter writes. Several files are
+compiled in parallel; each compile is a separate process, so a thread pool
+only waits on them.
+
+Auxiliary files (``.aux``, ``.log``, ``.out``, latexmk's ``.fdb_latexmk``)
+stay in a ``.build`` folder next to the ``.tex`` file, so the exam folder
+only gets the PDF and latexmk's incremental state survives between runs.
+A stamp is kept there too: the SHA-256 of the ``.tex`` together with the
+size and modification time of every ``\includegraphics`` target. A file
+whose stamp is unchanged and whose PDF exists is skipped. The TeX refers to
+images by slot name (``question_x/title_img_1.png``), so a re-downloaded,
+revalidated or post-processed image changes the stamp, not the TeX text.
+
+Without a TeX engine ``compile_tex_files`` logs a hint and returns
+``None``; the export itself is never affected.
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .log import print_log
+
+BUILD_DIR_NAME = ".build"
+DEFAULT_PDF_WORKERS = 2
+COMPILE_TIMEOUT_SECONDS = 600
+MAX_XELATEX_RUNS = 3
+_RERUN_RE = re.compile(r'Rerun to get|Label\(s\) may have changed')
+_INCLUDEGRAPHICS_RE = re.compile(rb'\\includegraphics(?:\[[^\]]*\])?\{([^}]*)\}')
+
+
+class PdfResult:
+    """Outcome for one ``.tex``: ``status`` is "compiled", "unchanged" or "failed"."""
+    __slots__ = ("tex_path", "pdf_path", "status", "seconds", "error")
+
+    def __init__(self, tex_path, pdf_path, status, seconds=0.0, error=None):
+        self.tex_path = tex_path
+        self.pdf_path = pdf_path
+        self.status = status
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status != "failed"
+
+
+def find_tex_engine():
+    """``"latexmk"`` or ``"xelatex"`` if found on PATH (latexmk only together with xelatex), else None."""
+    if not shutil.which("xelatex"): return None
+    return "latexmk" if shutil.which("latexmk") else "xelatex"
+
+
+def find_tex_files(exam_dir):
+    return sorted(os.path.join(exam_dir, name) for name in os.listdir(exam_dir) if name.endswith(".tex"))
+
+
+def _build_stamp(tex_path, engine):
+    """``"<engine> <sha256>"`` over the TeX text and the size and mtime of each image it includes."""
+    exam_dir = os.path.dirname(os.path.abspath(tex_path))
+    with open(tex_path, 'rb') as f: tex = f.read()
+    digest = hashlib.sha256(tex)
+    for match in _INCLUDEGRAPHICS_RE.finditer(tex):
+        image_path = os.path.join(exam_dir, os.fsdecode(match.group(1)))
+        try: stat = os.stat(image_path); state = f"{stat.st_size} {stat.st_mtime_ns}"
+        except OSError: state = "missing"
+        digest.update(b"\0" + match.group(1) + b" " + state.encode())
+    return f"{engine} {digest.hexdigest()}"
+
+
+def _engine_command(engine, tex_name, build_dir):
+    if engine == "latexmk":
+        return ["latexmk", "-xelatex", "-interaction=nonstopmode", "-halt-on-error", f"-outdir={build_dir}", tex_name]
+    return ["xelatex", "-interaction=nonstopmode", "-halt-on-error", f"-output-directory={build_dir}", tex_name]
+
+
+def _log_tail(log_path, lines=15):
+    try:
+        with open(log_path, encoding='utf-8', errors='replace') as f:
+            return "".join(f.readlines()[-lines:])
+    except OSError:
+        return ""
+
+
+def compile_tex(tex_path, engine, force=False, timeout=COMPILE_TIMEOUT_SECONDS):
+    """Compiles one ``.tex`` (run in its own folder so relative image paths resolve); returns a ``PdfResult``."""
+    started = time.perf_counter()
+    exam_dir, tex_name = os.path.split(os.path.abspath(tex_path))
+    stem = os.path.splitext(tex_name)[0]
+    build_dir = os.path.join(exam_dir, BUILD_DIR_NAME)
+    pdf_path = os.path.join(exam_dir, stem + ".pdf")
+    stamp_path = os.path.join(build_dir, stem + ".tex.sha256")
+    os.makedirs(build_dir, exist_ok=True)
+
+    build_stamp = _build_stamp(tex_path, engine)
+    if not force and os.path.exists(pdf_path) and os.path.exists(stamp_path):
+        with open(stamp_path, encoding='utf-8') as f:
+            if f.read().strip() == build_stamp: return PdfResult(tex_path, pdf_path, "unchanged")
+
+    log_path = os.path.join(build_dir, stem + ".log")
+    runs = 1 if engine == "latexmk" else MAX_XELATEX_RUNS
+    try:
+        for _ in range(runs):
+            completed = subprocess.run(_engine_command(engine, tex_name, BUILD_DIR_NAME), cwd=exam_dir,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+                                       timeout=timeout)
+            if completed.returncode != 0:
+                return PdfResult(tex_path, None, "failed", time.perf_counter() - started,
+                                 f"{engine} exited with {completed.returncode}\n{_log_tail(log_path)}")
+            if engine == "latexmk" or not _RERUN_RE.search(_log_tail(log_path, 200)): break
+    except (OSError, subprocess.SubprocessError) as e:
+        return PdfResult(tex_path, None, "failed", time.perf_counter() - started, f"{type(e).__name__}: {e}")
+
+    os.replace(os.path.join(build_dir, stem + ".pdf"), pdf_path)
+    with open(stamp_path, 'w', encoding='utf-8') as f: f.write(build_stamp + "\n")
+    return PdfResult(tex_path, pdf_path, "compiled", time.perf_counter() - started)
+
+
+def compile_tex_files(tex_paths, max_workers=DEFAULT_PDF_WORKERS, force=False, log_func=print_log):
+    """
+    Compiles ``tex_paths`` in parallel; returns the ``PdfResult`` list, or
+    None when no TeX engine is installed.
+    """
+    tex_paths = list(tex_paths)
+    engine = find_tex_engine()
+    if engine is None:
+        log_func("PDF: 未找到 xelatex (可安装 TeX Live / MiKTeX / MacTeX)，跳过 PDF 编译。\n")
+        return None
+    if not tex_paths: return []
+    workers = max(1, min(max_workers, len(tex_paths)))
+    log_func(f"PDF: compiling {len(tex_paths)} TeX file(s) with {engine}, {workers} at a time...\n")
+
+    def run_one(tex_path):
+        result = compile_tex(tex_path, engine, force)
+        if result.status == "compiled": log_func(f"  PDF 已生成: {result.pdf_path} ({result.seconds:.1f}s)\n")
+        elif result.status == "unchanged": log_func(f"  TeX 未变化，保留已有 PDF: {result.pdf_path}\n")
+        else: log_func(f"  PDF 编译失败: {tex_path}\n{result.error}\n")
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_one, tex_paths))
@@ -0,0 +1,120 @@
+"""
+Streaming export pipeline.
+
+Questions flow one at a time from the lazily normalized exam
+(``model.stream_exam``) through the per-question step (folder, text file,
+image jobs queued on the ``DownloadEngine``) into the Markdown/TeX writers.
+A question is handed to the writers, in exam order, as soon as its own
+images have finished, so the first pages are written while later images are
+still downloading. At most ``lookahead`` questions are in flight; parsed
+questions are dropped once written, so memory stays proportional to the
+window rather than to the whole exam.
+"""
+import os
+import time
+from collections import deque
+
+from .download import plan_question_jobs
+from .image_index import ImageIndex
+from .log import print_log
+from .manifest import ExportManifest
+from .metrics import ExportMetrics
+
+DEFAULT_LOOKAHEAD = 16
+
+
+class StreamWriter:
+    """
+    One output of the pipeline: ``write_part(part)`` and
+    ``write_question(question, image_index)`` callbacks; ``name`` labels its
+    timing stage (``write_<name>``).
+    """
+    __slots__ = ("name", "write_part", "write_question")
+
+    def __init__(self, name, write_part, write_question):
+        self.name = name
+        self.write_part = write_part
+        self.write_question = write_question
+
+
+def export_streaming(exam, exam_dir, engine, writers, prepare_question, lookahead=DEFAULT_LOOKAHEAD, log_func=print_log,
+                     metrics=None, postprocessor=None, download_images=True, image_index=None):
+    """
+    Runs the pipeline for ``exam`` into ``exam_dir`` and returns the final
+    ``ImageIndex`` (also saved as image_index.json).
+
+    ``prepare_question(question, question_dir, manifest)`` writes the
+    question's own files before its images are queued; ``writers`` receive
+    every part header and question strictly in exam order. Stage times, one
+    timing row per question and image/parse counters go to ``metrics``.
+    With an ``ImagePostprocessor`` each downloaded image is post-processed
+    on its pool before the question is written.
+
+    New results are added to ``image_index`` (default: a new, empty index).
+    Without ``download_images`` no image is queued and the index is returned
+    as given, without saving it.
+    """
+    metrics = metrics or ExportMetrics()
+    manifest = ExportManifest(exam_dir)
+    if image_index is None: image_index = ImageIndex()
+    all_results = []
+    pending = deque() # (part, None, None) for a part header, (question, futures, timings) for a question
+
+    def write_item(item, futures, timings):
+        if futures is None:
+            for writer in writers:
+                with metrics.stage(f"write_{writer.name}"): writer.write_part(item)
+            return
+        wait_started = time.perf_counter()
+        results = [f.result() for f in futures]
+        waited = time.perf_counter() - wait_started
+        metrics.add_stage_time("wait_images", waited)
+        all_results.extend(results)
+        image_index.add_results(results, exam_dir)
+        write_started = time.perf_counter()
+        for writer in writers:
+            started = time.perf_counter()
+            writer.write_question(item, image_index)
+            metrics.add_stage_time(f"write_{writer.name}", time.perf_counter() - started)
+        downloaded = sum(r.bytes_written for r in results if r.ok and not r.reused)
+        metrics.record_question(item.folder_name, parse_s=timings[1], files_s=timings[2], images=len(results),
+                                images_reused=sum(1 for r in results if r.reused), image_bytes=downloaded,
+                                wait_s=waited, write_s=time.perf_counter() - write_started,
+                                wall_s=time.perf_counter() - timings[0])
+
+    def drain(keep):
+        """Writes finished items from the head of the queue; waits while more than ``keep`` are queued."""
+        while pending and (len(pending) > keep or all(f.done() for f in pending[0][1] or ())):
+            write_item(*pending.popleft())
+
+    for part in exam.parts:
+        log_func(f"\nProcessing Part {part.index + 1} (Name: {part.name})...\n")
+        pending.append((part, None, None))
+        questions = part.iter_questions()
+        while True:
+            parse_started = time.perf_counter() # Lazy parts parse each question inside next()
+            question = next(questions, None)
+            if question is None: break
+            parse_seconds = time.perf_counter() - parse_started
+            metrics.add_stage_time("parse", parse_seconds)
+            metrics.count("questions"); metrics.count("html_fragments_parsed", question.fragment_count())
+            files_started = time.perf_counter()
+            question_dir = os.path.join(exam_dir, question.folder_name)
+            os.makedirs(question_dir, exist_ok=True)
+            prepare_question(question, question_dir, manifest)
+            files_seconds = time.perf_counter() - files_started
+            metrics.add_stage_time("question_files", files_seconds)
+            if download_images:
+                futures = manifest.submit_missing(engine, plan_question_jobs(question.image_requests(), question_dir, log_func))
+                if postprocessor is not None: futures = [postprocessor.chain(f) for f in futures]
+            else:
+                futures = []
+            pending.append((question, futures, (parse_started, parse_seconds, files_seconds)))
+            drain(keep=lookahead)
+    drain(keep=0)
+
+    if download_images: engine.finish(all_results)
+    manifest.save()
+    if download_images: image_index.save(exam_dir)
+    metrics.count_images(all_results)
+    return image_index
@@ -0,0 +1,123 @@
+"""
+Structured export progress and a batched log sink for the GUI.
+
+The export worker reports progress through ``ExportProgress`` (questions
+processed, images finished, bytes downloaded); every change is published
+as an immutable ``ProgressSnapshot`` to a listener. ``LogSink`` collects
+log messages and the latest snapshot from any thread. The GUI drains it
+once per tick, so it inserts all new log text at once and redraws the
+progress bar once, however many lines and events arrived in between.
+Intermediate snapshots are simply overwritten; likewise only the latest
+state of each job posted with ``post_job`` is kept. A burst larger than
+``max_pending`` messages keeps only the newest ones plus a note of how
+many were dropped, so a stalled UI cannot make the buffer grow without
+bound.
+"""
+import threading
+from collections import deque
+
+DEFAULT_MAX_PENDING_MESSAGES = 5000
+
+
+def prefix_lines(message, prefix):
+    """Prefixes every non-blank line of ``message`` (to tell concurrent exports apart in one log)."""
+    return "".join(prefix + line if line.strip() else line for line in message.splitlines(True))
+
+
+class ProgressSnapshot:
+    __slots__ = ("questions_done", "questions_total", "images_done", "images_total", "bytes_downloaded")
+
+    def __init__(self, questions_done=0, questions_total=0, images_done=0, images_total=0, bytes_downloaded=0):
+        self.questions_done = questions_done
+        self.questions_total = questions_total
+        self.images_done = images_done
+        self.images_total = images_total
+        self.bytes_downloaded = bytes_downloaded
+
+    @property
+    def steps_done(self):
+        return self.questions_done + self.images_done
+
+    @property
+    def steps_total(self):
+        return self.questions_total + self.images_total
+
+    def describe(self):
+        return (f"题目 {self.questions_done}/{self.questions_total} · 图片 {self.images_done}/{self.images_total}"
+                f" · 已下载 {self.bytes_downloaded / (1024 * 1024):.1f} MB")
+
+
+class ExportProgress:
+    """
+    Thread-safe progress counters of one export; ``listener(snapshot)`` is
+    called (from the reporting thread) after every change.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._snapshot = ProgressSnapshot()
+
+    def _update(self, questions_done=0, questions_total=0, images_done=0, images_total=0, bytes_downloaded=0):
+        with self._lock:
+            s = self._snapshot
+            s = self._snapshot = ProgressSnapshot(s.questions_done + questions_done, s.questions_total + questions_total,
+                                                  s.images_done + images_done, s.images_total + images_total,
+                                                  s.bytes_downloaded + bytes_downloaded)
+        if self.listener is not None: self.listener(s)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def add_totals(self, questions=0, images=0):
+        self._update(questions_total=questions, images_total=images)
+
+    def question_done(self):
+        self._update(questions_done=1)
+
+    def image_done(self, result):
+        """Counts one finished ``ImageResult``; bytes only for images actually downloaded."""
+        self._update(images_done=1, bytes_downloaded=result.bytes_written if result.ok and not result.reused else 0)
+
+
+class LogSink:
+    """
+    Thread-safe buffer between export threads and the UI thread. Call it
+    (or ``write``) with log messages and ``post_progress`` with snapshots;
+    ``drain()`` returns ``(text, latest snapshot or None)`` and empties it.
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING_MESSAGES):
+        self._lock = threading.Lock()
+        self._messages = deque(maxlen=max_pending)
+        self._dropped = 0
+        self._progress = None
+        self._jobs = {}
+
+    def write(self, message):
+        with self._lock:
+            if len(self._messages) == self._messages.maxlen: self._dropped += 1
+            self._messages.append(message)
+
+    __call__ = write
+
+    def post_progress(self, snapshot):
+        with self._lock: self._progress = snapshot
+
+    def post_job(self, job):
+        """Queues a changed job (anything with a ``job_id``) for the next ``drain_jobs``."""
+        with self._lock: self._jobs[job.job_id] = job
+
+    def drain_jobs(self):
+        with self._lock:
+            jobs, self._jobs = self._jobs, {}
+        return list(jobs.values())
+
+    def drain(self):
+        with self._lock:
+            messages, self._messages = self._messages, deque(maxlen=self._messages.maxlen)
+            dropped, self._dropped = self._dropped, 0
+            progress, self._progress = self._progress, None
+        text = "".join(messages)
+        if dropped: text = f"... ({dropped} 条日志已省略) ...\n" + text
+        return text, progress
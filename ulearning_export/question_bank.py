@@ -0,0 +1,324 @@
+"""
+Local question bank: every exported question in one SQLite database.
+
+Each export upserts its normalized questions (stem, options, answers,
+replay, image paths, exam and part metadata) into
+``ulearning_exports/question_bank.sqlite3``, so questions can be searched
+across all exams without grepping question folders or parsing HTML again.
+An FTS5 index over the texts is kept in sync by triggers; rows whose
+content did not change are left untouched, so re-exports cost one indexed
+lookup per question.
+
+Each question also gets a content fingerprint: its ``questionid`` plus a
+hash of its normalized stem, options and answers. The same question in
+several exams (chapter tests and the midterm share many) has one
+fingerprint, which ``unique_questions`` uses to list every distinct
+question once, with the exams it appears in.
+
+The index uses FTS5's ``trigram`` tokenizer, which matches any substring
+of three or more characters and therefore works for Chinese text without a
+word segmenter. Shorter search terms (two-character Chinese words are
+common) and SQLite builds without ``trigram`` fall back to a ``LIKE`` scan
+of the same columns, which is still fast for a few thousand questions.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+QUESTION_BANK_FILENAME = "question_bank.sqlite3"
+SCHEMA_VERSION = 2
+DEFAULT_SEARCH_LIMIT = 20
+BUSY_TIMEOUT_SECONDS = 30 # Batch exports upsert from several threads
+_TEXT_COLUMNS = ("title", "options", "answers", "replay")
+OPTION_SEPARATOR = "\x1e" # Between options in the ``options`` column (option texts may span lines)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS exams (
+    exam_id TEXT PRIMARY KEY,
+    title TEXT,
+    output_dir TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    exam_id TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    part_index INTEGER,
+    part_name TEXT,
+    order_index INTEGER,
+    type_code INTEGER,
+    type_name TEXT,
+    folder_name TEXT,
+    title TEXT,
+    options TEXT,
+    answers TEXT,
+    replay TEXT,
+    student_answer TEXT,
+    images TEXT,
+    fingerprint TEXT,
+    content_hash TEXT,
+    updated_at REAL,
+    UNIQUE (exam_id, question_id)
+);
+CREATE INDEX IF NOT EXISTS questions_question_id ON questions (question_id);
+CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts (rowid, title, options, answers, replay)
+    VALUES (new.id, new.title, new.options, new.answers, new.replay);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, title, options, answers, replay)
+    VALUES ('delete', old.id, old.title, old.options, old.answers, old.replay);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_au AFTER UPDATE OF title, options, answers, replay ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, title, options, answers, replay)
+    VALUES ('delete', old.id, old.title, old.options, old.answers, old.replay);
+    INSERT INTO questions_fts (rowid, title, options, answers, replay)
+    VALUES (new.id, new.title, new.options, new.answers, new.replay);
+END;
+"""
+_FTS_TABLE = ("CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+              "title, options, answers, replay, content='questions', content_rowid='id'{tokenize})")
+
+_UPSERT = """
+INSERT INTO questions (exam_id, question_id, part_index, part_name, order_index, type_code, type_name, folder_name,
+                       title, options, answers, replay, student_answer, images, fingerprint, content_hash, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (exam_id, question_id) DO UPDATE SET
+    part_index = excluded.part_index, part_name = excluded.part_name, order_index = excluded.order_index,
+    type_code = excluded.type_code, type_name = excluded.type_name, folder_name = excluded.folder_name,
+    title = excluded.title, options = excluded.options, answers = excluded.answers, replay = excluded.replay,
+    student_answer = excluded.student_answer, images = excluded.images, fingerprint = excluded.fingerprint,
+    content_hash = excluded.content_hash,
+    updated_at = excluded.updated_at
+WHERE questions.content_hash IS NOT excluded.content_hash
+"""
+
+
+_UNIQUE_QUESTIONS = """
+WITH ranked AS (
+    SELECT q.*, ROW_NUMBER() OVER (PARTITION BY q.fingerprint ORDER BY q.updated_at DESC, q.id DESC) AS rank,
+           MIN(q.id) OVER (PARTITION BY q.fingerprint) AS first_id
+    FROM questions q
+)
+SELECT r.fingerprint, r.question_id, r.type_code, r.type_name, r.title, r.options, r.answers, r.replay, r.images,
+       e.output_dir,
+       (SELECT json_group_array(DISTINCT coalesce(e2.title, q2.exam_id)) FROM questions q2
+        LEFT JOIN exams e2 ON e2.exam_id = q2.exam_id WHERE q2.fingerprint = r.fingerprint)
+FROM ranked r LEFT JOIN exams e ON e.exam_id = r.exam_id
+WHERE r.rank = 1
+ORDER BY r.type_code, r.first_id
+"""
+
+
+def question_fingerprint(question_id, title, options, answers):
+    """``questionid`` plus a hash of the whitespace- and case-normalized stem, options and answers."""
+    normalized = "\x1f".join(" ".join(text.split()).casefold() for text in (title, options, answers))
+    return hashlib.sha256(f"{question_id}\x1e{normalized}".encode('utf-8')).hexdigest()
+
+
+def question_row(question, part, image_paths=()):
+    """Column values for one normalized ``Question`` (without exam id and timestamp), hash last."""
+    question_id = str(question.question_id)
+    options = OPTION_SEPARATOR.join(option.display_text for option in question.options)
+    answers = "\n".join(answer.text for answer in question.correct_answers)
+    values = [question_id, part.index, part.name, question.order_index, question.type_code, question.type_name,
+              question.folder_name, question.title.text, options, answers,
+              question.replay.text if question.replay else "", question.student_answer,
+              json.dumps(list(image_paths), ensure_ascii=False),
+              question_fingerprint(question_id, question.title.text, options, answers)]
+    canonical = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+    return values + [hashlib.sha256(canonical.encode('utf-8')).hexdigest()]
+
+
+class SearchHit:
+    """One search result; ``snippet`` marks the matches with ``[`` ``]``."""
+    __slots__ = ("exam_id", "exam_title", "question_id", "part_name", "order_index", "type_name", "folder_path",
+                 "snippet")
+
+    def __init__(self, exam_id, exam_title, question_id, part_name, order_index, type_name, folder_path, snippet):
+        self.exam_id = exam_id
+        self.exam_title = exam_title
+        self.question_id = question_id
+        self.part_name = part_name
+        self.order_index = order_index
+        self.type_name = type_name
+        self.folder_path = folder_path
+        self.snippet = snippet
+
+
+class BankEntry:
+    """
+    One distinct question of ``unique_questions``: the texts of its most
+    recent export (``options`` as a list), ``image_paths`` (absolute) and
+    the titles of all ``exams`` it appears in.
+    """
+    __slots__ = ("fingerprint", "question_id", "type_code", "type_name", "title", "options", "answers", "replay",
+                 "image_paths", "exams")
+
+    def __init__(self, fingerprint, question_id, type_code, type_name, title, options, answers, replay, image_paths,
+                 exams):
+        self.fingerprint = fingerprint
+        self.question_id = question_id
+        self.type_code = type_code
+        self.type_name = type_name
+        self.title = title
+        self.options = options
+        self.answers = answers
+        self.replay = replay
+        self.image_paths = image_paths
+        self.exams = exams
+
+
+def _like_snippet(texts, terms, width=40):
+    for text in texts:
+        if not text: continue
+        position = min((text.find(term) for term in terms if term in text), default=-1)
+        if position < 0: continue
+        start = max(0, position - width // 2)
+        excerpt = text[start:start + width]
+        terms_re = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        excerpt = re.sub(terms_re, lambda match: f"[{match.group()}]", excerpt)
+        return ("..." if start else "") + excerpt + ("..." if start + width < len(text) else "")
+    return ""
+
+
+class QuestionBank:
+    """
+    ``upsert_exam`` stores one exam's questions; ``search`` runs a query
+    over all of them. Use as a context manager (one connection per export;
+    SQLite serializes concurrent writers from a batch).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self.trigram = self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def _create_schema(self):
+        """Creates the tables on first use; returns True if the FTS index uses the trigram tokenizer."""
+        with self._conn:
+            row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'questions_fts'").fetchone()
+            if row is None:
+                try:
+                    self._conn.execute(_FTS_TABLE.format(tokenize=", tokenize='trigram'"))
+                except sqlite3.OperationalError: # SQLite < 3.34 has no trigram tokenizer
+                    self._conn.execute(_FTS_TABLE.format(tokenize=""))
+                row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'questions_fts'").fetchone()
+            self._conn.executescript(_SCHEMA)
+            columns = [column[1] for column in self._conn.execute("PRAGMA table_info(questions)")]
+            if "fingerprint" not in columns: self._add_fingerprints()
+            self._conn.execute("CREATE INDEX IF NOT EXISTS questions_fingerprint ON questions (fingerprint)")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return "trigram" in row[0]
+
+    def _add_fingerprints(self):
+        """Schema 1 -> 2: adds and fills the fingerprint column."""
+        self._conn.execute("ALTER TABLE questions ADD COLUMN fingerprint TEXT")
+        rows = self._conn.execute("SELECT id, question_id, title, options, answers FROM questions").fetchall()
+        self._conn.executemany("UPDATE questions SET fingerprint = ? WHERE id = ?",
+                               [(question_fingerprint(*row[1:]), row[0]) for row in rows])
+
+    # --- Writing ---
+    def upsert_exam(self, exam_id, exam_title, output_dir, rows, prune=True):
+        """
+        Stores the ``question_row`` values of one exam in a single
+        transaction and, with ``prune``, removes its questions that are no
+        longer in the report (a selective export passes only some of them).
+        Returns the number of inserted or changed questions.
+        """
+        exam_id = str(exam_id)
+        now = time.time()
+        with self._conn:
+            self._conn.execute("INSERT INTO exams (exam_id, title, output_dir, updated_at) VALUES (?, ?, ?, ?) "
+                               "ON CONFLICT (exam_id) DO UPDATE SET title = excluded.title, "
+                               "output_dir = excluded.output_dir, updated_at = excluded.updated_at",
+                               (exam_id, exam_title, output_dir, now))
+            changed = self._conn.executemany(_UPSERT, [[exam_id] + list(row) + [now] for row in rows]).rowcount
+            if not prune: return changed
+            question_ids = [row[0] for row in rows]
+            self._conn.execute("DELETE FROM questions WHERE exam_id = ? AND question_id NOT IN "
+                               "(SELECT value FROM json_each(?))", (exam_id, json.dumps(question_ids)))
+        return changed
+
+    # --- Reading ---
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+    def count_unique(self):
+        return self._conn.execute("SELECT COUNT(DISTINCT fingerprint) FROM questions").fetchone()[0]
+
+    def count_shared(self, exam_id):
+        """Questions of ``exam_id`` whose fingerprint also occurs in another exported exam."""
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM questions q WHERE q.exam_id = ? AND EXISTS "
+            "(SELECT 1 FROM questions o WHERE o.fingerprint = q.fingerprint AND o.exam_id != q.exam_id)",
+            (str(exam_id),)).fetchone()[0]
+
+    def unique_questions(self):
+        """One ``BankEntry`` per fingerprint, grouped by question type, in the order first exported."""
+        entries = []
+        for row in self._conn.execute(_UNIQUE_QUESTIONS):
+            output_dir = row[9] or ""
+            image_paths = [os.path.join(output_dir, path) for path in json.loads(row[8] or "[]")]
+            options = row[5].split(OPTION_SEPARATOR) if row[5] else []
+            entries.append(BankEntry(*row[:5], options, row[6], row[7], image_paths, json.loads(row[10])))
+        return entries
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, exam_id=None):
+        """
+        Questions containing every whitespace-separated term of ``query``
+        (in stem, options, answers or replay), best matches first.
+        """
+        terms = [term for term in query.split() if term]
+        if not terms: return []
+        exam_filter = " AND q.exam_id = ?" if exam_id is not None else ""
+        exam_args = [str(exam_id)] if exam_id is not None else []
+        columns = ("q.exam_id, e.title, q.question_id, q.part_name, q.order_index, q.type_name, "
+                   "e.output_dir, q.folder_name")
+        if self.trigram and all(len(term) >= 3 for term in terms):
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            rows = self._conn.execute(
+                f"SELECT {columns}, snippet(questions_fts, -1, '[', ']', '...', 16) FROM questions_fts "
+                f"JOIN questions q ON q.id = questions_fts.rowid LEFT JOIN exams e ON e.exam_id = q.exam_id "
+                f"WHERE questions_fts MATCH ?{exam_filter} ORDER BY bm25(questions_fts) LIMIT ?",
+                [match] + exam_args + [limit]).fetchall()
+        else:
+            text = " || char(10) || ".join(f"coalesce(q.{column}, '')" for column in _TEXT_COLUMNS)
+            conditions = " AND ".join(f"instr({text}, ?) > 0" for _ in terms)
+            rows = self._conn.execute(
+                f"SELECT {columns}, q.title, q.options, q.answers, q.replay FROM questions q "
+                f"LEFT JOIN exams e ON e.exam_id = q.exam_id WHERE {conditions}{exam_filter} "
+                f"ORDER BY q.exam_id, q.part_index, q.order_index LIMIT ?", terms + exam_args + [limit]).fetchall()
+            rows = [row[:8] + (_like_snippet(row[8:], terms),) for row in rows]
+        return [SearchHit(exam_id, exam_title, question_id, part_name, order_index, type_name,
+                          os.path.join(output_dir, folder_name) if output_dir else folder_name, snippet)
+                for exam_id, exam_title, question_id, part_name, order_index, type_name, output_dir, folder_name,
+                snippet in rows]
+
+
+def format_hits(hits):
+    """Human-readable search results, one block per question."""
+    if not hits: return "没有找到匹配的题目。\n"
+    lines = []
+    for hit in hits:
+        lines.append(f"[{hit.exam_title or hit.exam_id}] {hit.part_name} {hit.order_index}. ({hit.type_name}) "
+                     f"ID: {hit.question_id}")
+        lines.append("    " + " ".join(hit.snippet.split()))
+        lines.append(f"    {hit.folder_path}")
+    return "\n".join(lines) + "\n"
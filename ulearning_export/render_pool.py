@@ -0,0 +1,114 @@
+"""
+Process pool for rendering exports.
+
+Markdown and TeX rendering is CPU-bound string building; in a batch export
+the exams' rendering would serialize behind the GIL in the exporting
+threads. ``RenderPool`` runs one task per (exam, format) in worker
+processes instead. The parent pickles the exam's ``render_copy`` (the
+parsed questions without the report JSON) once into a file in the pool's
+temp directory; the tasks only carry its path, and every worker reads and
+unpickles it at most once (a small per-process cache), whichever of the
+exam's formats it is given. The file is removed when the exam's last task
+is done.
+
+Render functions must be module-level functions (so they can be pickled by
+reference) taking ``(exam, exam_dir, file_name)``; images are looked up
+from the image_index.json the download stage saved in ``exam_dir``. What a
+render function prints is captured in the worker and logged by the parent,
+so output of concurrent workers does not interleave.
+"""
+import contextlib
+import io
+import itertools
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .log import print_log
+
+DEFAULT_RENDER_PROCESSES = min(4, os.cpu_count() or 1)
+_WORKER_CACHE_SIZE = 4
+
+_worker_exams = {} # Per worker process: payload path -> Exam
+
+
+class RenderTask:
+    """One output format: ``render_func(exam, exam_dir, file_name)``; ``name`` labels its timing stage."""
+    __slots__ = ("name", "render_func", "file_name")
+
+    def __init__(self, name, render_func, file_name):
+        self.name = name
+        self.render_func = render_func
+        self.file_name = file_name
+
+
+def _render_in_worker(payload_path, exam_dir, render_func, file_name):
+    exam = _worker_exams.get(payload_path)
+    if exam is None:
+        with open(payload_path, 'rb') as f: exam = pickle.load(f)
+        if len(_worker_exams) >= _WORKER_CACHE_SIZE: _worker_exams.pop(next(iter(_worker_exams)))
+        _worker_exams[payload_path] = exam
+    output = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output): render_func(exam, exam_dir, file_name)
+    return time.perf_counter() - started, output.getvalue()
+
+
+class RenderPool:
+    """
+    ``render(exam, exam_dir, tasks)`` renders all formats of one exam in
+    the worker processes and returns when they are written; it is called
+    concurrently from the batch's exporting threads. Worker exceptions are
+    re-raised in the caller.
+    """
+
+    def __init__(self, max_workers=DEFAULT_RENDER_PROCESSES):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._keys = itertools.count()
+        self._payload_dir = tempfile.mkdtemp(prefix="render_pool_")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self._payload_dir, ignore_errors=True)
+
+    def _write_payload(self, exam):
+        payload_path = os.path.join(self._payload_dir, f"exam_{next(self._keys)}.pickle")
+        with open(payload_path, 'wb') as f: pickle.dump(exam.render_copy(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return payload_path
+
+    def submit(self, exam, exam_dir, tasks):
+        """Queues every task for ``exam``; returns ``(task, future)`` pairs, futures resolving to (seconds, output)."""
+        tasks = list(tasks)
+        if not tasks: return []
+        payload_path = self._write_payload(exam)
+        pending = [len(tasks)]; pending_lock = threading.Lock()
+        def task_done(_):
+            with pending_lock:
+                pending[0] -= 1
+                if pending[0]: return
+            with contextlib.suppress(OSError): os.remove(payload_path)
+        submitted = [(task, self._executor.submit(_render_in_worker, payload_path, exam_dir, task.render_func,
+                                                  task.file_name)) for task in tasks]
+        for _, future in submitted: future.add_done_callback(task_done)
+        return submitted
+
+    def render(self, exam, exam_dir, tasks, metrics=None, log_func=print_log):
+        """Renders and waits; worker time goes to ``metrics`` as ``render_<name>``, the wait as ``wait_render``."""
+        started = time.perf_counter()
+        submitted = self.submit(exam, exam_dir, tasks)
+        for task, future in submitted:
+            seconds, output = future.result()
+            if output: log_func(output)
+            if metrics: metrics.add_stage_time(f"render_{task.name}", seconds)
+        if metrics: metrics.add_stage_time("wait_render", time.perf_counter() - started)
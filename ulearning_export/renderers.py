@@ -0,0 +1,259 @@
+"""
+Output renderers and their registry.
+
+Every output format is a ``Renderer`` registered under a name: ``txt``
+(question_data.txt in every question folder), ``markdown`` and ``tex`` (one
+file for the whole exam). The export core (``exporter``) and the entry
+points only look renderers up in ``RENDERERS``, so which formats a run
+writes is a per-run selection (``resolve_renderers``) and a new format is a
+``register_renderer`` call, not another copy of the export loop.
+
+An exam renderer receives ``begin(f, exam_title)``, then
+``write_part(f, part)`` and ``write_question(f, question, image_index)`` in
+exam order, then ``end(f)``; the same callbacks serve the streaming
+pipeline, the render pool and full re-renders. A question renderer only
+has ``write_question``, called with ``image_index`` None before the
+question's images are downloaded.
+
+Formats are selected by name; ``images`` is the one format that is not a
+renderer (the image downloads, see ``selection.ExportSelection.images``).
+This module only needs the light text helpers, so the entry points can
+import it at startup to list the available formats.
+"""
+import datetime
+import os
+
+from .image_index import ImageIndex
+from .latex import escape_latex_special_chars, text_to_tex
+from .log import print_log
+
+EXAM_SCOPE = "exam"
+QUESTION_SCOPE = "question"
+
+RENDERERS = {}
+RENDERER_ALIASES = {"md": "markdown", "text": "txt", "latex": "tex", "image": "images", "img": "images"}
+IMAGES_FORMAT = "images"
+DEFAULT_FORMATS = ("txt", "markdown", "tex", IMAGES_FORMAT)
+
+
+class Renderer:
+    """
+    One output format. ``file_name`` is formatted with ``stem`` (the
+    sanitized exam title) for exam renderers; ``label`` names the format in
+    log messages. ``begin``, ``write_part`` and ``end`` may be None.
+    """
+    __slots__ = ("name", "label", "scope", "file_name", "write_question", "begin", "write_part", "end")
+
+    def __init__(self, name, label, file_name, write_question, begin=None, write_part=None, end=None, scope=EXAM_SCOPE):
+        self.name = name
+        self.label = label
+        self.scope = scope
+        self.file_name = file_name
+        self.write_question = write_question
+        self.begin = begin
+        self.write_part = write_part
+        self.end = end
+
+    def output_name(self, stem=""):
+        return self.file_name.format(stem=stem)
+
+
+def register_renderer(renderer):
+    """Adds (or replaces) ``renderer`` under its name; returns it."""
+    RENDERERS[renderer.name] = renderer
+    return renderer
+
+
+def format_names():
+    """Every selectable format: the registered renderers, then ``images``."""
+    return list(RENDERERS) + [IMAGES_FORMAT]
+
+
+def normalize_formats(names=None):
+    """
+    Format names or aliases (any order, duplicates ignored) -> canonical
+    names in ``format_names`` order; None selects ``DEFAULT_FORMATS``.
+    Unknown names raise ValueError.
+    """
+    if names is None: names = DEFAULT_FORMATS
+    available = format_names()
+    wanted = set()
+    for name in names:
+        name = RENDERER_ALIASES.get(name.strip().lower(), name.strip().lower())
+        if name not in available: raise ValueError(f"Unknown output format: {name} (available: {', '.join(available)})")
+        wanted.add(name)
+    return tuple(name for name in available if name in wanted)
+
+
+def resolve_renderers(names=None):
+    """The renderers among the formats ``names`` (see ``normalize_formats``), in registry order."""
+    return [RENDERERS[name] for name in normalize_formats(names) if name != IMAGES_FORMAT]
+
+
+def split_renderers(renderers):
+    """``(question renderers, exam renderers)``."""
+    return ([r for r in renderers if r.scope == QUESTION_SCOPE], [r for r in renderers if r.scope == EXAM_SCOPE])
+
+
+# --- Output files (folder or ExamArchive) ---
+def open_output_text(path, archive=None):
+    """Opens an output text file for writing; in archive mode, the archive entry for ``path`` instead."""
+    if archive is not None: return archive.open_text(archive.entry_name(path))
+    return open(path, 'w', encoding='utf-8')
+
+
+def output_location(path, archive=None):
+    if archive is not None: return f"{os.path.abspath(archive.path)}:{archive.entry_name(path)}"
+    return os.path.abspath(path)
+
+
+def render_exam(name, exam, exam_dir, file_name, image_index=None, archive=None, log_func=print_log):
+    """
+    Writes the whole exam with the exam renderer ``name`` to ``exam_dir/file_name`` (or its archive entry);
+    images are looked up in ``image_index``, by default the image_index.json saved in ``exam_dir``. Takes
+    the renderer by name so that ``functools.partial(render_exam, name)`` can be sent to a render pool.
+    """
+    renderer = RENDERERS[name]
+    if image_index is None: image_index = ImageIndex.load(exam_dir)
+    output_path = os.path.join(exam_dir, file_name)
+    with open_output_text(output_path, archive) as f:
+        if renderer.begin: renderer.begin(f, exam.title)
+        for part in exam.parts:
+            if renderer.write_part: renderer.write_part(f, part)
+            for question in part.iter_questions(): renderer.write_question(f, question, image_index)
+        if renderer.end: renderer.end(f)
+    log_func(f"{renderer.label} 试卷已生成: {output_location(output_path, archive)}\n")
+    return output_path
+
+
+# --- txt ---
+def write_question_text(f_text, question, image_index=None):
+    f_text.write(f"题目ID: {question.question_id}\n题目顺序号: {question.order_index}\n")
+    f_text.write(f"题目类型: {question.type_name}\n\n【题干】:\n")
+    f_text.write(question.title.text + "\n\n")
+    if question.options:
+        f_text.write("【选项】:\n")
+        for option in question.options: f_text.write(f"{option.display_text}\n")
+        f_text.write("\n")
+    f_text.write("【正确答案】:\n")
+    if not question.correct_answers: f_text.write("未提供\n")
+    else:
+        for answer in question.correct_answers: f_text.write(f"{answer.text}\n")
+    f_text.write("\n")
+    if question.replay: f_text.write(f"【答案解析】:\n{question.replay.text}\n\n")
+    if question.has_student_answer:
+        f_text.write(f"【学生答案】:\n{question.student_answer}\n")
+        if question.student_grade is not None: f_text.write(f"得分: {question.student_grade}\n")
+    f_text.write("\n------------------------------------\n")
+
+
+# --- Markdown ---
+def write_markdown_title(md_file, exam_title):
+    md_file.write(f"# {exam_title or '考试试卷'}\n\n")
+
+
+def write_markdown_part(md_file, part):
+    md_file.write(f"## {part.name}\n\n")
+
+
+def write_markdown_images(md_file, image_index, folder_name, slot, alt_text, indent=""):
+    """One image per line; images with a thumbnail show it, linked to the full image."""
+    for img_path_md in image_index.get(folder_name, slot):
+        thumb_path = image_index.variant(img_path_md, "thumb")
+        if thumb_path: md_file.write(f"{indent}[![{alt_text}]({thumb_path})]({img_path_md})\n")
+        else: md_file.write(f"{indent}![{alt_text}]({img_path_md})\n")
+
+
+def write_markdown_question(md_file, question, image_index):
+    folder_name = question.folder_name
+    md_file.write(f"### {question.order_index}. ({question.type_name}) (ID: {question.question_id})\n\n")
+    md_file.write(f"**题干:**\n{question.title.text}\n")
+    write_markdown_images(md_file, image_index, folder_name, "title", "题干图片")
+    md_file.write("\n")
+    if question.options:
+        md_file.write("**选项:**\n")
+        for option in question.options:
+            md_file.write(f"- {option.display_text}\n")
+            write_markdown_images(md_file, image_index, folder_name, f"option_{option.image_label}", "选项图片", "  ")
+        md_file.write("\n")
+    md_file.write("**正确答案:**\n")
+    if not question.correct_answers: md_file.write("未提供\n")
+    else:
+        for ans_idx, answer in enumerate(question.correct_answers):
+            md_file.write(f"{answer.text}\n")
+            write_markdown_images(md_file, image_index, folder_name, f"correct_answer_{ans_idx+1}", "答案图片")
+    md_file.write("\n")
+    if question.replay:
+        md_file.write("**答案解析:**\n")
+        md_file.write(f"{question.replay.text}\n")
+        write_markdown_images(md_file, image_index, folder_name, "correct_replay", "解析图片")
+        md_file.write("\n")
+    md_file.write("---\n\n")
+
+
+# --- TeX ---
+def write_tex_preamble(tex_file, exam_title):
+    tex_file.write(r"\documentclass[12pt]{article}" + "\n")
+    tex_file.write(r"\usepackage[UTF8]{ctex}" + "\n")
+    tex_file.write(r"\usepackage{graphicx}" + "\n")
+    tex_file.write(r"\usepackage{amsmath, amsfonts, amssymb}" + "\n")
+    tex_file.write(r"\usepackage[a4paper, margin=1in]{geometry}" + "\n")
+    tex_file.write(r"\usepackage{enumitem}" + "\n")
+    tex_file.write(r"\usepackage{hyperref}" + "\n")
+    tex_file.write(r"\hypersetup{colorlinks=true, linkcolor=blue, urlcolor=blue, citecolor=green}" + "\n")
+    tex_file.write(r"\usepackage{array}\usepackage{longtable}" + "\n")
+    exam_title_tex = escape_latex_special_chars(exam_title or "考试试卷")
+    tex_file.write(f"\\title{{{exam_title_tex}}}\n")
+    tex_file.write(f"\\author{{优学院导出}}\n")
+    tex_file.write(f"\\date{{{datetime.date.today().strftime('%Y-%m-%d')}}}\n")
+    tex_file.write(r"\begin{document}" + "\n")
+    tex_file.write(r"\maketitle" + "\n\n")
+
+
+def write_tex_part(tex_file, part):
+    part_name_tex = escape_latex_special_chars(part.name)
+    tex_file.write(f"\\section*{{{part_name_tex}}}\n\\hrulefill\n\n")
+
+
+def write_tex_question(tex_file, question, image_index):
+    q_type_name_tex = escape_latex_special_chars(question.type_name)
+    folder_name = question.folder_name
+    tex_file.write(f"\\subsection*{{{question.order_index}. ({q_type_name_tex}) \\small ID: {question.question_id}}}\n\n")
+    def write_tex_content_with_images(label_raw, content_text_raw, image_slot, img_alt_text):
+        content_text_tex = text_to_tex(content_text_raw)
+        if label_raw: tex_file.write(f"\\textbf{{{escape_latex_special_chars(label_raw)}:}}\n\n{content_text_tex}\n")
+        else: tex_file.write(f"{content_text_tex}\n")
+        for img_path_tex in image_index.get(folder_name, image_slot, "print"):
+            tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.8\\textwidth, height=0.25\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
+        tex_file.write("\n")
+    write_tex_content_with_images("题干", question.title.text, "title", "题干图片")
+    if question.options:
+        tex_file.write(f"\\textbf{{{escape_latex_special_chars('选项')}:}}\n")
+        tex_file.write("\\begin{itemize}[leftmargin=*]\n")
+        for option in question.options:
+            tex_file.write(f"  \\item ")
+            write_tex_content_with_images(None, option.display_text, f"option_{option.image_label}", "选项图片")
+        tex_file.write("\\end{itemize}\n\n")
+    tex_file.write(f"\\textbf{{{escape_latex_special_chars('正确答案')}:}}\n")
+    if not question.correct_answers: tex_file.write(escape_latex_special_chars("未提供") + "\n")
+    else:
+        for ans_idx, answer in enumerate(question.correct_answers):
+            ans_text_tex = text_to_tex(answer.text)
+            tex_file.write(f"{ans_text_tex}\n")
+            for img_path_tex in image_index.get(folder_name, f"correct_answer_{ans_idx+1}", "print"):
+                tex_file.write(f"\\begin{{center}}\\includegraphics[width=0.7\\textwidth, height=0.2\\textheight, keepaspectratio]{{{img_path_tex}}}\\end{{center}}\n")
+    tex_file.write("\n")
+    if question.replay:
+        write_tex_content_with_images("答案解析", question.replay.text, "correct_replay", "解析图片")
+    tex_file.write("\\vspace{0.5em}\\hrulefill\\vspace{1em}\n\n")
+
+
+def write_tex_end(tex_file):
+    tex_file.write(r"\end{document}" + "\n")
+
+
+register_renderer(Renderer("txt", "题目文本", "question_data.txt", write_question_text, scope=QUESTION_SCOPE))
+register_renderer(Renderer("markdown", "Markdown", "{stem}_完整试卷.md", write_markdown_question,
+                           begin=write_markdown_title, write_part=write_markdown_part))
+register_renderer(Renderer("tex", "TeX", "{stem}_完整试卷.tex", write_tex_question,
+                           begin=write_tex_preamble, write_part=write_tex_part, end=write_tex_end))
@@ -0,0 +1,70 @@
+"""
+On-disk cache of ``getExamReport`` responses.
+
+Each report is stored gzip-compressed as
+``<cache_dir>/<examId>_<traceId>.json.gz`` together with the time it was
+fetched. Exports reuse a report younger than the TTL instead of calling the
+API again, and the offline re-render mode reads it regardless of age, so the
+Markdown/TeX output can be regenerated without network access or a valid
+token.
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+
+DEFAULT_TTL_SECONDS = 3600
+_UNSAFE_KEY_CHARS_RE = re.compile(r'[^0-9A-Za-z_-]')
+
+
+class CachedReport:
+    __slots__ = ("report", "fetched_at")
+
+    def __init__(self, report, fetched_at):
+        self.report = report
+        self.fetched_at = fetched_at
+
+    @property
+    def age_seconds(self):
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class ReportCache:
+    def __init__(self, cache_dir, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+
+    def path_for(self, exam_id, trace_id):
+        key = f"{_UNSAFE_KEY_CHARS_RE.sub('_', str(exam_id))}_{_UNSAFE_KEY_CHARS_RE.sub('_', str(trace_id))}"
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def load(self, exam_id, trace_id, max_age=None):
+        """
+        Returns the ``CachedReport`` for the pair, or None if there is none,
+        it is unreadable, or it is older than ``max_age`` seconds (defaults to
+        the TTL; pass ``float('inf')`` to accept any age).
+        """
+        if max_age is None: max_age = self.ttl_seconds
+        try:
+            with gzip.open(self.path_for(exam_id, trace_id), 'rt', encoding='utf-8') as f: entry = json.load(f)
+        except (OSError, EOFError, ValueError):
+            return None
+        if not isinstance(entry, dict) or "report" not in entry: return None
+        cached = CachedReport(entry["report"], entry.get("fetched_at", 0))
+        return cached if cached.age_seconds <= max_age else None
+
+    def store(self, exam_id, trace_id, report):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(exam_id, trace_id)
+        entry = {"examId": str(exam_id), "traceId": str(trace_id), "fetched_at": time.time(), "report": report}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        return path
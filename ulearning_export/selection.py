@@ -0,0 +1,105 @@
+"""
+Selective export: which parts and questions of an exam are exported.
+
+An ``ExportSelection`` is applied where the report JSON is turned into the
+question model (``model.normalize_exam`` / ``model.stream_exam``): parts
+and questions it does not select are skipped on the raw JSON, so they are
+never parsed, have no images queued and are written by no renderer.
+Questions are matched on the report's own fields (``orderIndex`` and the
+``type`` code of ``model.get_question_type_name``), without parsing any
+HTML. ``images`` False additionally skips the image downloads; the
+renderers then link the images a previous export left in the folder.
+
+A selection that leaves questions out is *partial*: its exam files get
+the selection tag in their name so they do not replace the full paper, and
+the image index and question bank are merged instead of replaced.
+"""
+import re
+
+_RANGE_RE = re.compile(r'^(\d+)\s*(?:-\s*(\d+))?$')
+
+
+def parse_number_list(value):
+    """``"1,3"`` -> ``frozenset({1, 3})``; raises ValueError for anything but comma-separated positive integers."""
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    if not fields or not all(field.isdecimal() and int(field) > 0 for field in fields):
+        raise ValueError(f"Expected comma-separated positive numbers, got {value!r}")
+    return frozenset(int(field) for field in fields)
+
+
+def parse_ranges(value):
+    """``"1-5,8"`` -> ``((1, 5), (8, 8))`` (inclusive); raises ValueError for malformed or reversed ranges."""
+    ranges = []
+    for field in value.split(","):
+        if not field.strip(): continue
+        match = _RANGE_RE.match(field.strip())
+        if not match: raise ValueError(f"Expected ranges like '1-5,8', got {field.strip()!r}")
+        first = int(match.group(1)); last = int(match.group(2) or first)
+        if last < first: raise ValueError(f"Empty range: {field.strip()!r}")
+        ranges.append((first, last))
+    if not ranges: raise ValueError(f"Expected ranges like '1-5,8', got {value!r}")
+    return tuple(ranges)
+
+
+def _as_int(value):
+    try: return int(value)
+    except (TypeError, ValueError): return None
+
+
+def _join(numbers):
+    return "+".join(str(number) for number in sorted(numbers))
+
+
+class ExportSelection:
+    """
+    ``parts`` (1-based part numbers, as in the log), ``question_ranges``
+    (inclusive ``(first, last)`` orderIndex ranges) and ``types`` (question
+    type codes) are None to select everything; ``images`` False skips the
+    image downloads.
+    """
+    __slots__ = ("parts", "question_ranges", "types", "images")
+
+    def __init__(self, parts=None, question_ranges=None, types=None, images=True):
+        self.parts = frozenset(parts) if parts is not None else None
+        self.question_ranges = tuple(question_ranges) if question_ranges is not None else None
+        self.types = frozenset(types) if types is not None else None
+        self.images = images
+
+    @property
+    def filters_questions(self):
+        return self.question_ranges is not None or self.types is not None
+
+    @property
+    def partial(self):
+        return self.parts is not None or self.filters_questions
+
+    def selects_part(self, part_idx):
+        return self.parts is None or part_idx + 1 in self.parts
+
+    def selects_question(self, question, q_idx):
+        """Decides on the raw report JSON of a question (``q_idx`` is its position in the part)."""
+        if self.types is not None and _as_int(question.get('type')) not in self.types: return False
+        if self.question_ranges is not None:
+            order_index = _as_int(question.get('orderIndex', q_idx + 1))
+            return order_index is not None and any(first <= order_index <= last for first, last in self.question_ranges)
+        return True
+
+    def tag(self):
+        """File name suffix of a partial selection (``P1+3_Q1-5+8_T1+2``); empty for a full one."""
+        fields = []
+        if self.parts is not None: fields.append("P" + _join(self.parts))
+        if self.question_ranges is not None:
+            fields.append("Q" + "+".join(f"{first}-{last}" if last != first else str(first)
+                                         for first, last in self.question_ranges))
+        if self.types is not None: fields.append("T" + _join(self.types))
+        return "_".join(fields)
+
+    def describe(self):
+        fields = []
+        if self.parts is not None: fields.append(f"parts {', '.join(map(str, sorted(self.parts)))}")
+        if self.question_ranges is not None:
+            fields.append("questions " + ", ".join(f"{first}-{last}" if last != first else str(first)
+                                                   for first, last in self.question_ranges))
+        if self.types is not None: fields.append(f"types {', '.join(map(str, sorted(self.types)))}")
+        if not self.images: fields.append("no image downloads")
+        return "; ".join(fields) or "everything"